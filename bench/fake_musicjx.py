@@ -0,0 +1,247 @@
+"""本地替身服务：模拟 musicjx.com 的搜索接口 (POST /) 和音频 CDN (/audio/...)
+
+单独运行：
+    python bench/fake_musicjx.py --port 8765 --file-size 4MB --latency 20
+
+启动后在标准输出打印一行 JSON {"port": ...}；GET /_stats 返回请求与连接计数，POST /_stats/reset 清零。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+
+from aiohttp import web
+
+BLOCK = bytes(range(256)) * 256  # 64KB 的重复数据块，按需拼出任意大小的"音频"
+# 伪造的 MP3 文件头 (空的 ID3 标签 + 一个 MPEG 帧头)，让按内容嗅探格式和下载后的完整性校验也能通过
+AUDIO_HEADER = b"ID3\x04\x00\x00\x00\x00\x00\x00" + b"\xff\xfb\x90\x00"
+HTML_PAGE = b"<!DOCTYPE html><html><body><h1>404 Not Found</h1></body></html>"
+# 从 0 开始、不超过这么多字节的 Range GET 当作校验请求 (只读开头嗅探格式)，和 HEAD 一样受 head_fail_ratio 影响
+PROBE_RANGE_MAX = 64 * 1024
+
+
+def parse_size(text):
+    units = {"kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3, "b": 1}
+    text = str(text).strip().lower()
+    for unit, factor in units.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+class FakeMusicServer:
+    def __init__(self, results=20, file_sizes=(4 * 1024 ** 2,), search_latency=0.05, cdn_latency=0.02,
+                 head_fail_ratio=0.0, html_ratio=0.0, range_support=True, chunk_delay=0.0, max_inflight=0,
+                 error_rate=0.0, disguised_ratio=0.0, provider_latency=None, seed=0):
+        self.results = results
+        self.file_sizes = list(file_sizes)
+        self.search_latency = search_latency
+        self.cdn_latency = cdn_latency
+        self.head_fail_ratio = head_fail_ratio
+        self.html_ratio = html_ratio
+        self.range_support = range_support
+        self.chunk_delay = chunk_delay
+        self.max_inflight = max_inflight
+        self.error_rate = error_rate
+        self.disguised_ratio = disguised_ratio
+        # 接口 type -> 搜索延迟 (秒)，覆盖 search_latency，用来模拟某个来源很慢
+        self.provider_latency = dict(provider_latency or {})
+        self.random = random.Random(seed)
+        self.inflight = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"search": 0, "head": 0, "get": 0, "range_get": 0, "bytes_sent": 0, "throttled": 0,
+                      "errors": 0, "peak_inflight": 0}
+        self._connections = set()
+
+    def _track(self, request):
+        # 同一条 TCP 连接的 transport 对象不变，用来统计新建了多少连接
+        self._connections.add(id(request.transport))
+
+    def _fraction(self, name, salt):
+        # 按文件名确定性地决定"这个文件是否异常"，多次运行结果一致
+        digest = hashlib.md5(f"{salt}:{name}".encode()).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32
+
+    def _size_of(self, name):
+        return self.file_sizes[int(self._fraction(name, "size") * len(self.file_sizes))]
+
+    async def search(self, request):
+        self._track(request)
+        self.stats["search"] += 1
+        form = await request.post()
+        kw, page = form.get("input", ""), form.get("page", "1")
+        await asyncio.sleep(self.provider_latency.get(form.get("type", ""), self.search_latency))
+        base = f"{request.scheme}://{request.host}/audio"
+        tag = hashlib.md5(f"{kw}:{form.get('type', '')}".encode()).hexdigest()[:8]
+        # 和真实接口一样，data 的第一项不是歌曲
+        data = [{"title": "header"}] + [
+            {"title": f"{kw} #{page}-{i}", "author": "bench", "url": f"{base}/{tag}-{page}-{i}.mp3"}
+            for i in range(self.results)]
+        return web.json_response({"data": data})
+
+    async def audio(self, request):
+        self._track(request)
+        name = request.match_info["name"]
+        await asyncio.sleep(self.cdn_latency)
+        if self._fraction(name, "html") < self.html_ratio:
+            return web.Response(body=HTML_PAGE, content_type="text/html")
+        if self._fraction(name, "disguised") < self.disguised_ratio:
+            # 声称是音频，内容却是错误页 (只看响应头发现不了)
+            return web.Response(body=HTML_PAGE, headers={"Content-Type": "audio/mpeg"})
+
+        size = self._size_of(name)
+        if request.method == "HEAD":
+            self.stats["head"] += 1
+            if self._fraction(name, "head") < self.head_fail_ratio:
+                return web.Response(status=503)
+            headers = {"Content-Type": "audio/mpeg", "Content-Length": str(size)}
+            if self.range_support: headers["Accept-Ranges"] = "bytes"
+            return web.Response(headers=headers)
+
+        self.stats["get"] += 1
+        if self._is_probe(request) and self._fraction(name, "head") < self.head_fail_ratio:
+            return web.Response(status=503)
+        # 模拟限流和偶发故障：同时进行的传输超过上限回 429，另按比例随机回 503
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        if self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=503)
+        self.inflight += 1
+        self.stats["peak_inflight"] = max(self.stats["peak_inflight"], self.inflight)
+        try:
+            return await self._send_audio(request, size)
+        finally:
+            self.inflight -= 1
+
+    @staticmethod
+    def _is_probe(request):
+        rng = request.headers.get("Range", "")
+        if not rng.startswith("bytes="): return False
+        first, _, last = rng[6:].partition("-")
+        return first == "0" and last.isdigit() and int(last) < PROBE_RANGE_MAX
+
+    async def _send_audio(self, request, size):
+        start, end, status = 0, size - 1, 200
+        headers = {"Content-Type": "audio/mpeg"}
+        if self.range_support:
+            headers["Accept-Ranges"] = "bytes"
+            rng = request.headers.get("Range", "")
+            if rng.startswith("bytes="):
+                self.stats["range_get"] += 1
+                first, _, last = rng[6:].partition("-")
+                start = int(first) if first else 0
+                end = min(int(last), size - 1) if last else size - 1
+                if start >= size:
+                    return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        headers["Content-Length"] = str(end - start + 1)
+        resp = web.StreamResponse(status=status, headers=headers)
+        await resp.prepare(request)
+        pos = start
+        try:
+            while pos <= end:
+                chunk = self._content(pos, min(pos + len(BLOCK), end + 1))
+                await resp.write(chunk)
+                self.stats["bytes_sent"] += len(chunk)
+                pos += len(chunk)
+                if self.chunk_delay: await asyncio.sleep(self.chunk_delay)
+            await resp.write_eof()
+        except ConnectionError:
+            # 客户端主动断开 (比如转为分段下载)，属于正常情况
+            pass
+        return resp
+
+    @staticmethod
+    def _content(start, end):
+        # 文件内容 = 音频头 + 循环的数据块，按偏移取出 [start, end)
+        out = bytearray()
+        pos = start
+        while pos < end:
+            if pos < len(AUDIO_HEADER):
+                piece = AUDIO_HEADER[pos:min(end, len(AUDIO_HEADER))]
+            else:
+                offset = (pos - len(AUDIO_HEADER)) % len(BLOCK)
+                piece = BLOCK[offset:offset + end - pos]
+            out += piece
+            pos += len(piece)
+        return bytes(out)
+
+    async def get_stats(self, request):
+        return web.json_response({**self.stats, "connections": len(self._connections)})
+
+    async def post_reset(self, request):
+        self.reset_stats()
+        return web.json_response({"ok": True})
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post("/", self.search)
+        app.router.add_route("*", "/audio/{name}", self.audio)
+        app.router.add_get("/_stats", self.get_stats)
+        app.router.add_post("/_stats/reset", self.post_reset)
+        return app
+
+
+async def start_server(server, host="127.0.0.1", port=0):
+    runner = web.AppRunner(server.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+def build_parser(add_help=True):
+    parser = argparse.ArgumentParser(description="musicjx.com 本地替身服务", add_help=add_help)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 表示随机端口")
+    parser.add_argument("--results", type=int, default=20, help="每页返回的结果数")
+    parser.add_argument("--file-size", default="4MB", help="音频大小，可用逗号给出多种，如 1MB,12MB")
+    parser.add_argument("--search-latency", type=float, default=50, help="搜索接口延迟 (毫秒)")
+    parser.add_argument("--latency", type=float, default=20, help="CDN 首字节延迟 (毫秒)")
+    parser.add_argument("--chunk-delay", type=float, default=0, help="每发送 64KB 的额外延迟 (毫秒)，用来限速")
+    parser.add_argument("--head-fail", type=float, default=0.0, help="校验请求 (HEAD 和只取开头的 Range GET) 失败的比例 (0~1)")
+    parser.add_argument("--html-ratio", type=float, default=0.0, help="返回 HTML 错误页的比例 (0~1)")
+    parser.add_argument("--disguised-ratio", type=float, default=0.0,
+                        help="Content-Type 为音频但内容是 HTML 错误页的比例 (0~1)")
+    parser.add_argument("--no-range", action="store_true", help="不支持 Range 请求")
+    parser.add_argument("--max-inflight", type=int, default=0, help="同时传输超过此数时返回 429 (0 表示不限)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="音频 GET 随机返回 503 的比例 (0~1)")
+    parser.add_argument("--provider-latency", default="",
+                        help="按接口 type 单独设置搜索延迟 (毫秒)，如 netease=2000,qq=80")
+    return parser
+
+
+def server_from_args(args):
+    return FakeMusicServer(results=args.results,
+                           file_sizes=[parse_size(s) for s in args.file_size.split(",")],
+                           search_latency=args.search_latency / 1000, cdn_latency=args.latency / 1000,
+                           head_fail_ratio=args.head_fail, html_ratio=args.html_ratio,
+                           range_support=not args.no_range, chunk_delay=args.chunk_delay / 1000,
+                           max_inflight=args.max_inflight, error_rate=args.error_rate,
+                           disguised_ratio=args.disguised_ratio,
+                           provider_latency={name.strip(): float(ms) / 1000 for name, ms in
+                                             (pair.split("=", 1) for pair in args.provider_latency.split(",") if pair)})
+
+
+async def _serve(args):
+    runner, port = await start_server(server_from_args(args), args.host, args.port)
+    print(json.dumps({"port": port}), flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_serve(build_parser().parse_args()))
+    except KeyboardInterrupt:
+        sys.exit(0)
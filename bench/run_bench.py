@@ -0,0 +1,236 @@
+"""猫耳网络核心基准测试：对本地替身服务跑搜索和下载，输出可比较的 JSON 结果
+
+    python bench/run_bench.py --out bench_results.json
+    python bench/run_bench.py --file-size 1MB,20MB --head-fail 0.1 --compare bench_results.json
+
+服务端参数 (--file-size/--latency/--head-fail/--html-ratio/--no-range ...) 与 fake_musicjx.py 相同。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，峰值内存改用 GetProcessMemoryInfo
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp  # noqa: E402
+
+from maoer import METRICS, config, make_session, iter_music_data, download_batch  # noqa: E402
+from fake_musicjx import build_parser as server_parser  # noqa: E402
+
+# 对比时关注的指标：(路径, 越大越好?)
+COMPARE_KEYS = [
+    (("search", "latency_ms", "p50"), False),
+    (("search", "latency_ms", "p90"), False),
+    (("search", "latency_ms", "p99"), False),
+    (("search", "ttfr_ms", "p50"), False),
+    (("search", "connections"), False),
+    (("download", "throughput_mb_s"), True),
+    (("download", "elapsed_s"), False),
+    (("download", "connections"), False),
+    (("peak_rss_mb",), False),
+]
+
+
+def percentiles(values):
+    if not values: return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(ordered[-1], 2),
+            "mean": round(sum(ordered) / len(ordered), 2)}
+
+
+def _peak_working_set():
+    # Windows：进程的峰值工作集 (字节)，取不到时返回 None
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+    except (AttributeError, OSError):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def peak_rss_mb():
+    # 取不到时返回 None，对比时跳过这一项
+    if resource is None:
+        rss = _peak_working_set()
+        return None if rss is None else round(rss / 1024 ** 2, 1)
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class ServerProcess:
+    """在子进程里跑替身服务，避免服务端的内存和 CPU 算进被测进程"""
+
+    def __init__(self, server_args):
+        self.server_args = server_args
+        self.proc = None
+        self.base_url = None
+
+    async def __aenter__(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_musicjx.py")
+        self.proc = await asyncio.create_subprocess_exec(sys.executable, script, *self.server_args,
+                                                         stdout=asyncio.subprocess.PIPE)
+        line = await asyncio.wait_for(self.proc.stdout.readline(), timeout=30)
+        self.base_url = f"http://127.0.0.1:{json.loads(line)['port']}/"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.proc.terminate()
+        await self.proc.wait()
+
+    async def stats(self, reset=False):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(self.base_url + "_stats") as res:
+                data = await res.json()
+            if reset:
+                async with session.post(self.base_url + "_stats/reset"):
+                    pass
+        return data
+
+
+async def bench_search(server, rounds):
+    # 每轮用不同关键词，避免命中任何缓存；记录总耗时和首条结果耗时
+    await server.stats(reset=True)
+    latencies, ttfr, counts = [], [], []
+    async with make_session() as session:
+        for i in range(rounds):
+            started = time.perf_counter()
+            first = None
+            count = 0
+            async for _ in iter_music_data(f"bench-{i}-{time.time_ns()}", session):
+                if first is None: first = time.perf_counter() - started
+                count += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+            if first is not None: ttfr.append(first * 1000)
+            counts.append(count)
+    stats = await server.stats()
+    return {"rounds": rounds, "latency_ms": percentiles(latencies), "ttfr_ms": percentiles(ttfr),
+            "valid_results_mean": round(sum(counts) / max(1, len(counts)), 2),
+            "requests": {"search": stats["search"], "head": stats["head"], "get": stats["get"]},
+            "connections": stats["connections"]}
+
+
+async def bench_download(server, count, jobs, per_host):
+    await server.stats(reset=True)
+    tasks = [(i, f"{server.base_url}audio/bench-{i}.mp3", f"bench-{i}.mp3") for i in range(count)]
+    with tempfile.TemporaryDirectory() as save_dir:
+        started = time.perf_counter()
+        ok, failed = await download_batch(tasks, save_dir, max_concurrency=jobs, per_host_limit=per_host)
+        elapsed = time.perf_counter() - started
+        total_bytes = sum(entry.stat().st_size for entry in os.scandir(save_dir)
+                          if entry.name.endswith(".mp3"))
+    stats = await server.stats()
+    return {"files": count, "ok": ok, "failed": failed, "bytes": total_bytes, "elapsed_s": round(elapsed, 3),
+            "throughput_mb_s": round(total_bytes / (1024 ** 2) / elapsed, 2) if elapsed else None,
+            "requests": {"get": stats["get"], "range_get": stats["range_get"], "throttled": stats["throttled"],
+                         "errors": stats["errors"]},
+            "peak_inflight": stats["peak_inflight"],
+            "connections": stats["connections"]}
+
+
+def _lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict) or key not in data: return None
+        data = data[key]
+    return data
+
+
+def print_comparison(old, new):
+    print(f"{'指标':<36}{'旧':>12}{'新':>12}{'变化':>10}")
+    for path, higher_is_better in COMPARE_KEYS:
+        a, b = _lookup(old, path), _lookup(new, path)
+        if a is None or b is None: continue
+        change = (b - a) / a * 100 if a else 0.0
+        better = (change > 0) == higher_is_better
+        mark = "" if abs(change) < 1 else ("✓" if better else "✗")
+        print(f"{'.'.join(path):<36}{a:>12}{b:>12}{change:>+9.1f}%{mark}")
+
+
+async def run(args, server_args):
+    async with ServerProcess(server_args) as server:
+        config.SEARCH_URL = server.base_url
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "aiohttp": aiohttp.__version__,
+            "config": {"searches": args.searches, "downloads": args.downloads, "jobs": args.jobs,
+                       "per_host": args.per_host, "server": server_args},
+        }
+        results["search"] = await bench_search(server, args.searches)
+        results["download"] = await bench_download(server, args.downloads, args.jobs, args.per_host)
+        results["peak_rss_mb"] = peak_rss_mb()
+        # 客户端视角的分阶段耗时和失败原因
+        results["client_metrics"] = METRICS.snapshot()["kinds"]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="猫耳网络核心基准测试", parents=[server_parser(add_help=False)])
+    parser.add_argument("--searches", type=int, default=20, help="搜索轮数")
+    parser.add_argument("--downloads", type=int, default=16, help="下载文件数")
+    parser.add_argument("--jobs", type=int, default=config.MAX_CONCURRENT_DOWNLOADS, help="下载总并发")
+    parser.add_argument("--per-host", type=int, default=config.MAX_DOWNLOADS_PER_HOST, help="单主机并发")
+    parser.add_argument("--out", default="bench_results.json", help="结果 JSON 写到哪里")
+    parser.add_argument("--compare", help="和之前的结果 JSON 对比")
+    args = parser.parse_args(argv)
+
+    # 服务端参数原样转给替身服务
+    server_args = []
+    for action in server_parser(add_help=False)._actions:
+        if action.dest in ("host", "port"): continue
+        value = getattr(args, action.dest)
+        if action.const is True:
+            if value: server_args.append(action.option_strings[0])
+        else:
+            server_args += [action.option_strings[0], str(value)]
+
+    results = asyncio.run(run(args, server_args))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
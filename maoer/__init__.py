@@ -0,0 +1,18 @@
+"""猫耳下载器的网络核心：搜索、校验、下载，不依赖 Qt，可以单独导入或通过 `python -m maoer` 运行"""
+from .config import (APP_DATA_DIR, MAX_CONCURRENT_DOWNLOADS, MAX_DOWNLOADS_PER_HOST, DOWNLOAD_CHUNK_SIZE,
+                     DOWNLOAD_SEGMENTS, SEGMENT_THRESHOLD, SEARCH_PROVIDERS)
+from .metrics import METRICS, NetworkMetrics, make_trace_config
+from .net import make_session
+from .retry import RetryPolicy, AdaptiveLimiter, HostLimiters
+from .probe import is_valid_audio, sniff_audio, ProbeCache, PROBE_CACHE
+from .providers import ProviderStats, PROVIDER_STATS, hedged_search, merge_results
+from .search import (page_parm, iter_music_data, fetch_music_data, SearchCache, SearchPager, BatchSearch,
+                     batch_search)
+from .download import (download_single_music, download_batch, BatchDownloader, DownloadError, DownloadManifest,
+                       get_manifest, discard_partial)
+from .postprocess import PostProcessor, PostProcessError, StepSkipped, STEPS, register_step, run_pipeline
+from .progress import ProgressTracker
+from .bandwidth import BandwidthShaper, BANDWIDTH
+from .scheduler import DownloadQueue, DownloadScheduler
+from .audio_cache import AudioCache, StreamProxy
+from .library import LibraryIndex, normalize_track_name, file_sha256
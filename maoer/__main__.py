@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# 后处理进程池用 spawn 启动子进程，子进程会重新导入这个模块，不能在导入时就执行
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""音频缓存：试听时经本地回环代理边播边写入磁盘缓存，重复播放、拖动进度和之后的下载都直接读缓存"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import aiofiles
+import aiohttp
+from aiohttp import web
+
+from .bandwidth import BANDWIDTH
+from .config import AUDIO_CACHE_DIR, AUDIO_CACHE_SIZE, AUDIO_EXTENSIONS, DOWNLOAD_CHUNK_SIZE, MAX_PREVIEW_FILLS
+from .metrics import METRICS
+from .probe import SNIFF_MIN_BYTES, sniff_audio
+from .search import page_parm
+
+
+class AudioCache:
+    """按 URL 存放完整音频文件的磁盘缓存，总大小超过 max_bytes 时按最近使用时间 (文件 mtime) 淘汰"""
+
+    def __init__(self, directory=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def cache_path(self, url):
+        # 保留原扩展名，播放器和 FileResponse 靠它判断格式
+        ext = os.path.splitext(urlsplit(url).path)[1].lower()
+        return os.path.join(self.directory, self.key(url) + (ext if ext in AUDIO_EXTENSIONS else ".mp3"))
+
+    def part_path(self, url):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, self.key(url) + ".part")
+
+    def path_for(self, url):
+        # 命中时刷新 mtime，作为 LRU 的"最近使用"
+        path = self.cache_path(url)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def commit(self, url, part_path):
+        # 写完的临时文件转正，然后按需淘汰旧文件；返回缓存文件路径
+        path = self.cache_path(url)
+        with self._lock:
+            os.replace(part_path, path)
+            self._size = None
+        self.evict(keep=path)
+        return path
+
+    def _entries(self):
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith(".part"):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+
+    def size(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            return self._size
+
+    def evict(self, keep=None):
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes: break
+                if path == keep: continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    # Windows 上正在播放的文件删不掉，留到下次
+                    pass
+            self._size = total
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = None
+
+
+class _Fill:
+    """一次正在进行的缓存填充：远端数据顺序写入 .part，读者按已写入的字节数取数据"""
+
+    def __init__(self, url, part_path):
+        self.url = url
+        self.part_path = part_path
+        self.final_path = None
+        self.length = None
+        self.content_type = "audio/mpeg"
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.ready = asyncio.Event()  # 收到响应头 (或失败) 后置位
+        self.changed = asyncio.Condition()
+        self.task = None
+
+    async def pulse(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    async def read(self, pos, size):
+        # 每次重新打开：填充完成后 .part 会被改名成正式缓存文件，打开时恰好撞上改名就换正式文件再试
+        while True:
+            path = self.final_path or self.part_path
+            try:
+                async with aiofiles.open(path, mode="rb") as fp:
+                    await fp.seek(pos)
+                    return await fp.read(size)
+            except FileNotFoundError:
+                if self.final_path is None or path == self.final_path: raise
+
+
+class StreamProxy:
+    """本地回环代理 (只监听 127.0.0.1)：播放器请求 register() 返回的地址，代理从缓存或远端取数据
+
+    同一首歌只从远端拉一次，多个请求 (包括拖动进度产生的 Range 请求) 都从正在写入的缓存文件读取。
+    必须在 session 所属的事件循环里 start()/close()；register() 可以在任意线程调用。
+    """
+
+    def __init__(self, cache, session, max_fills=MAX_PREVIEW_FILLS):
+        self.cache = cache
+        self.session = session
+        self.max_fills = max(1, max_fills)
+        self.port = None
+        self._urls = {}  # key -> 远端 URL，只代理登记过的地址
+        self._fills = OrderedDict()  # key -> _Fill，按开始时间排列
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/audio/{key}/{name}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def close(self):
+        for fill in list(self._fills.values()):
+            fill.task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        self.port = None
+
+    def register(self, url):
+        # 地址末尾带上扩展名，方便播放器判断格式
+        key = self.cache.key(url)
+        self._urls[key] = url
+        return f"http://127.0.0.1:{self.port}/audio/{key}/{os.path.basename(self.cache.cache_path(url))}"
+
+    def _fill_for(self, key, url):
+        fill = self._fills.get(key)
+        if fill is not None: return fill
+        fill = self._fills[key] = _Fill(url, self.cache.part_path(url))
+        fill.task = asyncio.ensure_future(self._fill(key, fill))
+        # 同时只填充最近的几首，切歌太快时放弃最早的
+        while len(self._fills) > self.max_fills:
+            _, oldest = self._fills.popitem(last=False)
+            oldest.task.cancel()
+        return fill
+
+    async def _fill(self, key, fill):
+        headers, _ = await page_parm("")
+        try:
+            async with self.session.get(fill.url, headers=headers, allow_redirects=True,
+                                        trace_request_ctx={"kind": "preview"}) as res:
+                content_type = res.headers.get("Content-Type", "").lower()
+                if res.status != 200 or "text/html" in content_type:
+                    raise ValueError(f"无法试听: {res.status} {content_type}")
+                fill.length = res.content_length
+                fill.content_type = content_type or fill.content_type
+                fill.ready.set()
+                async with aiofiles.open(fill.part_path, mode="wb") as fp:
+                    async for chunk in res.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        if not fill.written and len(chunk) >= SNIFF_MIN_BYTES and sniff_audio(chunk) is None:
+                            raise ValueError("无法试听: 内容不是可识别的音频")
+                        await fp.write(chunk)
+                        await fp.flush()
+                        fill.written += len(chunk)
+                        await fill.pulse()
+                        METRICS.inc("bytes_received_total", ("preview",), len(chunk))
+                        await BANDWIDTH.throttle(len(chunk), "preview")
+            if fill.length is not None and fill.written != fill.length:
+                raise aiohttp.ClientPayloadError("试听数据没有收全")
+            fill.final_path = self.cache.commit(fill.url, fill.part_path)
+            METRICS.success("preview")
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+            METRICS.failure("preview", e)
+            fill.error = e
+        finally:
+            fill.done = True
+            fill.ready.set()
+            if self._fills.get(key) is fill:
+                del self._fills[key]
+            if fill.final_path is None:
+                try:
+                    os.remove(fill.part_path)
+                except OSError:
+                    pass
+            await fill.pulse()
+
+    async def _handle(self, request):
+        key = request.match_info["key"]
+        url = self._urls.get(key)
+        if url is None:
+            raise web.HTTPNotFound()
+        cached = self.cache.path_for(url)
+        if cached is not None:
+            METRICS.inc("audio_cache_total", ("preview", "hit"))
+            return web.FileResponse(cached)
+
+        METRICS.inc("audio_cache_total", ("preview", "miss"))
+        fill = self._fill_for(key, url)
+        await fill.ready.wait()
+        if fill.error is not None and not fill.written:
+            raise web.HTTPBadGateway(text=str(fill.error))
+
+        start, end, status = 0, None, 200
+        headers = {"Content-Type": fill.content_type}
+        if fill.length is not None:
+            # 总长已知才支持 Range (播放器拖动进度)
+            start, end = 0, fill.length - 1
+            headers["Accept-Ranges"] = "bytes"
+            rng = request.headers.get("Range", "")
+            if rng.startswith("bytes="):
+                first, _, last = rng[6:].partition("-")
+                try:
+                    start = int(first) if first else max(0, fill.length - int(last))
+                    end = min(int(last), fill.length - 1) if first and last else fill.length - 1
+                except ValueError:
+                    start, end = 0, fill.length - 1
+                # 起点超出文件或起点在终点之后 (bytes=500-100) 都是无法满足的范围
+                if start >= fill.length or start > end:
+                    raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": f"bytes */{fill.length}"})
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{fill.length}"
+            headers["Content-Length"] = str(end - start + 1)
+
+        resp = web.StreamResponse(status=status, headers=headers)
+        await resp.prepare(request)
+        pos = start
+        try:
+            while end is None or pos <= end:
+                async with fill.changed:
+                    while pos >= fill.written and not fill.done:
+                        await fill.changed.wait()
+                if pos >= fill.written: break  # 填充结束 (或失败) 且没有更多数据
+                limit = fill.written if end is None else min(fill.written, end + 1)
+                try:
+                    data = await fill.read(pos, min(DOWNLOAD_CHUNK_SIZE, limit - pos))
+                except OSError as e:
+                    print(f"读取试听缓存失败: {e}")
+                    break
+                if not data: break
+                await resp.write(data)
+                pos += len(data)
+        except ConnectionError:
+            # 播放器断开 (切歌、拖动进度)，填充继续在后台进行
+            return resp
+        await resp.write_eof()
+        return resp
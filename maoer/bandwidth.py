@@ -0,0 +1,122 @@
+"""带宽整形：所有传输共用一个限速器，交互流量 (搜索、校验、试听) 优先于后台批量下载"""
+import asyncio
+import time
+
+from .config import BANDWIDTH_LIMIT, BANDWIDTH_BURST, INTERACTIVE_RESERVE, INTERACTIVE_HOLD
+from .metrics import METRICS
+
+# 这些类型的请求走交互通道，其余 (download) 走后台通道；名称和 trace_request_ctx 的 kind 一致
+INTERACTIVE_KINDS = ("search", "probe", "preview")
+
+
+class BandwidthShaper:
+    """全局令牌桶限速，带交互优先通道
+
+    每读到一块数据调用 await throttle(字节数, 类型)，超速时在这里等待；读得慢了，TCP 流控会让服务器跟着放慢。
+    令牌桶用虚拟调度 (GCRA) 实现：每个通道记一个"理论到达时间"，超前 burst 秒以上就等到允许的时刻。
+    交互通道只受总上限约束，用掉的份额同时记到后台通道上；最近 hold 秒内有交互流量时，
+    后台下载最多只用总带宽的 (1 - reserve)，留出的余量让试听、搜索不必排在下载后面。
+    没有设总上限 (0) 时按测得的链路吞吐估算总带宽，交互流量活跃期间后台照样让路；
+    链路吞吐只从后台下载跑满的窗口里测，还没测出来之前后台不受限制。
+    每块数据先按当前速率排好放行时刻，再分成短片段等待；每段醒来检查速率，
+    交互流量结束、上限调整后按新速率重新排期，不必等完原来算好的时长。
+    只在网络线程的事件循环里调用 throttle()；set_limit() 可以在任意线程调用。
+    """
+    # 链路吞吐按 1 秒一个窗口测量，取近期最大值，每个窗口衰减一点以跟上网络变化
+    WINDOW = 1.0
+    LINK_DECAY = 0.95
+    # 窗口里后台下载至少收了这么多字节才算测到了链路吞吐；只有零星的搜索、校验流量时测不出来
+    LINK_MIN_BYTES = 256 * 1024
+    # 一次最多等这么久 (秒) 就重新计算
+    SLICE = 0.1
+
+    def __init__(self, limit=BANDWIDTH_LIMIT, reserve=INTERACTIVE_RESERVE, hold=INTERACTIVE_HOLD,
+                 burst=BANDWIDTH_BURST):
+        self.limit = max(0, int(limit or 0))  # 字节/秒，0 为不限速
+        self.reserve = reserve
+        self.hold = hold
+        self.burst = burst
+        self.link_rate = 0.0  # 估算的链路吞吐 (字节/秒)，0 为还没测出来
+        self._tat = {True: 0.0, False: 0.0}  # 是否交互通道 -> 理论到达时间
+        self._lane_rate = {True: 0, False: 0}  # 是否交互通道 -> 排期时用的速率
+        self._last_interactive = float("-inf")
+        self._window_start = None
+        self._window_bytes = 0
+        self._window_background = 0  # 窗口里后台下载的字节数
+        self._window_yielded = False  # 这个窗口里后台是否为交互流量让过路，让过的窗口测不出链路吞吐
+
+    def set_limit(self, limit):
+        self.limit = max(0, int(limit or 0))
+
+    def interactive_active(self, now=None):
+        return (time.monotonic() if now is None else now) - self._last_interactive < self.hold
+
+    def _measure(self, now, nbytes, interactive):
+        if self._window_start is None:
+            self._window_start = now
+        elif now - self._window_start >= self.WINDOW:
+            elapsed = now - self._window_start
+            # 中间有空闲 (窗口拖得太长) 或后台量不够的窗口不参与估算
+            if (not self._window_yielded and elapsed < 2 * self.WINDOW
+                    and self._window_background >= self.LINK_MIN_BYTES):
+                self.link_rate = max(self._window_bytes / elapsed, self.link_rate * self.LINK_DECAY)
+            self._window_start, self._window_bytes, self._window_background = now, 0, 0
+            self._window_yielded = False
+        self._window_bytes += nbytes
+        if not interactive:
+            self._window_background += nbytes
+
+    def _rate(self, interactive, now):
+        # 这个通道眼下的速率上限，0 为不限
+        if interactive or not self.interactive_active(now) or self.limit and not self.reserve:
+            return self.limit
+        total = self.limit or self.link_rate
+        if not total: return 0
+        if not self.limit: self._window_yielded = True
+        return total * (1 - self.reserve)
+
+    def _retime(self, interactive, now, rate):
+        # 通道速率变了：已排队的积压按新速率重新折算；不限速时清空
+        old = self._lane_rate[interactive]
+        if rate and old and rate != old:
+            self._tat[interactive] = now + max(0.0, self._tat[interactive] - now) * old / rate
+        elif not rate:
+            self._tat[interactive] = now
+        self._lane_rate[interactive] = rate
+
+    async def throttle(self, nbytes, kind="download"):
+        if nbytes <= 0: return
+        interactive = kind in INTERACTIVE_KINDS
+        now = time.monotonic()
+        self._measure(now, nbytes, interactive)
+        if interactive:
+            self._last_interactive = now
+            total = self.limit or self.link_rate
+            if total and self._lane_rate[False]:
+                # 交互流量用掉的带宽从后台通道的份额里扣
+                self._tat[False] = max(self._tat[False], now) + nbytes / total
+        rate = self._rate(interactive, now)
+        if rate != self._lane_rate[interactive]:
+            self._retime(interactive, now, rate)
+        if not rate: return
+        # 先占好这块数据的放行时刻，后来的调用排在它后面
+        tat = self._tat[interactive] = max(self._tat[interactive], now) + nbytes / rate
+        waited = False
+        # 剩下不到 1 毫秒就直接放行，避免浮点误差造成的极短等待
+        while tat - self.burst - now > 0.001:
+            if not waited:
+                waited = True
+                METRICS.inc("bandwidth_waits_total", (kind,))
+            await asyncio.sleep(min(tat - self.burst - now, self.SLICE))
+            now = time.monotonic()
+            new_rate = self._rate(interactive, now)
+            if new_rate != rate:
+                if new_rate != self._lane_rate[interactive]:
+                    self._retime(interactive, now, new_rate)
+                if not new_rate: return
+                tat = now + max(0.0, tat - now) * rate / new_rate
+                rate = new_rate
+
+
+# 全局的限速器，网络线程上的所有传输共用
+BANDWIDTH = BandwidthShaper()
@@ -0,0 +1,166 @@
+"""命令行模式：从文件读取关键词或链接，批量搜索下载，结果按 JSON Lines 输出
+
+    python -m maoer keywords.txt -o ./music
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+from urllib.parse import unquote, urlsplit
+
+from .bandwidth import BANDWIDTH
+from .config import (MAX_CONCURRENT_DOWNLOADS, MAX_DOWNLOADS_PER_HOST, AUDIO_EXTENSIONS, SEARCH_PROVIDERS,
+                     POSTPROCESS_STEPS, POSTPROCESS_WORKERS, BANDWIDTH_LIMIT)
+from .download import BatchDownloader
+from .library import LibraryIndex
+from .metrics import METRICS
+from .net import make_session
+from .postprocess import PostProcessor, STEPS
+from .providers import PROVIDER_STATS
+from .search import SearchCache, fetch_music_data
+
+
+def _read_entries(path):
+    # 每行一个关键词或链接，空行和 # 开头的行忽略
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def _is_url(entry):
+    return entry.startswith(("http://", "https://"))
+
+
+def _safe_filename(name):
+    return re.sub(r'[\\/:*?"<>|\r\n]+', "_", name).strip() or "未命名"
+
+
+def _url_filename(url):
+    name = _safe_filename(unquote(os.path.basename(urlsplit(url).path)))
+    return name if name.lower().endswith(AUDIO_EXTENSIONS) else name + ".mp3"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m maoer", description="猫耳下载器命令行模式 (不加载界面)")
+    parser.add_argument("input", help="关键词/链接列表文件，每行一个；- 表示从标准输入读取")
+    parser.add_argument("-o", "--output", default="music_downloaded", help="下载目录 (默认 ./music_downloaded)")
+    parser.add_argument("-n", "--per-keyword", type=int, default=1, help="每个关键词下载前几条结果 (默认 1)")
+    parser.add_argument("-j", "--jobs", type=int, default=MAX_CONCURRENT_DOWNLOADS, help="同时下载的文件数")
+    parser.add_argument("--per-host", type=int, default=MAX_DOWNLOADS_PER_HOST, help="同一主机同时下载的文件数")
+    parser.add_argument("--search-jobs", type=int, default=4, help="同时进行的搜索数")
+    parser.add_argument("--providers", default=",".join(SEARCH_PROVIDERS),
+                        help="搜索来源 (接口 type)，逗号分隔；多个来源时对冲搜索并合并结果 (默认 %(default)s)")
+    parser.add_argument("--search-only", action="store_true", help="只搜索，不下载")
+    parser.add_argument("--no-cache", action="store_true", help="不使用搜索缓存")
+    parser.add_argument("--no-library", action="store_true", help="不查询/登记本地曲库，已下载的也重新下载")
+    parser.add_argument("--post", default=",".join(POSTPROCESS_STEPS),
+                        help=f"下载后依次执行的处理步骤，逗号分隔，none 表示不处理 (可选: {', '.join(STEPS)}；"
+                             f"默认 %(default)s)")
+    parser.add_argument("--post-workers", type=int, default=POSTPROCESS_WORKERS, help="后处理进程数")
+    parser.add_argument("--limit-rate", type=int, default=BANDWIDTH_LIMIT // 1024,
+                        help="总下载速度上限 (KB/s)，0 表示不限速 (默认 %(default)s)")
+    parser.add_argument("--metrics-out", help="结束时把网络统计写到此文件 (.prom 为 Prometheus 文本格式，其余为 JSON)")
+    return parser
+
+
+async def run(args, entries, emit):
+    cache = None if args.no_cache else SearchCache()
+    library = None if args.no_library else LibraryIndex()
+    if library is not None:
+        await asyncio.to_thread(library.scan, args.output)
+    search_sem = asyncio.Semaphore(max(1, args.search_jobs))
+    providers = tuple(p.strip() for p in args.providers.split(",") if p.strip()) or SEARCH_PROVIDERS
+    steps = [s.strip() for s in args.post.split(",") if s.strip() and s.strip() != "none"]
+    postprocessor = PostProcessor(steps, args.post_workers) if steps else None
+    music_type = providers[0] if len(providers) == 1 else providers
+    BANDWIDTH.set_limit(args.limit_rate * 1024)
+
+    async with make_session() as session:
+        downloader = BatchDownloader(args.output, session, args.jobs, args.per_host, library,
+                                     postprocessor=postprocessor)
+
+        # 链接 / 目标文件名 -> 第一个认领它的下载任务；关键词重复、不同关键词搜到同一首或撞名时只下载一次
+        by_url, by_file = {}, {}
+
+        async def _download(entry, url, fname, meta=None):
+            first = by_url.get(url) or by_file.get(fname)
+            if first is not None:
+                ok = await asyncio.shield(first)
+                emit({"event": "download", "input": entry, "url": url, "file": fname, "ok": ok, "skipped": True,
+                      "duplicate": True})
+                return ok
+            task = by_url[url] = by_file[fname] = asyncio.ensure_future(_fetch(entry, url, fname, meta))
+            return await task
+
+        async def _fetch(entry, url, fname, meta):
+            if library is not None and library.find(url, fname, args.output):
+                emit({"event": "download", "input": entry, "url": url, "file": fname, "ok": True, "skipped": True})
+                return True
+            started = time.perf_counter()
+            ok = await downloader.download(url, fname, meta)
+            emit({"event": "download", "input": entry, "url": url, "file": fname, "ok": ok,
+                  "elapsed": round(time.perf_counter() - started, 3)})
+            return ok
+
+        async def _handle(entry):
+            # 每个关键词搜完立刻开始下载，不等其它关键词
+            if _is_url(entry):
+                return [await _download(entry, entry, _url_filename(entry))]
+            started = time.perf_counter()
+            async with search_sem:
+                items = await fetch_music_data(entry, session, music_type=music_type, cache=cache)
+            emit({"event": "search", "input": entry, "ok": items is not None, "results": len(items or []),
+                  "elapsed": round(time.perf_counter() - started, 3),
+                  "items": items[:args.per_keyword] if items else []})
+            if not items: return [False]
+            if args.search_only: return [True]
+            picks = items[:max(1, args.per_keyword)]
+            return await asyncio.gather(*(_download(entry, item["url"],
+                                                    _safe_filename(f"{item['title']} - {item['author']}") + ".mp3",
+                                                    (item["title"], item["author"]))
+                                          for item in picks))
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(_handle(entry) for entry in entries))
+
+    if cache is not None: cache.close()
+    if postprocessor is not None: postprocessor.close()
+    PROVIDER_STATS.save()
+    if library is not None: library.close()
+    if args.metrics_out:
+        METRICS.export(args.metrics_out)
+    outcomes = [ok for group in results for ok in group]
+    emit({"event": "summary", "inputs": len(entries), "ok": outcomes.count(True), "failed": outcomes.count(False),
+          "elapsed": round(time.perf_counter() - started, 3)})
+    return 0 if all(outcomes) else 1
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    out = sys.stdout
+
+    def emit(record):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    unknown = [s for s in args.post.split(",") if s.strip() and s.strip() not in STEPS and s.strip() != "none"]
+    if unknown:
+        print(f"未知的后处理步骤: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    try:
+        entries = _read_entries(args.input)
+    except OSError as e:
+        print(f"无法读取输入: {e}", file=sys.stderr)
+        return 2
+
+    # 网络核心里的提示信息改走 stderr，stdout 只留 JSON Lines
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return asyncio.run(run(args, entries, emit))
+        except KeyboardInterrupt:
+            return 130
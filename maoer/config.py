@@ -0,0 +1,95 @@
+"""网络核心的可调参数"""
+import os
+
+# 搜索接口地址；基准测试等场景可用环境变量 MAOER_SEARCH_URL 指向本地替身服务
+SEARCH_URL = os.environ.get("MAOER_SEARCH_URL", "https://musicjx.com/")
+
+# 程序数据目录 (缓存、索引等)
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".maoer")
+
+# 批量下载并发上限：总并发数 / 单个主机并发数
+MAX_CONCURRENT_DOWNLOADS = 6
+MAX_DOWNLOADS_PER_HOST = 3
+# 流式下载时每次写盘的块大小 (字节)，决定单个传输的内存峰值
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 断点续传清单：存放在下载目录下，记录未完成的下载
+MANIFEST_NAME = ".maoer_manifest.json"
+# 每写入这么多字节刷新一次清单
+MANIFEST_FLUSH_BYTES = 1024 * 1024
+# 分段下载：服务器支持 Range 且文件大于阈值时，拆成多段并发拉取 (段数设为 1 即关闭)
+DOWNLOAD_SEGMENTS = 4
+SEGMENT_THRESHOLD = 8 * 1024 * 1024
+
+# 共享连接池：总连接数 / 单主机连接数 / DNS 缓存秒数 / 空闲连接保活秒数
+SESSION_CONN_LIMIT = 32
+SESSION_CONN_PER_HOST = 8
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+# 普通请求的超时：建立连接 / 两次读取之间 (秒)；大文件下载不设总超时
+CONNECT_TIMEOUT = 15
+READ_TIMEOUT = 60
+# 校验音频链接 (HEAD) 的超时，比普通请求短，慢的链接靠重试补救
+PROBE_CONNECT_TIMEOUT = 3
+PROBE_READ_TIMEOUT = 5
+# 校验方式："range" 用 Range GET 取开头 PROBE_SNIFF_BYTES 字节嗅探格式 (能识破伪装成音频的网页)；"head" 只看响应头
+PROBE_MODE = "range"
+PROBE_SNIFF_BYTES = 64
+# 校验结果缓存：有效期 (秒) / 最多条数；下载时复用其中的文件长度和 Range 支持
+PROBE_CACHE_TTL = 30 * 60
+PROBE_CACHE_SIZE = 5000
+
+# 失败重试：最多尝试次数 / 首次退避秒数 / 退避上限秒数 (带随机抖动的指数退避)
+DOWNLOAD_RETRY_ATTEMPTS = 4
+PROBE_RETRY_ATTEMPTS = 2
+SEARCH_RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+# 搜索结果缓存：有效期 (秒) / 内存中最多保留的查询数 / 磁盘缓存位置
+SEARCH_CACHE_TTL = 6 * 3600
+SEARCH_CACHE_SIZE = 200
+SEARCH_CACHE_DB = os.path.join(APP_DATA_DIR, "search_cache.db")
+# 批量搜索：所有关键词的搜索和校验请求共用的并发预算
+BATCH_SEARCH_BUDGET = 16
+# 多来源搜索：可选的接口 type；同时先查最快的几个，迟迟没有结果再追加下一个 (对冲请求)
+SEARCH_PROVIDERS = ("netease", "qq", "kugou", "kuwo", "migu")
+SEARCH_FANOUT = 2
+# 对冲等待 (秒)：已发出的来源这么久还没有结果，就追加下一个来源
+HEDGE_DELAY = 1.5
+# 第一个来源返回后，再等其它已发出的来源这么久 (秒) 用于合并，超时的直接取消
+HEDGE_MERGE_WINDOW = 0.5
+# 各来源的延迟和成功率，用来决定下次先查哪个
+PROVIDER_STATS_FILE = os.path.join(APP_DATA_DIR, "provider_stats.json")
+
+# 本地曲库索引：记录已下载文件，批量下载前跳过已有的曲目
+LIBRARY_DB = os.path.join(APP_DATA_DIR, "library.db")
+AUDIO_EXTENSIONS = (".mp3", ".flac", ".m4a", ".ogg", ".wav", ".aac")
+
+# 试听音频缓存：目录 / 总大小上限 (超出按最近使用淘汰) / 同时在后台缓存的歌曲数
+AUDIO_CACHE_DIR = os.path.join(APP_DATA_DIR, "audio_cache")
+AUDIO_CACHE_SIZE = 512 * 1024 * 1024
+MAX_PREVIEW_FILLS = 2
+
+# 下载队列：持久化的任务列表，关闭程序后未完成的任务下次继续
+QUEUE_DB = os.path.join(APP_DATA_DIR, "download_queue.db")
+
+# 下载后处理：在进程池里运行，不占用网络线程和界面线程
+# 工作进程数 / 默认步骤 (按顺序执行；哈希放最后，记录的是处理完的最终内容)
+POSTPROCESS_WORKERS = max(1, min(2, (os.cpu_count() or 2) - 1))
+POSTPROCESS_STEPS = ("verify", "tags", "hash")
+# 可选步骤 loudnorm (响度归一) / transcode (转码) 需要 ffmpeg：可执行文件 / 响度目标 (LUFS) / 转码格式 / 码率
+FFMPEG = "ffmpeg"
+LOUDNESS_TARGET = -14.0
+TRANSCODE_FORMAT = "mp3"
+TRANSCODE_BITRATE = "192k"
+
+# 下载进度：最多每秒通知几次 (多个数据块的更新合并成一次) / 速度按指数加权平均的时间常数 (秒)
+PROGRESS_MAX_RATE = 10
+PROGRESS_RATE_WINDOW = 3.0
+
+# 带宽整形：全局限速 (字节/秒，0 为不限速) / 允许的突发 (秒)
+BANDWIDTH_LIMIT = 0
+BANDWIDTH_BURST = 0.25
+# 交互流量 (搜索、校验、试听) 优先：最近这么多秒内有交互流量时，后台下载最多用总带宽的 (1 - 预留比例)
+INTERACTIVE_RESERVE = 0.3
+INTERACTIVE_HOLD = 3.0
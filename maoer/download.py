@@ -0,0 +1,497 @@
+"""下载：流式写盘、断点续传、分段下载、批量并发"""
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import aiofiles
+import aiohttp
+
+from .bandwidth import BANDWIDTH
+from .config import (DOWNLOAD_CHUNK_SIZE, MANIFEST_NAME, MANIFEST_FLUSH_BYTES, DOWNLOAD_SEGMENTS,
+                     SEGMENT_THRESHOLD, MAX_CONCURRENT_DOWNLOADS, MAX_DOWNLOADS_PER_HOST,
+                     DOWNLOAD_RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+from .metrics import METRICS
+from .net import _session_scope
+from .postprocess import track_meta
+from .probe import PROBE_CACHE, SNIFF_MIN_BYTES, sniff_audio, looks_like_html, parse_content_range
+from .retry import RETRY_STATUSES, RetryPolicy, HostLimiters, is_retryable, parse_retry_after
+from .search import page_parm
+
+
+class DownloadError(Exception):
+    """响应内容不可用 (HTML 错误页、状态码不对、区间对不上等)，reason 是用于统计的简短原因
+
+    retryable 表示稍后重试可能成功 (服务器繁忙、数据没收全)，retry_after 是服务器要求的等待秒数
+    """
+
+    def __init__(self, reason, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.reason = reason
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+DOWNLOAD_RETRY = RetryPolicy(DOWNLOAD_RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+
+class DownloadManifest:
+    """下载目录里的断点续传清单: 文件名 -> {url, path, length, written}"""
+
+    def __init__(self, save_dir):
+        self.path = os.path.join(save_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._entries = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, filename):
+        with self._lock:
+            entry = self._entries.get(filename)
+            return dict(entry) if entry else None
+
+    def update(self, filename, **fields):
+        with self._lock:
+            self._entries.setdefault(filename, {}).update(fields)
+            self._save()
+
+    def remove(self, filename):
+        with self._lock:
+            if self._entries.pop(filename, None) is not None:
+                self._save()
+
+    def _save(self):
+        # 先写临时文件再替换，程序崩溃时也不会留下写了一半的清单
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"清单保存失败: {e}")
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_manifest(save_dir):
+    # 同一目录共用一个清单对象，避免并发任务互相覆盖
+    key = os.path.abspath(save_dir)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = DownloadManifest(key)
+        return _manifests[key]
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def discard_partial(save_dir, filename):
+    # 放弃一个未完成的下载：删掉 .part 临时文件和清单记录
+    _remove_quietly(os.path.join(save_dir, filename) + ".part")
+    get_manifest(save_dir).remove(filename)
+
+
+def _check_head(data):
+    # 从文件开头写入时检查头几个字节，拦下伪装成音频的网页
+    if len(data) >= SNIFF_MIN_BYTES and sniff_audio(data) is None:
+        if looks_like_html(data):
+            raise DownloadError("html", "返回的是网页而不是音频")
+        raise DownloadError("not_audio", "文件内容不是可识别的音频格式")
+
+
+def _split_ranges(length, count):
+    # 把 [0, length) 平均切成 count 段，每段记为 [起点, 终点(含), 已写字节]
+    size = -(-length // count)
+    return [[start, min(start + size, length) - 1, 0] for start in range(0, length, size)]
+
+
+async def _fetch_segment(session, url, headers, part_path, seg, chunk_size, on_chunk):
+    start, end, _ = seg
+    if start + seg[2] > end: return
+    headers = {**headers, "Range": f"bytes={start + seg[2]}-{end}"}
+    async with session.get(url, headers=headers, allow_redirects=True,
+                           trace_request_ctx={"kind": "download"}) as res:
+        if res.status in RETRY_STATUSES:
+            raise DownloadError(f"status_{res.status}", f"服务器繁忙: {res.status}", retryable=True,
+                                retry_after=parse_retry_after(res.headers.get("Retry-After")))
+        if res.status != 206:
+            raise DownloadError("no_range", f"服务器不支持分段下载: {res.status}")
+        if parse_content_range(res.headers.get("Content-Range"))[0] != start + seg[2]:
+            raise DownloadError("range_mismatch", "服务器返回的区间和请求不一致")
+        # 每段各自打开文件，定位到自己的偏移处写入
+        transfer_started = time.perf_counter()
+        async with aiofiles.open(part_path, mode='r+b') as fp:
+            await fp.seek(start + seg[2])
+            async for chunk in res.content.iter_chunked(chunk_size):
+                chunk = chunk[:end + 1 - start - seg[2]]
+                if start + seg[2] == 0: _check_head(chunk)
+                await fp.write(chunk)
+                seg[2] += len(chunk)
+                on_chunk(len(chunk))
+                METRICS.inc("bytes_received_total", ("download",), len(chunk))
+                await BANDWIDTH.throttle(len(chunk))
+        METRICS.observe("download", "transfer", (time.perf_counter() - transfer_started) * 1000)
+    if start + seg[2] <= end:
+        raise DownloadError("incomplete", "分段数据提前结束", retryable=True)
+
+
+async def _download_segmented(session, url, headers, filename, file_path, part_path, manifest,
+                              length, segs, chunk_size, on_progress=None):
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != length:
+        # 预先占好完整大小，各段直接写到自己的位置
+        with open(part_path, 'wb') as f:
+            f.truncate(length)
+    written = sum(seg[2] for seg in segs)
+    manifest.update(filename, url=url, path=file_path, length=length, segments=segs, written=written)
+    if on_progress is not None: on_progress(written, length)
+
+    unflushed = 0
+
+    def _on_chunk(n):
+        nonlocal unflushed, written
+        written += n
+        unflushed += n
+        if on_progress is not None: on_progress(written, length)
+        if unflushed >= MANIFEST_FLUSH_BYTES:
+            manifest.update(filename, segments=segs, written=written)
+            unflushed = 0
+
+    results = await asyncio.gather(
+        *(_fetch_segment(session, url, headers, part_path, seg, chunk_size, _on_chunk) for seg in segs),
+        return_exceptions=True)
+    manifest.update(filename, segments=segs, written=sum(seg[2] for seg in segs))
+    for r in results:
+        if isinstance(r, BaseException): raise r
+
+    os.replace(part_path, file_path)
+    manifest.remove(filename)
+    return True
+
+
+async def _download_attempt(session, url, filename, headers, file_path, part_path, manifest, chunk_size,
+                            segments, segment_threshold, limiter, on_progress=None):
+    # 尝试下载一次：成功返回 True；出错抛异常，.part 和清单按断点保留，供下一次尝试续传
+    # on_progress(已写入字节, 总字节或 None) 在每写入一块数据后调用
+    entry = manifest.get(filename)
+    if not entry or entry.get("url") != url or not os.path.exists(part_path):
+        # 清单里没有记录或者换了链接，旧的 .part 不能再用
+        _remove_quietly(part_path)
+        entry = None
+    elif entry.get("segments") and os.path.getsize(part_path) != entry.get("length"):
+        # 分段下载的临时文件大小不对，说明已损坏
+        _remove_quietly(part_path)
+        entry = None
+    if entry and entry.get("segments"):
+        # 上次是分段下载，按各段的断点继续
+        return await _download_segmented(session, url, headers, filename, file_path, part_path,
+                                         manifest, entry["length"], entry["segments"], chunk_size, on_progress)
+
+    offset = os.path.getsize(part_path) if entry else 0
+    if not offset:
+        # 校验时已经知道长度和 Range 支持的大文件，直接分段下载，省掉一次试探性的完整 GET
+        probe = PROBE_CACHE.get(url)
+        if (probe and probe["ok"] and probe.get("ranges") and probe.get("length")
+                and segments > 1 and probe["length"] >= segment_threshold):
+            return await _download_segmented(session, url, headers, filename, file_path, part_path, manifest,
+                                             probe["length"], _split_ranges(probe["length"], segments), chunk_size,
+                                             on_progress)
+    written = offset
+    req_headers = {**headers, "Range": f"bytes={offset}-"} if offset else headers
+    started = time.perf_counter()
+    try:
+        async with session.get(url, headers=req_headers, allow_redirects=True,
+                               trace_request_ctx={"kind": "download"}) as res:
+            if limiter is not None:
+                limiter.record(res.status, time.perf_counter() - started)
+            content_type = res.headers.get('Content-Type', '').lower()
+            if 'text/html' in content_type:
+                raise DownloadError("html", f"返回的是网页而不是音频: {content_type}")
+            if res.status in RETRY_STATUSES:
+                raise DownloadError(f"status_{res.status}", f"服务器繁忙: {res.status}", retryable=True,
+                                    retry_after=parse_retry_after(res.headers.get("Retry-After")))
+            if res.status not in (200, 206, 416):
+                raise DownloadError(f"status_{res.status}", f"无效响应: {res.status}")
+
+            if res.status == 416:
+                # 服务器认为断点已到文件末尾：长度对得上就直接收尾，否则重新下载
+                if entry and entry.get("length") == offset:
+                    if on_progress is not None: on_progress(offset, offset)
+                    os.replace(part_path, file_path)
+                    manifest.remove(filename)
+                    return True
+                raise DownloadError("bad_resume", "断点位置无效")
+
+            if res.status == 206:
+                start, length = parse_content_range(res.headers.get("Content-Range"))
+                if start != offset:
+                    raise DownloadError("range_mismatch", "服务器返回的区间和断点不一致")
+                mode = 'ab'
+            else:
+                # 服务器忽略了 Range，只能从头开始
+                length = res.content_length
+                written = 0
+                mode = 'wb'
+                if (segments > 1 and length and length >= segment_threshold
+                        and res.headers.get("Accept-Ranges", "").lower() == "bytes"):
+                    # 大文件且支持 Range：放弃这条连接，改为分段并发下载
+                    res.close()
+                    return await _download_segmented(session, url, headers, filename, file_path,
+                                                     part_path, manifest, length,
+                                                     _split_ranges(length, segments), chunk_size, on_progress)
+
+            manifest.update(filename, url=url, path=file_path, length=length, written=written)
+            if on_progress is not None: on_progress(written, length)
+            unflushed = 0
+            transfer_started = time.perf_counter()
+            async with aiofiles.open(part_path, mode=mode) as fp:
+                async for chunk in res.content.iter_chunked(chunk_size):
+                    if written == 0: _check_head(chunk)
+                    await fp.write(chunk)
+                    written += len(chunk)
+                    unflushed += len(chunk)
+                    if on_progress is not None: on_progress(written, length)
+                    if unflushed >= MANIFEST_FLUSH_BYTES:
+                        manifest.update(filename, written=written)
+                        unflushed = 0
+                    METRICS.inc("bytes_received_total", ("download",), len(chunk))
+                    await BANDWIDTH.throttle(len(chunk))
+
+            METRICS.observe("download", "transfer", (time.perf_counter() - transfer_started) * 1000)
+            if length is not None and written != length:
+                # 连接提前断开，保留 .part 等下次续传
+                raise DownloadError("incomplete", "数据没有收全", retryable=True)
+            os.replace(part_path, file_path)
+            manifest.remove(filename)
+            return True
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+        if limiter is not None:
+            limiter.record(error=True)
+        raise
+    finally:
+        if written and os.path.exists(part_path) and not (manifest.get(filename) or {}).get("segments"):
+            manifest.update(filename, written=written)
+
+
+# 修改：增加 save_dir 参数
+# 边收边写：数据按块写入 .part 临时文件，完整收完后再原子改名为正式文件
+# 断点续传：.part 文件和清单会保留下来，下次用 Range 请求从断点继续
+# 分段下载：大文件拆成 segments 段在同一个 session 上并发拉取
+# 失败重试：网络中断、超时、429/5xx 按 retry 策略退避后从断点继续；limiter 收到每次响应的反馈
+# 进度：on_progress(已写入字节, 总字节或 None) 每写入一块数据调用一次，值是绝对量，重试、续传不会重复计算
+async def download_single_music(url, filename, headers, save_dir, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                                segments=DOWNLOAD_SEGMENTS, segment_threshold=SEGMENT_THRESHOLD, session=None,
+                                retry=DOWNLOAD_RETRY, limiter=None, on_progress=None):
+    os.makedirs(save_dir, exist_ok=True)
+    file_path = os.path.join(save_dir, filename)
+    part_path = file_path + ".part"
+    manifest = get_manifest(save_dir)
+
+    # 并发下载时 headers 是共享的，复制一份再改
+    headers = {**headers, "upgrade-insecure-requests": "1"}
+
+    async with _session_scope(session) as session:
+        for attempt in range(retry.attempts):
+            try:
+                await _download_attempt(session, url, filename, headers, file_path, part_path, manifest,
+                                        chunk_size, segments, segment_threshold, limiter, on_progress)
+                METRICS.success("download")
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                METRICS.failure("download", e)
+                if not is_retryable(e):
+                    break
+                if attempt + 1 < retry.attempts:
+                    METRICS.inc("retries_total", ("download",))
+                    await asyncio.sleep(retry.delay(attempt, getattr(e, "retry_after", None)))
+                    continue
+                # 重试次数用完：保留 .part 和清单，下次续传
+                return False
+            except OSError as e:
+                # 写盘失败 (磁盘满、没权限)，重试无益，保留 .part
+                METRICS.failure("download", e)
+                return False
+            except Exception as e:
+                METRICS.failure("download", e)
+                break
+    # 内容无效：清理残留的临时文件和清单记录
+    _remove_quietly(part_path)
+    manifest.remove(filename)
+    return False
+
+
+class BatchDownloader:
+    """共享并发名额的下载器：总并发和单主机并发都有上限，可以边接收任务边下载
+
+    单主机并发由 AdaptiveLimiter 控制：服务器限流或变慢时自动收缩，恢复后逐步回到 per_host_limit。
+    传入 audio_cache 时，试听时已经完整缓存过的歌曲直接从缓存复制，不走网络。
+    传入 postprocessor 时，下载完成的文件先经过后处理 (校验、标签、哈希等)，再登记到曲库。
+    传入 progress (ProgressTracker) 时按字节汇报每个文件的进度，键是文件的完整路径。
+    同时进行的任务里，不同链接要存成同一个文件名时，后来的自动改名 ("歌名 - 歌手 (2).mp3")；
+    同一链接同名的任务依次执行，不会同时写同一个 .part 文件。
+    """
+
+    def __init__(self, save_dir, session, max_concurrency=MAX_CONCURRENT_DOWNLOADS,
+                 per_host_limit=MAX_DOWNLOADS_PER_HOST, library=None, audio_cache=None, postprocessor=None,
+                 progress=None):
+        self.save_dir = save_dir
+        self.session = session
+        self.library = library
+        self.audio_cache = audio_cache
+        self.postprocessor = postprocessor
+        self.progress = progress
+        self.success_count = 0
+        self.fail_count = 0
+        self._global_sem = asyncio.Semaphore(max(1, max_concurrency))
+        self._host_limiters = HostLimiters(per_host_limit, kind="download")
+        self._headers = None
+        self._targets = {}  # 正在使用的文件名 -> [链接, 任务数, 锁]
+
+    def _claim(self, url, fname):
+        # 占用目标文件名，返回实际使用的文件名和它的锁
+        stem, ext = os.path.splitext(fname)
+        n = 1
+        while fname in self._targets and self._targets[fname][0] != url:
+            n += 1
+            fname = f"{stem} ({n}){ext}"
+        target = self._targets.setdefault(fname, [url, 0, asyncio.Lock()])
+        target[1] += 1
+        return fname, target[2]
+
+    def _release(self, fname):
+        target = self._targets[fname]
+        target[1] -= 1
+        if not target[1]:
+            del self._targets[fname]
+
+    async def _copy_from_cache(self, url, fname, on_progress=None):
+        cached = self.audio_cache.path_for(url) if self.audio_cache is not None else None
+        if cached is None:
+            if self.audio_cache is not None: METRICS.inc("audio_cache_total", ("download", "miss"))
+            return False
+        try:
+            os.makedirs(self.save_dir, exist_ok=True)
+            await asyncio.to_thread(_copy_file, cached, os.path.join(self.save_dir, fname))
+        except OSError as e:
+            print(f"从缓存复制失败，改为重新下载: {e}")
+            return False
+        if on_progress is not None:
+            size = os.path.getsize(cached)
+            on_progress(size, size)
+        # 之前可能有下了一半的 .part，用不上了
+        get_manifest(self.save_dir).remove(fname)
+        METRICS.inc("audio_cache_total", ("download", "hit"))
+        return True
+
+    async def _finish(self, url, fname, meta):
+        # 下载完成后的收尾：后处理 (不占下载名额) 后登记曲库，后处理算过哈希就不再重读文件
+        path = os.path.join(self.save_dir, fname)
+        sha256 = None
+        if self.postprocessor is not None:
+            title, author = meta or track_meta(fname)
+            result = await self.postprocessor.process(path, url, title, author)
+            if not result["ok"]:
+                print(f"{fname} 未通过校验: {result['error']}")
+                try:
+                    os.remove(result["path"])
+                except OSError:
+                    pass
+                return False
+            path, sha256 = result["path"], result.get("sha256")
+        if self.library is not None:
+            # 登记到曲库 (需要算哈希时要读文件，放到线程池里做)
+            try:
+                await asyncio.to_thread(self.library.add, path, url, fname, sha256)
+            except (OSError, sqlite3.Error) as e:
+                print(f"曲库登记失败: {e}")
+        return True
+
+    async def download(self, url, fname, meta=None):
+        # meta 为 (歌名, 歌手)，用于写标签；不给时从文件名 "歌名 - 歌手.mp3" 还原
+        if meta is None:
+            meta = track_meta(fname)
+        fname, lock = self._claim(url, fname)
+        try:
+            async with lock:
+                return await self._download_tracked(url, fname, meta)
+        finally:
+            self._release(fname)
+
+    async def _download_tracked(self, url, fname, meta):
+        if self.progress is None:
+            return await self._download(url, fname, meta, None)
+        key = os.path.join(self.save_dir, fname)
+
+        def on_progress(done, total):
+            self.progress.update(key, done, total)
+
+        self.progress.begin(key, fname)
+        res = None
+        try:
+            res = await self._download(url, fname, meta, on_progress)
+        finally:
+            # 被暂停/取消时 res 为 None，不算成功也不算失败
+            self.progress.end(key, res)
+        return res
+
+    async def _download(self, url, fname, meta, on_progress):
+        if self._headers is None:
+            self._headers, _ = await page_parm("")
+        res = await self._copy_from_cache(url, fname, on_progress)
+        if not res:
+            # 先占主机名额再占总名额，避免同一主机的任务把总名额占满后干等
+            limiter = self._host_limiters.get(url)
+            async with limiter:
+                async with self._global_sem:
+                    res = await download_single_music(url, fname, self._headers, self.save_dir,
+                                                      session=self.session, limiter=limiter,
+                                                      on_progress=on_progress)
+
+        if res:
+            res = await self._finish(url, fname, meta)
+        if res:
+            self.success_count += 1
+        else:
+            self.fail_count += 1
+        return bool(res)
+
+
+def _copy_file(src, dst):
+    # 先复制到 .part 再改名，和网络下载一样不会留下半个文件
+    part_path = dst + ".part"
+    shutil.copyfile(src, part_path)
+    os.replace(part_path, dst)
+
+
+# 批量下载：tasks 为 [(标识, url, 文件名)]，任务乱序完成
+# 每完成一个回调 on_item_done(标识, 是否成功, 已完成数, 总数)；返回 (成功数, 失败数)
+async def download_batch(tasks, save_dir, session=None, max_concurrency=MAX_CONCURRENT_DOWNLOADS,
+                         per_host_limit=MAX_DOWNLOADS_PER_HOST, library=None, on_item_done=None, postprocessor=None,
+                         progress=None):
+    done_count = 0
+    total = len(tasks)
+
+    async with _session_scope(session) as session:
+        downloader = BatchDownloader(save_dir, session, max_concurrency, per_host_limit, library,
+                                     postprocessor=postprocessor, progress=progress)
+
+        async def _download_one(key, url, fname):
+            nonlocal done_count
+            ok = await downloader.download(url, fname)
+            done_count += 1
+            if on_item_done is not None:
+                on_item_done(key, ok, done_count, total)
+
+        await asyncio.gather(*(_download_one(key, url, fname) for key, url, fname in tasks))
+    return downloader.success_count, downloader.fail_count
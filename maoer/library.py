@@ -0,0 +1,110 @@
+"""本地曲库索引"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+from .config import LIBRARY_DB, AUDIO_EXTENSIONS, DOWNLOAD_CHUNK_SIZE
+
+
+def normalize_track_name(name):
+    # "Title - Author.mp3" -> "title - author"，忽略大小写、扩展名和多余空白
+    stem, ext = os.path.splitext(name)
+    if ext.lower() in AUDIO_EXTENSIONS:
+        name = stem
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+def file_sha256(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LibraryIndex:
+    """已下载曲目的索引 (SQLite)：来源 URL / 规范化歌名 -> 文件路径、大小、内容哈希"""
+
+    def __init__(self, db_path=LIBRARY_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    path TEXT PRIMARY KEY, url TEXT, name_key TEXT,
+                    size INTEGER, mtime REAL, sha256 TEXT);
+                CREATE INDEX IF NOT EXISTS tracks_url ON tracks (url);
+                CREATE INDEX IF NOT EXISTS tracks_name ON tracks (name_key);
+            """)
+        return self._db
+
+    def add(self, path, url=None, name=None, sha256=None):
+        # 下载完成后登记；没有给出 sha256 时会读整个文件算哈希，不要在界面线程里调用
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        sha = sha256 or file_sha256(path)
+        name_key = normalize_track_name(name or os.path.basename(path))
+        with self._lock:
+            db = self._conn()
+            if url is None:
+                # 重新扫描时保留之前登记的来源 URL
+                row = db.execute("SELECT url FROM tracks WHERE path = ?", (path,)).fetchone()
+                url = row[0] if row else None
+            db.execute("INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?)",
+                       (path, url, name_key, st.st_size, st.st_mtime, sha))
+            db.commit()
+
+    def scan(self, directory):
+        # 增量重建：只重新哈希新增或改动过的文件，清掉已经不存在的记录
+        directory = os.path.abspath(directory)
+        if not os.path.isdir(directory): return 0, 0
+        with self._lock:
+            known = {row[0]: (row[1], row[2]) for row in self._conn().execute(
+                "SELECT path, size, mtime FROM tracks") if os.path.dirname(row[0]) == directory}
+
+        updated = 0
+        present = set()
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not entry.name.lower().endswith(AUDIO_EXTENSIONS): continue
+            path = os.path.abspath(entry.path)
+            present.add(path)
+            st = entry.stat()
+            if known.get(path) == (st.st_size, st.st_mtime): continue
+            try:
+                self.add(path)
+                updated += 1
+            except OSError as e:
+                print(f"曲库索引跳过 {path}: {e}")
+
+        removed = [path for path in known if path not in present]
+        if removed:
+            with self._lock:
+                db = self._conn()
+                db.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in removed])
+                db.commit()
+        return updated, len(removed)
+
+    def find(self, url=None, name=None, directory=None):
+        # 按来源 URL 或规范化歌名查找已有文件，返回路径；文件已被删掉的不算
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT path FROM tracks WHERE url = ? OR name_key = ?",
+                (url, normalize_track_name(name) if name else None)).fetchall()
+        prefix = os.path.join(os.path.abspath(directory), "") if directory else ""
+        for (path,) in rows:
+            if path.startswith(prefix) and os.path.exists(path):
+                return path
+        return None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,233 @@
+"""网络请求统计：基于 aiohttp TraceConfig 记录每个请求各阶段耗时、字节数、状态码和失败原因"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import aiohttp
+
+# 耗时直方图的桶边界 (毫秒)
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+# 各阶段：DNS 解析 / 等待连接池 / 建立连接 (TCP + TLS) / 首字节 / 数据传输
+PHASES = ("dns", "queue", "connect", "ttfb", "transfer")
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS_MS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        # 按桶估算分位数，返回所在桶的上界
+        if not self.count: return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else float("inf")
+        return float("inf")
+
+
+class NetworkMetrics:
+    """按请求类型 (search / probe / download ...) 汇总的计数器和耗时直方图，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._counters = defaultdict(int)  # (指标名, (标签...)) -> 数值
+            self._histograms = defaultdict(_Histogram)  # (类型, 阶段) -> 直方图
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[(name, labels)] += value
+
+    def observe(self, kind, phase, ms):
+        with self._lock:
+            self._histograms[(kind, phase)].observe(ms)
+
+    def failure(self, kind, reason):
+        # reason 可以是简短的原因字符串，也可以是异常 (优先取异常的 reason 属性，否则用异常类名)
+        if isinstance(reason, BaseException):
+            reason = getattr(reason, "reason", None) or type(reason).__name__
+        self.inc("failures_total", (kind, str(reason)))
+
+    def success(self, kind):
+        self.inc("success_total", (kind,))
+
+    def snapshot(self):
+        with self._lock:
+            kinds = {}
+
+            def _kind(name):
+                return kinds.setdefault(name, {"requests": {}, "failures": {}, "success": 0, "bytes": 0,
+                                               "connections_created": 0, "connections_reused": 0,
+                                               "dns_cache_hits": 0, "retries": 0, "concurrency_decreases": 0,
+                                               "hedges": 0, "bandwidth_waits": 0, "providers": {}, "phases_ms": {}})
+
+            for (name, labels), value in self._counters.items():
+                entry = _kind(labels[0])
+                if name == "requests_total":
+                    entry["requests"][labels[1]] = value
+                elif name == "failures_total":
+                    entry["failures"][labels[1]] = value
+                elif name == "success_total":
+                    entry["success"] = value
+                elif name == "bytes_received_total":
+                    entry["bytes"] = value
+                elif name in ("connections_created_total", "connections_reused_total", "dns_cache_hits_total",
+                              "retries_total", "concurrency_decreases_total", "hedges_total",
+                              "bandwidth_waits_total"):
+                    entry[name[:-len("_total")]] = value
+                elif name == "provider_search_total":
+                    entry["providers"].setdefault(labels[1], {})[labels[2]] = value
+            for (kind, phase), hist in self._histograms.items():
+                _kind(kind)["phases_ms"][phase] = {
+                    "count": hist.count, "mean": round(hist.total / hist.count, 2) if hist.count else None,
+                    "p50": hist.quantile(0.5), "p90": hist.quantile(0.9), "p99": hist.quantile(0.99)}
+            return {"since": self.started, "uptime_s": round(time.time() - self.started, 1), "kinds": kinds}
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            by_name = defaultdict(list)
+            for (name, labels), value in sorted(self._counters.items()):
+                by_name[name].append((labels, value))
+            label_names = {"requests_total": ("kind", "status"), "failures_total": ("kind", "reason"),
+                           "audio_cache_total": ("kind", "result"),
+                           "provider_search_total": ("kind", "provider", "result")}
+            for name, rows in by_name.items():
+                lines.append(f"# TYPE maoer_{name} counter")
+                keys = label_names.get(name, ("kind",))
+                for labels, value in rows:
+                    rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(keys, labels))
+                    lines.append(f"maoer_{name}{{{rendered}}} {value}")
+
+            if self._histograms:
+                lines.append("# TYPE maoer_phase_ms histogram")
+            for (kind, phase), hist in sorted(self._histograms.items()):
+                base = f'kind="{_escape(kind)}",phase="{phase}"'
+                cumulative = 0
+                for bound, n in zip(list(BUCKETS_MS) + ["+Inf"], hist.counts):
+                    cumulative += n
+                    lines.append(f'maoer_phase_ms_bucket{{{base},le="{bound}"}} {cumulative}')
+                lines.append(f"maoer_phase_ms_sum{{{base}}} {round(hist.total, 3)}")
+                lines.append(f"maoer_phase_ms_count{{{base}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # .prom / .txt 导出为 Prometheus 文本格式，其余导出为 JSON
+        if path.endswith((".prom", ".txt")):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# 默认的全局统计，make_session 创建的会话都会记录到这里
+METRICS = NetworkMetrics()
+
+
+# 这些类型用 content.iter_chunked()/read(n) 流式读取，不会触发 on_response_chunk_received，
+# 收到的字节数由读取处自己记 (bytes_received_total)，trace 钩子里跳过以免重复
+STREAMED_KINDS = ("download", "probe", "preview")
+
+
+def _kind_of(ctx):
+    request_ctx = ctx.trace_request_ctx
+    return request_ctx.get("kind", "other") if isinstance(request_ctx, dict) else "other"
+
+
+def make_trace_config(metrics=METRICS):
+    # 请求时通过 trace_request_ctx={"kind": "..."} 标注类型
+    trace = aiohttp.TraceConfig()
+
+    def _ms(since):
+        return (time.perf_counter() - since) * 1000
+
+    async def on_request_start(session, ctx, params):
+        ctx.kind = _kind_of(ctx)
+        ctx.start = ctx.sent = time.perf_counter()
+
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_start = time.perf_counter()
+
+    async def on_dns_end(session, ctx, params):
+        metrics.observe(_kind_of(ctx), "dns", _ms(ctx.dns_start))
+
+    async def on_dns_cache_hit(session, ctx, params):
+        metrics.inc("dns_cache_hits_total", (_kind_of(ctx),))
+
+    async def on_queued_start(session, ctx, params):
+        ctx.queued = time.perf_counter()
+
+    async def on_queued_end(session, ctx, params):
+        metrics.observe(_kind_of(ctx), "queue", _ms(ctx.queued))
+
+    async def on_connect_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connect_end(session, ctx, params):
+        metrics.observe(_kind_of(ctx), "connect", _ms(ctx.connect_start))
+        metrics.inc("connections_created_total", (_kind_of(ctx),))
+
+    async def on_reuse(session, ctx, params):
+        metrics.inc("connections_reused_total", (_kind_of(ctx),))
+
+    async def on_headers_sent(session, ctx, params):
+        ctx.sent = time.perf_counter()
+
+    async def on_request_end(session, ctx, params):
+        # 收到响应头即触发：从发出请求到此刻就是首字节时间
+        metrics.observe(ctx.kind, "ttfb", _ms(ctx.sent))
+        metrics.inc("requests_total", (ctx.kind, str(params.response.status)))
+
+    async def on_chunk(session, ctx, params):
+        # 只有 res.read()/text()/json() 读整个响应体时才会触发，搜索请求就是这样读的
+        kind = _kind_of(ctx)
+        if kind not in STREAMED_KINDS:
+            metrics.inc("bytes_received_total", (kind,), len(params.chunk))
+
+    async def on_exception(session, ctx, params):
+        # 失败原因由调用方按业务结果记录 (metrics.failure)，这里只计请求数，避免重复
+        metrics.inc("requests_total", (_kind_of(ctx), "error"))
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_dns_resolvehost_start.append(on_dns_start)
+    trace.on_dns_resolvehost_end.append(on_dns_end)
+    trace.on_dns_cache_hit.append(on_dns_cache_hit)
+    trace.on_connection_queued_start.append(on_queued_start)
+    trace.on_connection_queued_end.append(on_queued_end)
+    trace.on_connection_create_start.append(on_connect_start)
+    trace.on_connection_create_end.append(on_connect_end)
+    trace.on_connection_reuseconn.append(on_reuse)
+    trace.on_request_headers_sent.append(on_headers_sent)
+    trace.on_request_end.append(on_request_end)
+    trace.on_response_chunk_received.append(on_chunk)
+    trace.on_request_exception.append(on_exception)
+    return trace
@@ -0,0 +1,28 @@
+"""共享连接池"""
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from .config import (SESSION_CONN_LIMIT, SESSION_CONN_PER_HOST, DNS_CACHE_TTL, KEEPALIVE_TIMEOUT, CONNECT_TIMEOUT,
+                     READ_TIMEOUT)
+from .metrics import make_trace_config
+
+
+def make_session():
+    # 长连接 + DNS 缓存，同一主机的请求复用 TCP/TLS 连接
+    connector = aiohttp.TCPConnector(limit=SESSION_CONN_LIMIT, limit_per_host=SESSION_CONN_PER_HOST,
+                                     ttl_dns_cache=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    # 大文件下载可能持续很久，不设总超时，只限制连接和读取
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    # 每个请求的各阶段耗时、字节数、状态码都记录到 metrics.METRICS
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[make_trace_config()])
+
+
+@asynccontextmanager
+async def _session_scope(session):
+    # 传入了共享 session 就直接用，否则临时建一个用完关闭
+    if session is not None:
+        yield session
+        return
+    async with make_session() as own_session:
+        yield own_session
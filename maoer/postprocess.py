@@ -0,0 +1,303 @@
+"""下载后处理：完整性校验、写入标签、计算哈希，以及可选的响度归一和转码
+
+各步骤都是模块级函数，在进程池 (spawn 方式启动) 里按顺序执行，CPU 密集的工作不会卡住网络线程和界面。
+步骤函数接收一个 job 字典 (path、url、title、author、options 以及前面步骤的结果)，
+返回要合并进 job 的字典；抛出 StepSkipped 表示跳过，抛出 PostProcessError 表示文件不可用，后续步骤不再执行。
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .config import (POSTPROCESS_WORKERS, POSTPROCESS_STEPS, FFMPEG, LOUDNESS_TARGET, TRANSCODE_FORMAT,
+                     TRANSCODE_BITRATE, AUDIO_EXTENSIONS)
+from .library import file_sha256
+from .metrics import METRICS
+from .probe import SNIFF_MIN_BYTES, sniff_audio, looks_like_html
+
+try:
+    import mutagen
+except ImportError:
+    # 没装 mutagen 时校验只看文件头，标签只能写 MP3 (自带的简易 ID3 写入)
+    mutagen = None
+
+
+class PostProcessError(Exception):
+    """文件本身有问题 (不是音频、被截断等)，这次下载应当算失败；reason 是用于统计的简短原因"""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class StepSkipped(Exception):
+    """条件不满足 (缺少依赖、格式不适用等)，跳过这一步"""
+
+
+def track_meta(filename):
+    # "歌名 - 歌手.mp3" -> (歌名, 歌手)；下载队列只记录文件名，标签信息从这里还原
+    stem = os.path.splitext(filename)[0] if filename.lower().endswith(AUDIO_EXTENSIONS) else filename
+    title, sep, author = stem.rpartition(" - ")
+    return (title, author) if sep else (stem, "")
+
+
+def _syncsafe(data):
+    # ID3v2 的 syncsafe 整数：每字节只用低 7 位
+    size = 0
+    for b in data:
+        size = (size << 7) | (b & 0x7F)
+    return size
+
+
+def _to_syncsafe(size):
+    return bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def _id3_size(header):
+    # ID3v2 标签头 10 字节 + 标签内容，有脚注时再加 10 字节
+    return _syncsafe(header[6:10]) + 10 + (10 if header[5] & 0x10 else 0)
+
+
+# ---------------- 步骤 ----------------
+def verify_audio(job):
+    path = job["path"]
+    size = os.path.getsize(path)
+    if size < SNIFF_MIN_BYTES:
+        raise PostProcessError("too_small", "文件太小")
+    with open(path, "rb") as f:
+        head = f.read(64)
+        fmt = sniff_audio(head)
+        if fmt is None:
+            if looks_like_html(head):
+                raise PostProcessError("html", "内容是网页")
+            raise PostProcessError("not_audio", "不是可识别的音频")
+        if head.startswith(b"ID3") and fmt == "mp3":
+            # ID3 标签后面必须紧跟 MPEG 帧，否则只是套了个标签的坏文件
+            f.seek(_id3_size(head))
+            sync = f.read(2)
+            if len(sync) < 2 or sync[0] != 0xFF or sync[1] & 0xE0 != 0xE0:
+                raise PostProcessError("no_frames", "标签后没有音频数据")
+    result = {"format": fmt, "size": size}
+    if mutagen is not None:
+        try:
+            audio = mutagen.File(path)
+        except mutagen.MutagenError as e:
+            raise PostProcessError("unparsable", f"无法解析: {e}")
+        if audio is None:
+            raise PostProcessError("unparsable", "无法解析")
+        if getattr(audio.info, "length", None):
+            result["duration"] = round(audio.info.length, 3)
+    return result
+
+
+def _id3_text_frame(frame_id, text, version):
+    # 文本帧：编码 1 = 带 BOM 的 UTF-16；帧大小在 v2.4 里是 syncsafe，v2.3 里是普通整数
+    data = b"\x01" + text.encode("utf-16")
+    size = _to_syncsafe(len(data)) if version == 4 else len(data).to_bytes(4, "big")
+    return frame_id + size + b"\x00\x00" + data
+
+
+def _id3_frames(data, version):
+    # 拆出标签里的各帧 [(帧 ID, 帧的原始字节)]，遇到填充 (0 字节) 为止
+    frames, pos = [], 0
+    while pos + 10 <= len(data) and data[pos] != 0:
+        size = data[pos + 4:pos + 8]
+        end = pos + 10 + (_syncsafe(size) if version == 4 else int.from_bytes(size, "big"))
+        frames.append((data[pos:pos + 4], data[pos:end]))
+        pos = end
+    return frames
+
+
+def _write_id3_fallback(path, title, author):
+    # 不依赖 mutagen 的 ID3v2.3/2.4 标签写入：替换歌名 (TIT2)、歌手 (TPE1)，其它帧 (封面等) 原样保留
+    version, old, audio_start = 3, b"", 0
+    with open(path, "rb") as f:
+        header = f.read(10)
+        if header.startswith(b"ID3"):
+            version = header[3]
+            if version not in (3, 4) or header[5] & 0xC0:
+                # 不同步编码、扩展头等少见格式不自己处理
+                raise StepSkipped("标签格式特殊，修改需要安装 mutagen")
+            old = f.read(_syncsafe(header[6:10]))
+            audio_start = _id3_size(header)
+    # 只替换有新值的帧；歌手为空时原来的 TPE1 保留
+    new = {fid: text for fid, text in ((b"TIT2", title), (b"TPE1", author)) if text}
+    frames = b"".join(_id3_text_frame(fid, text, version) for fid, text in new.items())
+    frames += b"".join(raw for fid, raw in _id3_frames(old, version) if fid not in new)
+    # 标签在文件开头，只能整个重写：先写临时文件再替换
+    tmp = path + ".tag"
+    with open(path, "rb") as src, open(tmp, "wb") as dst:
+        dst.write(b"ID3" + bytes((version, 0, 0)) + _to_syncsafe(len(frames)) + frames)
+        src.seek(audio_start)
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp, path)
+
+
+def write_tags(job):
+    title, author = job.get("title") or "", job.get("author") or ""
+    if not title and not author:
+        raise StepSkipped("没有歌名和歌手信息")
+    path = job["path"]
+    if mutagen is None:
+        if job.get("format", "mp3") != "mp3":
+            raise StepSkipped("非 MP3 文件写标签需要安装 mutagen")
+        _write_id3_fallback(path, title, author)
+        return {"tagged": True}
+    audio = mutagen.File(path, easy=True)
+    if audio is None:
+        raise StepSkipped("mutagen 不支持这种格式")
+    if audio.tags is None:
+        audio.add_tags()
+    if title: audio["title"] = title
+    if author: audio["artist"] = author
+    audio.save()
+    return {"tagged": True}
+
+
+def _ffmpeg(job):
+    ffmpeg = shutil.which(job["options"].get("ffmpeg") or FFMPEG)
+    if ffmpeg is None:
+        raise StepSkipped("没有找到 ffmpeg")
+    return ffmpeg
+
+
+def _run_ffmpeg(ffmpeg, src, dst, *args):
+    # 输出格式由 dst 的扩展名决定；保留原来的标签
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-y", "-i", src, "-map_metadata", "0", "-vn", *args]
+    if dst.lower().endswith(".mp3"):
+        cmd += ["-id3v2_version", "3"]
+    try:
+        subprocess.run(cmd + [dst], capture_output=True, check=True, timeout=600)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(e.stderr.decode("utf-8", "replace").strip() or f"ffmpeg 退出码 {e.returncode}")
+    finally:
+        if os.path.exists(dst) and os.path.getsize(dst) == 0:
+            os.remove(dst)
+
+
+def normalize_loudness(job):
+    # 单遍 loudnorm 滤镜，把整体响度调到目标值；需要重新编码
+    ffmpeg = _ffmpeg(job)
+    path = job["path"]
+    stem, ext = os.path.splitext(path)
+    tmp = stem + ".loudnorm" + ext
+    target = job["options"].get("loudness_target", LOUDNESS_TARGET)
+    bitrate = job["options"].get("bitrate", TRANSCODE_BITRATE)
+    _run_ffmpeg(ffmpeg, path, tmp, "-af", f"loudnorm=I={target}:TP=-1.5:LRA=11", "-b:a", bitrate)
+    os.replace(tmp, path)
+    return {"loudness_target": target}
+
+
+def transcode(job):
+    # 转成统一格式，文件扩展名随之改变，后续步骤和曲库登记使用新路径
+    ffmpeg = _ffmpeg(job)
+    fmt = job["options"].get("transcode_format", TRANSCODE_FORMAT).lstrip(".").lower()
+    path = job["path"]
+    stem, ext = os.path.splitext(path)
+    if ext.lower() == "." + fmt:
+        raise StepSkipped(f"已经是 {fmt}")
+    tmp = stem + ".transcode." + fmt
+    _run_ffmpeg(ffmpeg, path, tmp, "-b:a", job["options"].get("bitrate", TRANSCODE_BITRATE))
+    new_path = stem + "." + fmt
+    os.replace(tmp, new_path)
+    os.remove(path)
+    return {"path": new_path, "format": fmt}
+
+
+def compute_hash(job):
+    return {"sha256": file_sha256(job["path"]), "size": os.path.getsize(job["path"])}
+
+
+# 步骤名 -> 函数；自定义步骤用 register_step 登记 (函数必须能在模块顶层导入，工作进程才能找到)
+STEPS = {
+    "verify": verify_audio,
+    "tags": write_tags,
+    "loudnorm": normalize_loudness,
+    "transcode": transcode,
+    "hash": compute_hash,
+}
+
+
+def register_step(name, func):
+    STEPS[name] = func
+
+
+def run_pipeline(job, steps):
+    # 在工作进程里执行：steps 为 [(名称, 函数)]；返回 job 加上各步骤结果、状态 (steps) 和耗时 (timings, 毫秒)
+    # 文件不可用时 ok 为 False，error 是给人看的说明，reason 是用于统计的简短原因
+    result = dict(job, ok=True, steps={}, timings={})
+    for name, func in steps:
+        started = time.perf_counter()
+        try:
+            result.update(func(result) or {})
+            status = "ok"
+        except StepSkipped as e:
+            status = f"skipped: {e}"
+        except PostProcessError as e:
+            result["ok"] = False
+            result["error"] = str(e)
+            result["reason"] = e.reason
+            result["steps"][name] = f"failed: {e}"
+            break
+        except Exception as e:
+            # 标签、转码之类的失败不影响文件本身，记下原因继续
+            status = f"error: {e}"
+        finally:
+            result["timings"][name] = round((time.perf_counter() - started) * 1000, 1)
+        result["steps"][name] = status
+    return result
+
+
+class PostProcessor:
+    """下载后处理流水线：文件下载完成后交给它，在进程池里依次执行各步骤
+
+    同时交给进程池的任务数有上限 (工作进程数的两倍)，处理跟不上下载时下载任务在这里排队等待。
+    必须在同一个事件循环里使用；close() 可以在任意线程调用。
+    """
+
+    def __init__(self, steps=POSTPROCESS_STEPS, max_workers=POSTPROCESS_WORKERS, options=None):
+        # steps 里可以是步骤名，也可以直接是模块级函数
+        self.steps = [(step, STEPS[step]) if isinstance(step, str) else (step.__name__, step) for step in steps]
+        self.max_workers = max(1, max_workers)
+        self.options = dict(options or {})
+        self._pool = None
+        self._slots = None
+
+    def _executor(self):
+        # 首次使用时才启动工作进程；用 spawn，不把网络线程、Qt 的状态 fork 到子进程里
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def process(self, path, url=None, title=None, author=None):
+        if not self.steps:
+            return {"path": path, "ok": True, "steps": {}}
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers * 2)
+        job = {"path": path, "url": url, "title": title, "author": author, "options": self.options}
+        async with self._slots:
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor(), run_pipeline, job,
+                                                                          self.steps)
+            except BrokenProcessPool as e:
+                # 工作进程意外退出：丢掉这个池子下次重建，这个文件当作没处理过
+                print(f"后处理进程异常退出: {e}")
+                METRICS.failure("postprocess", "broken_pool")
+                self._pool = None
+                return {"path": path, "ok": True, "steps": {}}
+        for name, ms in result["timings"].items():
+            METRICS.observe("postprocess", name, ms)
+        if result["ok"]:
+            METRICS.success("postprocess")
+        else:
+            METRICS.failure("postprocess", result["reason"])
+        return result
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
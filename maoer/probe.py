@@ -0,0 +1,184 @@
+"""音频链接校验：用一个小的 Range GET 取文件头嗅探格式，顺带拿到文件长度和 Range 支持，结果按 URL 缓存给下载复用"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from .bandwidth import BANDWIDTH
+from .config import (PROBE_MODE, PROBE_SNIFF_BYTES, PROBE_CACHE_TTL, PROBE_CACHE_SIZE, SESSION_CONN_PER_HOST,
+                     PROBE_CONNECT_TIMEOUT, PROBE_READ_TIMEOUT, PROBE_RETRY_ATTEMPTS, RETRY_BASE_DELAY,
+                     RETRY_MAX_DELAY)
+from .metrics import METRICS
+from .retry import RETRY_STATUSES, RetryPolicy, HostLimiters, parse_retry_after
+
+# 嗅探至少需要的字节数 (M4A 的 ftyp 在第 4~8 字节，WAV 的 WAVE 在第 8~12 字节)
+SNIFF_MIN_BYTES = 12
+
+
+def sniff_audio(data):
+    # 按文件头判断音频格式，返回 "mp3"/"flac"/"ogg"/"m4a"/"wav"/"aac"，不像音频返回 None
+    if data.startswith(b"ID3"):
+        return "mp3"
+    if data.startswith(b"fLaC"):
+        return "flac"
+    if data.startswith(b"OggS"):
+        return "ogg"
+    if data[4:8] == b"ftyp":
+        return "m4a"
+    if data.startswith(b"RIFF") and data[8:12] == b"WAVE":
+        return "wav"
+    if len(data) >= 2 and data[0] == 0xFF:
+        if data[1] & 0xF6 == 0xF0:
+            return "aac"  # ADTS 帧头
+        if data[1] & 0xE0 == 0xE0:
+            return "mp3"  # MPEG 帧同步
+    return None
+
+
+def looks_like_html(data):
+    head = data.lstrip()[:64].lower()
+    return head.startswith((b"<!doctype", b"<html", b"<?xml", b"<head", b"<body"))
+
+
+def parse_content_range(value):
+    # "bytes 100-199/1000" -> (100, 1000)；总长未知时为 None
+    try:
+        unit, rng = value.split(" ", 1)
+        span, total = rng.split("/", 1)
+        start = int(span.split("-", 1)[0])
+        return start, (None if total.strip() == "*" else int(total))
+    except (ValueError, AttributeError):
+        return None, None
+
+
+class ProbeCache:
+    """链接校验结果的内存缓存：URL -> {ok, format, length, ranges, content_type}，过期时间 ttl 秒"""
+
+    def __init__(self, ttl=PROBE_CACHE_TTL, max_items=PROBE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()  # url -> (写入时间, 结果)
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            hit = self._items.get(url)
+            if hit is None: return None
+            if time.time() - hit[0] >= self.ttl:
+                del self._items[url]
+                return None
+            self._items.move_to_end(url)
+            return dict(hit[1])
+
+    def put(self, url, info):
+        with self._lock:
+            self._items[url] = (time.time(), dict(info))
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# 全局的校验结果缓存，搜索和下载共用
+PROBE_CACHE = ProbeCache()
+
+# 校验用的超时、重试策略和按主机的自适应并发
+PROBE_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=PROBE_CONNECT_TIMEOUT, sock_read=PROBE_READ_TIMEOUT)
+PROBE_RETRY = RetryPolicy(PROBE_RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+PROBE_LIMITERS = HostLimiters(SESSION_CONN_PER_HOST, kind="probe")
+
+
+def _rejected(reason):
+    METRICS.failure("probe", reason)
+    return {"ok": False, "reason": reason}
+
+
+async def _check_range(res, sniff_bytes):
+    # Range GET：读开头几个字节嗅探格式；服务器忽略 Range 回了整个文件也只读这一点就断开
+    if res.status == 206:
+        length = parse_content_range(res.headers.get("Content-Range"))[1]
+        ranges = True
+    else:
+        length = res.content_length
+        ranges = res.headers.get("Accept-Ranges", "").lower() == "bytes"
+    head = b""
+    while len(head) < sniff_bytes:
+        chunk = await res.content.read(sniff_bytes - len(head))
+        if not chunk: break
+        head += chunk
+    if res.status == 200:
+        res.close()
+    METRICS.inc("bytes_received_total", ("probe",), len(head))
+    await BANDWIDTH.throttle(len(head), "probe")
+    fmt = sniff_audio(head)
+    if fmt is None:
+        # Content-Type 写着音频，内容却是网页之类的，照样拒绝
+        return _rejected("html" if looks_like_html(head) else "not_audio")
+    return {"ok": True, "format": fmt, "length": length, "ranges": ranges}
+
+
+async def _probe_once(session, url, headers, limiter, mode, sniff_bytes):
+    # 返回 (结果, 可重试时服务器要求的等待秒数)；需要重试时结果为 None；网络错误直接抛出
+    async with limiter:
+        started = time.perf_counter()
+        if mode == "range":
+            request = session.get(url, headers={**headers, "Range": f"bytes=0-{sniff_bytes - 1}"},
+                                  timeout=PROBE_TIMEOUT, allow_redirects=True, trace_request_ctx={"kind": "probe"})
+        else:
+            request = session.head(url, headers=headers, timeout=PROBE_TIMEOUT, allow_redirects=True,
+                                   trace_request_ctx={"kind": "probe"})
+        try:
+            async with request as res:
+                limiter.record(res.status, time.perf_counter() - started)
+                content_type = res.headers.get('Content-Type', '').lower()
+                if 'text/html' in content_type:
+                    return _rejected("html"), None
+                if res.status in RETRY_STATUSES:
+                    METRICS.failure("probe", f"status_{res.status}")
+                    return None, parse_retry_after(res.headers.get("Retry-After"))
+                if res.status not in ((200, 206) if mode == "range" else (200,)):
+                    return _rejected(f"status_{res.status}"), None
+                if mode == "range":
+                    info = await _check_range(res, sniff_bytes)
+                else:
+                    info = {"ok": True, "format": None, "length": res.content_length,
+                            "ranges": res.headers.get("Accept-Ranges", "").lower() == "bytes"}
+                info["content_type"] = content_type
+                return info, None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            limiter.record(error=True)
+            raise
+
+
+# mode="range" (默认) 用 Range GET 嗅探文件头；"head" 只发 HEAD 看响应头
+# 有效返回 item，无效返回 None；结果写入 cache，use_cache=False 时不读旧结果
+async def is_valid_audio(session, item, headers, retry=PROBE_RETRY, limiters=PROBE_LIMITERS, mode=PROBE_MODE,
+                         cache=PROBE_CACHE, use_cache=True, sniff_bytes=PROBE_SNIFF_BYTES):
+    url = item.get("url", "")
+    if not url: return None
+    if cache is not None and use_cache:
+        cached = cache.get(url)
+        if cached is not None:
+            return item if cached["ok"] else None
+
+    limiter = limiters.get(url)
+    for attempt in range(retry.attempts):
+        try:
+            info, retry_after = await _probe_once(session, url, headers, limiter, mode, sniff_bytes)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            METRICS.failure("probe", e)
+            info, retry_after = None, None
+        if info is not None:
+            if info["ok"]: METRICS.success("probe")
+            if cache is not None: cache.put(url, info)
+            return item if info["ok"] else None
+        # 超时、连接失败、429/5xx：退避后再试 (这类临时失败不写缓存)
+        if attempt + 1 < retry.attempts:
+            METRICS.inc("retries_total", ("probe",))
+            await asyncio.sleep(retry.delay(attempt, retry_after))
+    return None
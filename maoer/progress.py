@@ -0,0 +1,141 @@
+"""下载进度：按字节统计每个文件和全部进行中传输的进度、平均速度和剩余时间，合并高频更新后限速通知"""
+import asyncio
+import math
+import time
+
+from .config import PROGRESS_MAX_RATE, PROGRESS_RATE_WINDOW
+
+
+class _Entry:
+    __slots__ = ("name", "done", "total", "rate", "last_done", "started")
+
+    def __init__(self, name):
+        self.name = name
+        self.done = 0
+        self.total = None
+        self.rate = 0.0
+        self.last_done = 0
+        self.started = False  # 收到过数据 (或已知大小) 才算开始传输，之前是在排队等名额
+
+
+class ProgressTracker:
+    """汇总所有进行中下载的字节进度
+
+    下载过程中每收到一块数据就调用 update(键, 已完成字节, 总字节)，这很频繁；
+    on_update(快照) 最多每秒调用 max_rate 次，两次之间的更新合并成一次，最后的状态一定会通知到。
+    有传输进行时即使没有新数据也每秒通知一次，让速度能降下来、界面能看出卡住了。
+    必须在事件循环线程里使用；on_update 也在事件循环线程里调用。
+    """
+
+    def __init__(self, on_update=None, max_rate=PROGRESS_MAX_RATE, window=PROGRESS_RATE_WINDOW):
+        self.on_update = on_update
+        self.interval = 1 / max(1, max_rate)
+        self.window = window
+        self.rate = 0.0  # 总速度 (字节/秒)，指数加权平均
+        self.completed_files = 0
+        self.completed_bytes = 0
+        self._entries = {}
+        self._received = 0  # 累计收到的字节数，用来算速度
+        self._sampled = 0
+        self._last_sample = time.monotonic()
+        self._last_emit = 0.0
+        self._timer = None
+        self._timer_at = 0.0
+
+    def begin(self, key, name=None):
+        self._entries[key] = _Entry(name or key)
+        self._changed()
+
+    def update(self, key, done, total=None):
+        entry = self._entries.get(key)
+        if entry is None: return
+        # 断点续传时起点不为 0；服务器不支持续传、从头再来时 done 会变小，都不算新收到的数据
+        if entry.started and done > entry.done:
+            self._received += done - entry.done
+        else:
+            entry.last_done = done
+        entry.started = True
+        entry.done = done
+        if total is not None:
+            entry.total = total
+        self._changed()
+
+    def end(self, key, ok=None):
+        # ok=True 成功，False 失败，None 被中断 (暂停/取消)；之后不再计入进行中的传输
+        entry = self._entries.pop(key, None)
+        if entry is None: return
+        if ok:
+            self.completed_files += 1
+            self.completed_bytes += entry.total or entry.done
+        self._changed()
+
+    def reset(self):
+        # 一轮下载结束后清零完成统计
+        self.completed_files = 0
+        self.completed_bytes = 0
+
+    def snapshot(self):
+        files = {}
+        done = total = 0
+        unknown = 0
+        for key, entry in self._entries.items():
+            if not entry.started: continue
+            files[key] = {"name": entry.name, "done": entry.done, "total": entry.total, "rate": entry.rate,
+                          "eta": self._eta(entry.total - entry.done, entry.rate) if entry.total else None}
+            done += entry.done
+            if entry.total:
+                total += entry.total
+            else:
+                unknown += 1
+        return {"files": files, "active": len(files), "waiting": len(self._entries) - len(files),
+                "done_bytes": done, "total_bytes": total, "unknown_sizes": unknown, "rate": self.rate,
+                # 只有进行中的传输大小都已知时才给剩余时间
+                "eta": self._eta(total - done, self.rate) if files and not unknown else None,
+                "completed_files": self.completed_files, "completed_bytes": self.completed_bytes}
+
+    @staticmethod
+    def _eta(remaining, rate):
+        return max(0.0, remaining) / rate if rate > 0 else None
+
+    def _sample(self):
+        # 指数加权平均的权重按时间间隔算，采样频率变化时平滑程度不变
+        now = time.monotonic()
+        dt = now - self._last_sample
+        if dt <= 0: return
+        alpha = 1 - math.exp(-dt / self.window)
+        self.rate += ((self._received - self._sampled) / dt - self.rate) * alpha
+        for entry in self._entries.values():
+            if entry.started:
+                entry.rate += ((entry.done - entry.last_done) / dt - entry.rate) * alpha
+                entry.last_done = entry.done
+        self._sampled = self._received
+        self._last_sample = now
+        if not self._entries and self.rate < 1:
+            self.rate = 0.0
+
+    def _changed(self):
+        due = self._last_emit + self.interval
+        # 已经约好了不晚于 due 的通知，这次的变化到时一起带上
+        if self._timer is not None and self._timer_at <= due: return
+        if due <= time.monotonic():
+            self._emit()
+        else:
+            self._schedule(due)
+
+    def _schedule(self, at):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = asyncio.get_running_loop().call_at(at, self._emit)
+
+    def _emit(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._sample()
+        self._last_emit = time.monotonic()
+        if self.on_update is not None:
+            self.on_update(self.snapshot())
+        if self._entries:
+            # 传输还在进行：没有新数据也定期刷新 (速度下降、看得出卡住)
+            self._schedule(self._last_emit + 1.0)
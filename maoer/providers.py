@@ -0,0 +1,201 @@
+"""多来源搜索：同一关键词向多个接口 type 发起对冲请求，合并排序结果，并记录各来源的延迟和成功率"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import aiohttp
+
+from .config import SEARCH_PROVIDERS, SEARCH_FANOUT, HEDGE_DELAY, HEDGE_MERGE_WINDOW, PROVIDER_STATS_FILE
+from .metrics import METRICS
+
+
+class ProviderStats:
+    """各搜索来源的平均延迟和成功率 (指数加权)，保存到 JSON 文件，下次启动继续用来排序
+
+    "成功"指返回了至少一条结果：空结果和失败一样，说明这个来源此刻帮不上忙。
+    """
+    # 新样本在加权平均里的占比
+    ALPHA = 0.3
+    # 成功率再低也按这个值算，坏掉的来源恢复后还有机会排回前面
+    MIN_SUCCESS = 0.05
+    # 两次写盘至少间隔几秒
+    SAVE_INTERVAL = 5.0
+
+    def __init__(self, path=PROVIDER_STATS_FILE, prior_latency=HEDGE_DELAY):
+        self.path = path
+        # 没有记录的来源按这个延迟估计，排在已知慢的来源前面，能得到一次尝试的机会
+        self.prior_latency = prior_latency
+        self._stats = None  # 来源 -> {"latency", "success", "count"}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+
+    def _load(self):
+        # 首次使用时才读文件；文件损坏就从头统计
+        if self._stats is None:
+            self._stats = {}
+            if self.path:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        for provider, s in json.load(f).items():
+                            self._stats[provider] = {"latency": float(s["latency"]), "success": float(s["success"]),
+                                                     "count": int(s["count"])}
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    self._stats = {}
+        return self._stats
+
+    def expected_latency(self, provider):
+        # 期望多久能拿到有用的结果：平均延迟 / 成功率
+        with self._lock:
+            s = self._load().get(provider)
+            if s is None: return self.prior_latency
+            return s["latency"] / max(self.MIN_SUCCESS, s["success"])
+
+    def ranked(self, providers):
+        # 按期望延迟从快到慢排列；排序稳定，没有记录时保持传入的顺序
+        return sorted(providers, key=self.expected_latency)
+
+    def record(self, provider, latency, ok):
+        with self._lock:
+            stats = self._load()
+            s = stats.get(provider)
+            if s is None:
+                s = stats[provider] = {"latency": latency, "success": 1.0 if ok else 0.0, "count": 0}
+            else:
+                s["latency"] += (latency - s["latency"]) * self.ALPHA
+                s["success"] += ((1.0 if ok else 0.0) - s["success"]) * self.ALPHA
+            s["count"] += 1
+            self._dirty = True
+        if time.monotonic() - self._last_save >= self.SAVE_INTERVAL:
+            self.save()
+
+    def record_slow(self, provider, elapsed):
+        # 输掉对冲被取消的请求：只知道"至少要这么久"，延迟估计比它小时才往上调；这次算没赶上 (成功率下降)
+        with self._lock:
+            stats = self._load()
+            s = stats.get(provider)
+            if s is None:
+                s = stats[provider] = {"latency": max(elapsed, self.prior_latency), "success": 1.0, "count": 0}
+            elif elapsed > s["latency"]:
+                s["latency"] += (elapsed - s["latency"]) * self.ALPHA
+            s["success"] -= s["success"] * self.ALPHA
+            s["count"] += 1
+            self._dirty = True
+
+    def snapshot(self):
+        with self._lock:
+            return {provider: dict(s) for provider, s in self._load().items()}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path: return
+            data = json.dumps(self._stats, ensure_ascii=False, indent=1)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"搜索来源统计保存失败: {e}")
+
+
+# 全局的来源统计，界面、命令行和批量搜索共用
+PROVIDER_STATS = ProviderStats()
+
+# 倒数排名融合的平滑常数：越大，各来源排名靠后的结果与靠前的差距越小
+RRF_K = 10
+
+
+def _song_key(item):
+    return item.get("title", "").strip().casefold(), item.get("author", "").strip().casefold()
+
+
+def merge_results(answers, k=RRF_K):
+    # answers: [(来源, 结果列表)]，按来源的优先顺序排列
+    # 倒数排名融合：在某个来源排第 r 位 (从 0 起) 的歌曲得 1/(k+r) 分，几个来源都搜到的歌曲分数累加排到前面
+    # 同名同歌手的只保留优先来源的那条，并记下 provider；同一来源里的同名歌曲 (不同版本) 各自保留
+    merged = {}
+    seen_urls = set()
+    for rank, (provider, items) in enumerate(answers):
+        used = set()
+        for position, item in enumerate(items):
+            url = item.get("url", "")
+            key = _song_key(item)
+            if key in used:
+                key = (provider, position)
+            used.add(key)
+            entry = merged.get(key)
+            if entry is None:
+                if url in seen_urls: continue
+                seen_urls.add(url)
+                entry = merged[key] = {"item": dict(item, provider=provider), "score": 0.0, "order": (position, rank)}
+            entry["score"] += 1 / (k + position)
+    ranked = sorted(merged.values(), key=lambda entry: (-entry["score"], entry["order"]))
+    return [entry["item"] for entry in ranked]
+
+
+# 对冲搜索：fetch(来源) 是返回结果列表的协程
+# 先同时查最快的 fanout 个来源；hedge_delay 秒内都没有结果，或者某个来源失败/为空，就追加下一个来源
+# 第一个有结果的来源返回后，再等 merge_window 秒收集其它已发出的来源，然后取消剩下的
+# 返回合并排序后的结果；所有来源都失败时抛出最后一个异常，都为空时返回空列表
+async def hedged_search(fetch, providers=SEARCH_PROVIDERS, stats=PROVIDER_STATS, fanout=SEARCH_FANOUT,
+                        hedge_delay=HEDGE_DELAY, merge_window=HEDGE_MERGE_WINDOW):
+    order = stats.ranked(providers) if stats is not None else list(providers)
+    remaining = list(order)
+    loop = asyncio.get_running_loop()
+    pending = {}  # 任务 -> (来源, 开始时间)
+    answers = {}  # 来源 -> 结果
+    error = None
+    deadline = None  # 合并截止时间，第一个来源返回结果后才有
+
+    def _launch():
+        provider = remaining.pop(0)
+        pending[asyncio.ensure_future(fetch(provider))] = (provider, loop.time())
+
+    try:
+        for _ in range(min(max(1, fanout), len(remaining))):
+            _launch()
+        next_hedge = loop.time() + hedge_delay
+        while pending:
+            wake_at = deadline if deadline is not None else (next_hedge if remaining else None)
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED,
+                                         timeout=None if wake_at is None else max(0.0, wake_at - loop.time()))
+            for task in done:
+                provider, started = pending.pop(task)
+                try:
+                    items = task.result()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    error, items = e, None
+                if stats is not None:
+                    stats.record(provider, loop.time() - started, bool(items))
+                METRICS.inc("provider_search_total",
+                            ("search", provider, "ok" if items else "empty" if items is not None else "error"))
+                if items:
+                    answers[provider] = items
+                    if deadline is None: deadline = loop.time() + merge_window
+                elif deadline is None and remaining:
+                    # 失败或者没搜到：不必等对冲计时，马上换下一个来源
+                    _launch()
+                    next_hedge = loop.time() + hedge_delay
+            if deadline is not None:
+                if loop.time() >= deadline: break
+            elif not done and remaining:
+                # 已发出的来源都超过了等待预算，追加下一个来源和它们赛跑
+                METRICS.inc("hedges_total", ("search",))
+                _launch()
+                next_hedge = loop.time() + hedge_delay
+        # 合并截止时还没返回的来源算作"至少这么慢"
+        for provider, started in pending.values():
+            if stats is not None: stats.record_slow(provider, loop.time() - started)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if not answers and error is not None:
+        raise error
+    return merge_results([(provider, answers[provider]) for provider in order if provider in answers])
@@ -0,0 +1,160 @@
+"""失败重试与自适应并发：带抖动的指数退避，以及按 AIMD 调整同时进行的请求数"""
+import asyncio
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .metrics import METRICS
+
+# 这些状态码说明服务器暂时忙不过来，值得稍后重试，同时应当降低并发
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class RetryPolicy:
+    """重试策略：第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 之间的随机时长 (full jitter)"""
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        # 服务器给了 Retry-After 就照办 (不超过上限)，否则随机退避，避免大家同一时刻一起重试
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    # Retry-After 可以是秒数，也可以是 HTTP 日期
+    if not value: return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    # 网络层错误和超时都可以重试；业务错误 (如 DownloadError) 自己带 retryable 标记
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return True
+    return bool(getattr(error, "retryable", False))
+
+
+class AdaptiveLimiter:
+    """AIMD 并发控制：出现 429/5xx、连接错误或延迟明显升高时并发数减半，正常完成时缓慢加一
+
+    用法同信号量：async with limiter: ...；请求结束后用 record() 反馈结果。
+    等待队列里的 future 在 acquire 时才创建，所以不绑定某个事件循环，但同一时刻只应在一个循环里使用。
+    """
+    # 延迟超过基线这么多倍 (且超过 LATENCY_FLOOR 秒) 视为拥塞
+    LATENCY_TOLERANCE = 3.0
+    LATENCY_FLOOR = 0.5
+    # 收缩系数：被限流/出错时减半，仅延迟升高时温和一些
+    THROTTLE_FACTOR = 0.5
+    LATENCY_FACTOR = 0.75
+    # 两次收缩至少间隔几秒，同一波失败只算一次
+    COOLDOWN = 2.0
+
+    def __init__(self, max_limit, min_limit=1, kind="other"):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.kind = kind
+        self.limit = float(self.max_limit)  # 乐观起步，出问题再收缩
+        self.active = 0
+        self._waiters = deque()
+        self._baseline = None
+        self._last_decrease = 0.0
+
+    @property
+    def capacity(self):
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self):
+        if self.active < self.capacity and not self._waiters:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 名额已经分到了却被取消，转交给下一个
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.active < self.capacity:
+            fut = self._waiters.popleft()
+            if fut.done(): continue
+            self.active += 1
+            fut.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def record(self, status=None, latency=None, error=False):
+        # status: 响应状态码；latency: 首字节耗时 (秒)；error: 连接失败/超时
+        throttled = error or (status is not None and status in RETRY_STATUSES)
+        congested = False
+        if not throttled and latency is not None:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                # 基线跟踪延迟的下沿：变快时立即跟上，变慢时缓慢上浮
+                self._baseline += (latency - self._baseline) * 0.05
+            congested = latency > max(self.LATENCY_FLOOR, self._baseline * self.LATENCY_TOLERANCE)
+
+        if throttled or congested:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.COOLDOWN:
+                factor = self.THROTTLE_FACTOR if throttled else self.LATENCY_FACTOR
+                self.limit = max(float(self.min_limit), self.limit * factor)
+                self._last_decrease = now
+                METRICS.inc("concurrency_decreases_total", (self.kind,))
+        elif status is not None and status < 400:
+            # 加性增长：大约每完成 limit 个请求加一
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._wake()
+
+
+class HostLimiters:
+    """按主机分别维护的 AdaptiveLimiter，一个 CDN 节点被限流不影响其它节点"""
+
+    def __init__(self, max_limit, min_limit=1, kind="other"):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.kind = kind
+        self._limiters = {}
+
+    def get(self, url):
+        host = urlsplit(url).hostname or ""
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = AdaptiveLimiter(self.max_limit, self.min_limit, self.kind)
+        return limiter
+
+    def limits(self):
+        return {host: limiter.capacity for host, limiter in self._limiters.items()}
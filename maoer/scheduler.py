@@ -0,0 +1,264 @@
+"""下载队列：持久化的任务列表 (SQLite) + 常驻调度器，支持优先级、暂停、继续、取消"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+from .config import QUEUE_DB, MAX_CONCURRENT_DOWNLOADS, MAX_DOWNLOADS_PER_HOST
+from .download import BatchDownloader, discard_partial
+
+# 任务状态：排队 / 下载中 / 已暂停 / 完成 / 失败 / 已取消
+STATES = ("queued", "running", "paused", "done", "failed", "cancelled")
+# 还没有结束的状态，同一目录下同一链接只保留一个这样的任务
+PENDING_STATES = ("queued", "running", "paused")
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+_COLUMNS = ("id", "url", "filename", "save_dir", "priority", "state", "added", "updated")
+
+
+class DownloadQueue:
+    """下载任务表：每个任务记录链接、文件名、保存目录、优先级和状态，程序重启后继续"""
+
+    def __init__(self, db_path=QUEUE_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, filename TEXT, save_dir TEXT,
+                    priority INTEGER DEFAULT 0, state TEXT, added REAL, updated REAL);
+                CREATE INDEX IF NOT EXISTS queue_state ON queue (state, priority);
+            """)
+            # 上次退出时还在下载的任务重新排队，从 .part 断点继续
+            self._db.execute("UPDATE queue SET state = 'queued' WHERE state = 'running'")
+            self._db.commit()
+        return self._db
+
+    @staticmethod
+    def _row(row):
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def add(self, url, filename, save_dir, priority=0):
+        # 返回新任务的 id；同一目录下这个链接已经在队列里 (未结束) 时返回 None
+        # 别的链接 (未结束) 已经要存成同一个文件名时，改名为 "歌名 - 歌手 (2).mp3"，免得两个任务写同一个文件
+        save_dir = os.path.abspath(save_dir)
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            exists = db.execute(
+                f"SELECT 1 FROM queue WHERE url = ? AND save_dir = ? AND state IN {PENDING_STATES}",
+                (url, save_dir)).fetchone()
+            if exists: return None
+            stem, ext = os.path.splitext(filename)
+            n = 1
+            while db.execute(f"SELECT 1 FROM queue WHERE filename = ? AND save_dir = ? AND state IN {PENDING_STATES}",
+                             (filename, save_dir)).fetchone():
+                n += 1
+                filename = f"{stem} ({n}){ext}"
+            cur = db.execute("INSERT INTO queue (url, filename, save_dir, priority, state, added, updated) "
+                             "VALUES (?, ?, ?, ?, 'queued', ?, ?)", (url, filename, save_dir, priority, now, now))
+            db.commit()
+            return cur.lastrowid
+
+    def get(self, item_id):
+        with self._lock:
+            return self._row(self._conn().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM queue WHERE id = ?", (item_id,)).fetchone())
+
+    def items(self):
+        # 未结束的在前 (按优先级、加入顺序)，已结束的在后
+        with self._lock:
+            rows = self._conn().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM queue "
+                f"ORDER BY state IN {FINISHED_STATES}, priority DESC, id").fetchall()
+        return [self._row(row) for row in rows]
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn().execute("SELECT state, COUNT(*) FROM queue GROUP BY state").fetchall())
+
+    def next_queued(self):
+        with self._lock:
+            return self._row(self._conn().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM queue WHERE state = 'queued' "
+                f"ORDER BY priority DESC, id LIMIT 1").fetchone())
+
+    def transition(self, item_id, state, from_states):
+        # 只有当前状态在 from_states 里才切换；返回切换前的状态，没切换返回 None
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT state FROM queue WHERE id = ?", (item_id,)).fetchone()
+            if row is None or row[0] not in from_states: return None
+            db.execute("UPDATE queue SET state = ?, updated = ? WHERE id = ?", (state, time.time(), item_id))
+            db.commit()
+            return row[0]
+
+    def set_priority(self, item_id, priority):
+        with self._lock:
+            db = self._conn()
+            db.execute("UPDATE queue SET priority = ? WHERE id = ?", (priority, item_id))
+            db.commit()
+
+    def move_to_top(self, item_id):
+        with self._lock:
+            db = self._conn()
+            top = db.execute(f"SELECT MAX(priority) FROM queue WHERE state IN {PENDING_STATES}").fetchone()[0]
+            db.execute("UPDATE queue SET priority = ? WHERE id = ?", ((top or 0) + 1, item_id))
+            db.commit()
+
+    def clear_finished(self):
+        with self._lock:
+            db = self._conn()
+            cur = db.execute(f"DELETE FROM queue WHERE state IN {FINISHED_STATES}")
+            db.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class DownloadScheduler:
+    """常驻的下载调度器：按优先级从队列里取任务，最多同时下载 max_concurrency 个
+
+    run() 在事件循环里一直运行；add/pause/resume/cancel 等操作可以在任意线程调用，
+    它们先改队列里的状态，再唤醒调度器按新状态启动或取消传输。
+    on_change(任务) 在每次状态变化后调用，on_idle(成功数, 失败数) 在队列清空时调用，二者都在事件循环线程里执行。
+    progress 是所有下载共用的 ProgressTracker (按字节汇报进度)，队列清空时清零完成统计。
+    """
+
+    def __init__(self, queue, session, max_concurrency=MAX_CONCURRENT_DOWNLOADS,
+                 per_host_limit=MAX_DOWNLOADS_PER_HOST, library=None, on_change=None, on_idle=None,
+                 audio_cache=None, postprocessor=None, progress=None):
+        self.queue = queue
+        self.session = session
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_host_limit = max(1, per_host_limit)
+        self.library = library
+        self.audio_cache = audio_cache
+        self.postprocessor = postprocessor
+        self.progress = progress
+        self.on_change = on_change
+        self.on_idle = on_idle
+        self._downloaders = {}  # 保存目录 -> BatchDownloader
+        self._running = {}  # 任务 id -> asyncio.Task
+        self._loop = None
+        self._wakeup = None
+        self._ok = 0
+        self._failed = 0
+
+    # ---------- 以下方法可以在任意线程调用 ----------
+    def add(self, url, filename, save_dir, priority=0):
+        item_id = self.queue.add(url, filename, save_dir, priority)
+        if item_id is not None:
+            self._changed(item_id)
+        return item_id
+
+    def pause(self, item_id):
+        # 暂停正在下载的任务会中断传输，.part 保留，继续时从断点续传
+        if self.queue.transition(item_id, "paused", ("queued", "running")):
+            self._changed(item_id)
+
+    def resume(self, item_id):
+        if self.queue.transition(item_id, "queued", ("paused", "failed", "cancelled")):
+            self._changed(item_id)
+
+    def cancel(self, item_id):
+        previous = self.queue.transition(item_id, "cancelled", PENDING_STATES)
+        if previous is None: return
+        if previous != "running":
+            # 没在传输，直接清理临时文件；正在传输的等任务退出后再清理
+            item = self.queue.get(item_id)
+            discard_partial(item["save_dir"], item["filename"])
+        self._changed(item_id)
+
+    def move_to_top(self, item_id):
+        self.queue.move_to_top(item_id)
+        self._changed(item_id)
+
+    def _changed(self, item_id):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._on_changed, item_id)
+
+    # ---------- 以下在事件循环线程里执行 ----------
+    def _on_changed(self, item_id):
+        self._notify(item_id)
+        self._wakeup.set()
+
+    def _notify(self, item_id):
+        if self.on_change is not None:
+            item = self.queue.get(item_id)
+            if item is not None: self.on_change(item)
+
+    def _downloader(self, save_dir):
+        if save_dir not in self._downloaders:
+            self._downloaders[save_dir] = BatchDownloader(save_dir, self.session, self.max_concurrency,
+                                                          self.per_host_limit, self.library, self.audio_cache,
+                                                          self.postprocessor, self.progress)
+        return self._downloaders[save_dir]
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                # 状态已经不是"下载中"的 (被暂停/取消) 立即中断
+                for item_id, task in list(self._running.items()):
+                    item = self.queue.get(item_id)
+                    if item is None or item["state"] != "running":
+                        task.cancel()
+                while len(self._running) < self.max_concurrency:
+                    item = self.queue.next_queued()
+                    if item is None: break
+                    if self.queue.transition(item["id"], "running", ("queued",)) is None: continue
+                    self._start(item)
+                if not self._running and (self._ok or self._failed):
+                    if self.on_idle is not None: self.on_idle(self._ok, self._failed)
+                    self._ok = self._failed = 0
+                    if self.progress is not None: self.progress.reset()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+        finally:
+            # 退出时中断所有传输，它们在队列里仍是"下载中"，下次启动时重新排队
+            tasks = list(self._running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop = None
+
+    def _start(self, item):
+        task = asyncio.ensure_future(self._download(item))
+        self._running[item["id"]] = task
+
+        def _done(_task, item_id=item["id"]):
+            self._running.pop(item_id, None)
+            self._wakeup.set()
+
+        task.add_done_callback(_done)
+        self._notify(item["id"])
+
+    async def _download(self, item):
+        item_id = item["id"]
+        try:
+            ok = await self._downloader(item["save_dir"]).download(item["url"], item["filename"])
+        except asyncio.CancelledError:
+            current = self.queue.get(item_id)
+            if current is not None and current["state"] == "cancelled":
+                discard_partial(item["save_dir"], item["filename"])
+            raise
+        # 下载期间被暂停/取消的，以用户操作为准
+        if self.queue.transition(item_id, "done" if ok else "failed", ("running",)):
+            if ok:
+                self._ok += 1
+            else:
+                self._failed += 1
+        self._notify(item_id)
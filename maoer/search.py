@@ -0,0 +1,424 @@
+"""搜索：接口请求 (单来源或多来源对冲)、结果缓存、分页、多关键词批量搜索
+
+music_type 可以是单个接口 type (如 "netease")，也可以是多个 type 组成的元组/列表，后者走多来源对冲搜索。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+from . import config
+from .bandwidth import BANDWIDTH
+from .config import (SEARCH_CACHE_DB, SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE, SEARCH_RETRY_ATTEMPTS, RETRY_BASE_DELAY,
+                     RETRY_MAX_DELAY, BATCH_SEARCH_BUDGET)
+from .metrics import METRICS
+from .net import _session_scope
+from .probe import is_valid_audio
+from .providers import hedged_search
+from .retry import RETRY_STATUSES, RetryPolicy, parse_retry_after
+
+
+async def page_parm(kw, page=1, music_type="netease", search_filter="name"):
+    headers = {
+        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
+        "referer": "https://musicjx.com/",
+        "x-requested-with": "XMLHttpRequest"
+    }
+    datas = {"input": kw, "filter": search_filter, "type": music_type, "page": str(page)}
+    return headers, datas
+
+
+class SearchCache:
+    """两级搜索缓存：内存 LRU + 磁盘 SQLite，按 (关键词, 类型, 页码, 过滤方式) 索引"""
+
+    def __init__(self, db_path=SEARCH_CACHE_DB, ttl=SEARCH_CACHE_TTL, max_items=SEARCH_CACHE_SIZE):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (写入时间, 结果列表)
+        self._lock = threading.Lock()
+        self._db = None
+
+    @staticmethod
+    def make_key(kw, page=1, music_type="netease", search_filter="name"):
+        return json.dumps([kw.strip(), music_type, int(page), search_filter], ensure_ascii=False)
+
+    def _conn(self):
+        # 首次使用时才打开数据库；打不开就只用内存缓存
+        if self._db is None and self.db_path:
+            try:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS search_cache "
+                                 "(key TEXT PRIMARY KEY, created REAL, data TEXT)")
+                self._db.execute("DELETE FROM search_cache WHERE created < ?", (time.time() - self.ttl,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"搜索缓存数据库不可用: {e}")
+                self.db_path = None
+                self._db = None
+        return self._db
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit and now - hit[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(hit[1])
+            self._memory.pop(key, None)
+
+            db = self._conn()
+            if db is not None:
+                try:
+                    row = db.execute("SELECT created, data FROM search_cache WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row and now - row[0] < self.ttl:
+                    data = json.loads(row[1])
+                    self._remember(key, row[0], data)
+                    self.hits += 1
+                    return list(data)
+            self.misses += 1
+            return None
+
+    def put(self, key, data):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, list(data))
+            db = self._conn()
+            if db is not None:
+                try:
+                    db.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)",
+                               (key, now, json.dumps(data, ensure_ascii=False)))
+                    db.commit()
+                except sqlite3.Error as e:
+                    print(f"搜索缓存写入失败: {e}")
+
+    def invalidate(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            db = self._conn()
+            if db is not None:
+                try:
+                    db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def _remember(self, key, created, data):
+        self._memory[key] = (created, data)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_items": len(self._memory)}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+SEARCH_RETRY = RetryPolicy(SEARCH_RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+
+async def _search_raw(session, kw, page, music_type, search_filter, retry=SEARCH_RETRY):
+    # 向搜索接口发 POST，返回 (请求头, 未校验的结果列表)；网络错误和 429/5xx 会退避重试
+    # 运行时读取 config.SEARCH_URL，方便测试时替换
+    main_url = config.SEARCH_URL
+    headers, datas = await page_parm(kw, page, music_type, search_filter)
+    for attempt in range(retry.attempts):
+        retry_after = None
+        try:
+            async with session.post(main_url, headers=headers, data=datas,
+                                    trace_request_ctx={"kind": "search"}) as res:
+                if res.status != 200:
+                    METRICS.failure("search", f"status_{res.status}")
+                    if res.status not in RETRY_STATUSES or attempt + 1 == retry.attempts:
+                        raise ValueError(f"搜索接口返回 {res.status}")
+                    retry_after = parse_retry_after(res.headers.get("Retry-After"))
+                    response_text = None
+                else:
+                    await BANDWIDTH.throttle(len(await res.read()), "search")
+                    response_text = await res.text()
+            if response_text is not None:
+                url_lists = json.loads(response_text)
+                break
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            METRICS.failure("search", e)
+            if attempt + 1 == retry.attempts: raise
+        except json.JSONDecodeError:
+            METRICS.failure("search", "bad_json")
+            raise
+        METRICS.inc("retries_total", ("search",))
+        await asyncio.sleep(retry.delay(attempt, retry_after))
+    METRICS.success("search")
+    raw_data_list = []
+    if "data" in url_lists:
+        for item in url_lists["data"][1:]:
+            raw_data_list.append({
+                "title": item.get("title", "未知歌曲"),
+                "author": item.get("author", "未知歌手"),
+                "url": item.get("url", "")
+            })
+    return headers, raw_data_list
+
+
+async def _search_any(session, kw, page, music_type, search_filter):
+    # 单个来源直接搜索；多个来源时对冲搜索并合并结果，请求头各来源通用
+    if isinstance(music_type, str):
+        return await _search_raw(session, kw, page, music_type, search_filter)
+    headers, _ = await page_parm(kw, page, search_filter=search_filter)
+
+    async def _fetch(provider):
+        return (await _search_raw(session, kw, page, provider, search_filter))[1]
+
+    return headers, await hedged_search(_fetch, music_type)
+
+
+async def _probe_indexed(session, index, item, headers, use_cache=True):
+    return index, await is_valid_audio(session, item, headers, use_cache=use_cache)
+
+
+# 渐进式搜索：每条结果校验通过就立刻 yield (原始序号, 结果)，不等最慢的探测
+# cache 传入 SearchCache 时先查缓存；refresh=True 跳过缓存强制重新搜索
+# on_raw(条数) 在拿到接口结果 (校验前) 时调用一次，分页靠它判断是否到底：整页链接都失效不等于没有下一页
+async def iter_music_data(kw, session=None, page=1, music_type="netease", search_filter="name",
+                          cache=None, refresh=False, on_raw=None):
+    cache_key = SearchCache.make_key(kw, page, music_type, search_filter)
+    if cache is not None and not refresh:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if on_raw is not None: on_raw(len(cached))
+            for index, item in enumerate(cached):
+                yield index, item
+            return
+
+    async with _session_scope(session) as session:
+        headers, raw_data_list = await _search_any(session, kw, page, music_type, search_filter)
+        if on_raw is not None: on_raw(len(raw_data_list))
+        tasks = [asyncio.ensure_future(_probe_indexed(session, i, item, headers, not refresh))
+                 for i, item in enumerate(raw_data_list)]
+        found = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, item = await next_done
+                if item is not None:
+                    found.append((index, item))
+                    yield index, item
+        finally:
+            # 调用方提前退出时，取消还在进行的探测
+            for task in tasks:
+                task.cancel()
+
+    # 空结果可能只是网络抖动，不写入缓存
+    if cache is not None and found:
+        cache.put(cache_key, [item for _, item in sorted(found, key=lambda pair: pair[0])])
+
+
+async def fetch_music_data(kw, session=None, page=1, music_type="netease", search_filter="name",
+                           cache=None, refresh=False):
+    try:
+        found = [pair async for pair in iter_music_data(kw, session, page, music_type, search_filter,
+                                                        cache, refresh)]
+    except Exception as e:
+        print(f"搜索出错: {e}")
+        return None
+    return [item for _, item in sorted(found, key=lambda pair: pair[0])]
+
+
+class SearchPager:
+    """分页搜索：逐页加载、跨页按 URL 去重，并在后台预取下一页"""
+
+    def __init__(self, kw, session=None, cache=None, music_type="netease", search_filter="name"):
+        self.kw = kw
+        self.session = session
+        self.cache = cache
+        self.music_type = music_type
+        self.search_filter = search_filter
+        self.next_page = 1
+        self.exhausted = False
+        self.seen_urls = set()
+        self._prefetched = {}  # 页码 -> 预取任务
+
+    async def iter_next_page(self, refresh=False):
+        # 逐条 yield 下一页中没见过的结果 (原始序号, 结果)
+        page = self.next_page
+        self.next_page += 1
+        raw_counts = []  # 接口返回的原始条数 (校验前)
+
+        prefetched = self._prefetched.pop(page, None)
+        if prefetched is not None and refresh:
+            # 强制刷新时预取的结果用不上
+            prefetched.cancel()
+            prefetched = None
+        result = await prefetched if prefetched is not None else None
+        if result is not None:
+            items, raw_count = result
+            raw_counts.append(raw_count)
+            for index, item in enumerate(items):
+                if self._accept(item): yield index, item
+        else:
+            # 没有预取或者预取失败，现场搜索，结果边到边出
+            async for index, item in iter_music_data(self.kw, self.session, page, self.music_type,
+                                                     self.search_filter, self.cache, refresh,
+                                                     on_raw=raw_counts.append):
+                if self._accept(item): yield index, item
+
+        if not sum(raw_counts):
+            self.exhausted = True
+
+    def _accept(self, item):
+        if item["url"] in self.seen_urls: return False
+        self.seen_urls.add(item["url"])
+        return True
+
+    def prefetch(self):
+        # 必须在事件循环线程里调用；预取结果留到翻页时直接使用
+        page = self.next_page
+        if self.exhausted or page in self._prefetched: return
+        self._prefetched[page] = asyncio.ensure_future(self._fetch_page(page))
+
+    async def _fetch_page(self, page):
+        # 预取一整页：返回 (校验通过的结果, 接口返回的原始条数)，出错返回 None
+        raw_counts = []
+        try:
+            found = [pair async for pair in iter_music_data(self.kw, self.session, page, self.music_type,
+                                                            self.search_filter, self.cache,
+                                                            on_raw=raw_counts.append)]
+        except Exception as e:
+            print(f"预取下一页出错: {e}")
+            return None
+        return [item for _, item in sorted(found, key=lambda pair: pair[0])], sum(raw_counts)
+
+    def close(self):
+        for task in self._prefetched.values():
+            task.cancel()
+        self._prefetched.clear()
+
+
+class BatchSearch:
+    """多关键词批量搜索：所有请求共用一个并发预算，同一链接只校验一次，结果跨关键词按 URL 去重
+
+    必须在事件循环里创建和使用；run() 按完成顺序逐组 yield，先完成的关键词先占有重复的链接。
+    """
+
+    def __init__(self, session, cache=None, max_requests=BATCH_SEARCH_BUDGET, per_keyword=None,
+                 music_type="netease", search_filter="name"):
+        self.session = session
+        self.cache = cache
+        self.per_keyword = per_keyword
+        self.music_type = music_type
+        self.search_filter = search_filter
+        self.seen_urls = set()
+        self.probe_count = 0
+        self._budget = asyncio.Semaphore(max(1, max_requests))
+        self._probes = {}  # url -> 校验任务，多个关键词搜到同一链接时共用
+
+    async def _probe(self, item, headers):
+        url = item["url"]
+        task = self._probes.get(url)
+        if task is None:
+            task = self._probes[url] = asyncio.ensure_future(self._probe_budgeted(item, headers))
+        # 某个关键词被取消时不能连带取消别的关键词也在等的校验
+        return await asyncio.shield(task)
+
+    async def _probe_budgeted(self, item, headers):
+        async with self._budget:
+            self.probe_count += 1
+            return await is_valid_audio(self.session, item, headers) is not None
+
+    async def search_one(self, kw):
+        # 单个关键词的第一页 (已校验、按原始顺序)；搜索失败时抛出异常
+        cache_key = SearchCache.make_key(kw, 1, self.music_type, self.search_filter)
+        cached = self.cache.get(cache_key) if self.cache is not None else None
+        if cached is not None:
+            return cached
+        async with self._budget:
+            headers, raw_data_list = await _search_any(self.session, kw, 1, self.music_type, self.search_filter)
+        if not self.per_keyword:
+            results = await asyncio.gather(*(self._probe(item, headers) for item in raw_data_list))
+            items = [item for item, ok in zip(raw_data_list, results) if ok]
+            complete = True
+        else:
+            items, complete = await self._probe_ranked(raw_data_list, headers)
+        # 提前停下的只是前几条，不能当作整页结果写进缓存
+        if self.cache is not None and items and complete:
+            self.cache.put(cache_key, items)
+        return items
+
+    async def _probe_ranked(self, raw_data_list, headers):
+        # 按原始顺序校验，同时在校验的条数不超过还缺的条数；凑够 per_keyword 条有效、且没被别的关键词占用的结果
+        # 就不再发新的校验。返回 (有效结果, 是否每条都校验过了)
+        valid = {}  # 原始序号 -> 是否有效
+        pending = {}  # 校验任务 -> 原始序号
+        next_index = 0
+
+        def _missing():
+            found = sum(1 for i, ok in valid.items() if ok and raw_data_list[i]["url"] not in self.seen_urls)
+            return self.per_keyword - found - len(pending)
+
+        try:
+            while True:
+                while next_index < len(raw_data_list) and _missing() > 0:
+                    task = asyncio.ensure_future(self._probe(raw_data_list[next_index], headers))
+                    pending[task] = next_index
+                    next_index += 1
+                if not pending: break
+                done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    valid[pending.pop(task)] = task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        items = [raw_data_list[i] for i in sorted(valid) if valid[i]]
+        return items, next_index == len(raw_data_list)
+
+    async def _search_indexed(self, index, kw):
+        try:
+            return index, kw, await self.search_one(kw), None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            return index, kw, [], str(e) or type(e).__name__
+
+    async def run(self, keywords):
+        # 逐组 yield {"index", "keyword", "items", "duplicates", "error"}
+        tasks = [asyncio.ensure_future(self._search_indexed(i, kw)) for i, kw in enumerate(keywords)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, kw, items, error = await next_done
+                unique, duplicates = [], 0
+                for item in items:
+                    if item["url"] in self.seen_urls:
+                        duplicates += 1
+                        continue
+                    # 超出条数上限的不占用链接，留给别的关键词
+                    if self.per_keyword and len(unique) >= self.per_keyword: break
+                    self.seen_urls.add(item["url"])
+                    unique.append(item)
+                yield {"index": index, "keyword": kw, "items": unique, "duplicates": duplicates, "error": error}
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task in self._probes.values():
+                task.cancel()
+
+
+# 批量搜索的便捷入口：返回按输入顺序排列的分组结果
+async def batch_search(keywords, session=None, cache=None, max_requests=BATCH_SEARCH_BUDGET, per_keyword=None,
+                       music_type="netease", search_filter="name"):
+    async with _session_scope(session) as session:
+        searcher = BatchSearch(session, cache, max_requests, per_keyword, music_type, search_filter)
+        groups = [group async for group in searcher.run(keywords)]
+    return sorted(groups, key=lambda group: group["index"])
@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from maoer import bandwidth
+from maoer.bandwidth import BandwidthShaper
+
+
+# 每个测试最多跑这么多秒 (真实时间)，限速逻辑出错卡住时直接失败
+TIMEOUT = 5
+_real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.now += delay
+        self.slept += delay
+        # 让出事件循环，超时才能生效
+        await _real_sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    # 只替换限速模块里用到的时钟和 sleep，事件循环自己的计时 (超时) 照常走真实时间
+    monkeypatch.setattr(bandwidth, "time", SimpleNamespace(monotonic=clock.monotonic))
+    monkeypatch.setattr(bandwidth, "asyncio", SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, TIMEOUT))
+
+
+def test_interactive_traffic_alone_does_not_estimate_link(clock):
+    # 只有几 KB 的校验流量，不能当成链路吞吐，否则下载会被限到几 KB/s
+    shaper = BandwidthShaper(limit=0)
+    for _ in range(20):
+        run(shaper.throttle(200, "probe"))
+        clock.now += 0.25
+    assert shaper.link_rate == 0
+    before = clock.slept
+    run(shaper.throttle(64 * 1024, "download"))
+    assert clock.slept == before
+
+
+def test_background_yields_to_interactive_after_link_measured(clock):
+    shaper = BandwidthShaper(limit=0, reserve=0.3, burst=0.0)
+    # 后台下载以 1 MB/s 跑满几个窗口
+    for _ in range(40):
+        run(shaper.throttle(100_000, "download"))
+        clock.now += 0.1
+    assert shaper.link_rate == pytest.approx(1_000_000, rel=0.05)
+
+    run(shaper.throttle(1000, "preview"))
+    start, sent = clock.now, 0
+    while clock.now - start < 1.0:
+        run(shaper.throttle(64 * 1024, "download"))
+        sent += 64 * 1024
+    assert sent / (clock.now - start) == pytest.approx(0.7 * shaper.link_rate, rel=0.15)
+
+
+def test_waiting_download_resumes_when_interactive_ends(clock):
+    shaper = BandwidthShaper(limit=0, reserve=0.3, hold=3.0, burst=0.0)
+    shaper.link_rate = 100_000
+    run(shaper.throttle(1000, "preview"))
+    # 交互流量把后台通道推后很多；交互结束 (hold 过去) 后应当马上放行，而不是睡完预先算好的时长
+    shaper._tat[False] = clock.now + 60
+    started = clock.now
+    run(shaper.throttle(64 * 1024, "download"))
+    assert clock.now - started <= shaper.hold + shaper.SLICE
+
+
+def test_raising_limit_takes_effect_while_waiting(clock, monkeypatch):
+    shaper = BandwidthShaper(limit=1024, burst=0.0)
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+        clock.now += delay
+        if len(sleeps) == 3:
+            shaper.set_limit(0)
+        await _real_sleep(0)
+
+    monkeypatch.setattr(bandwidth, "asyncio", SimpleNamespace(sleep=sleep))
+    run(shaper.throttle(64 * 1024, "download"))
+    assert len(sleeps) == 3
+    assert all(delay <= shaper.SLICE for delay in sleeps)
+
+
+def test_limit_caps_total_rate(clock):
+    shaper = BandwidthShaper(limit=500_000, burst=0.0)
+    start, sent = clock.now, 0
+    for _ in range(50):
+        run(shaper.throttle(64 * 1024, "download"))
+        sent += 64 * 1024
+    assert sent / (clock.now - start) == pytest.approx(500_000, rel=0.05)
+
+
+def test_chunk_larger_than_burst_gets_through(clock):
+    # 上限低到一块数据的发送时间超过突发额度时，也要按上限放行，不能一直空转
+    shaper = BandwidthShaper(limit=100_000)
+    start, sent = clock.now, 0
+    for _ in range(20):
+        run(shaper.throttle(64 * 1024, "download"))
+        sent += 64 * 1024
+    assert sent / (clock.now - start) == pytest.approx(100_000, rel=0.1)
+
+
+def test_limit_change_rescales_pending_wait(clock):
+    shaper = BandwidthShaper(limit=10_000, burst=0.0)
+    run(shaper.throttle(100_000, "download"))  # 排到 10 秒后
+    started = clock.now
+    shaper.set_limit(1_000_000)
+    run(shaper.throttle(100_000, "download"))
+    assert clock.now - started < 1.0
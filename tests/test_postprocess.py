@@ -0,0 +1,144 @@
+import pytest
+
+from maoer import postprocess
+from maoer.postprocess import (PostProcessError, StepSkipped, _id3_frames, _id3_text_frame, _to_syncsafe,
+                               run_pipeline, verify_audio, write_tags)
+
+# 几个 MPEG 帧头凑成的 "音频数据"，够文件头检查用
+FRAMES = b"\xff\xfb\x90\x00" * 64
+
+
+@pytest.fixture(autouse=True)
+def no_mutagen(monkeypatch):
+    # 不管环境里装没装 mutagen，都走自带的文件头检查和 ID3 写入
+    monkeypatch.setattr(postprocess, "mutagen", None)
+
+
+def id3(frames, version=3):
+    return b"ID3" + bytes((version, 0, 0)) + _to_syncsafe(len(frames)) + frames
+
+
+def read_tags(path):
+    # 读回标签：{帧 ID: 文本}，文本帧之外的帧原样返回字节
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(b"ID3")
+    version = data[3]
+    size = postprocess._syncsafe(data[6:10])
+    tags = {}
+    for fid, raw in _id3_frames(data[10:10 + size], version):
+        body = raw[10:]
+        tags[fid] = body[1:].decode("utf-16") if fid.startswith(b"T") else body
+    return tags, data[10 + size:]
+
+
+def write(tmp_path, data, name="歌 - 人.mp3"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+# ---------------- ID3 写入 ----------------
+@pytest.mark.parametrize("version", [3, 4])
+def test_fallback_replaces_title_and_author(tmp_path, version):
+    old = _id3_text_frame(b"TIT2", "旧歌名", version) + _id3_text_frame(b"TPE1", "旧歌手", version)
+    path = write(tmp_path, id3(old, version) + FRAMES)
+    postprocess._write_id3_fallback(path, "新歌名", "新歌手")
+    tags, audio = read_tags(path)
+    assert tags == {b"TIT2": "新歌名", b"TPE1": "新歌手"}
+    assert audio == FRAMES
+
+
+def test_fallback_keeps_author_when_new_author_is_empty(tmp_path):
+    old = _id3_text_frame(b"TIT2", "旧歌名", 3) + _id3_text_frame(b"TPE1", "原歌手", 3)
+    path = write(tmp_path, id3(old) + FRAMES)
+    postprocess._write_id3_fallback(path, "新歌名", "")
+    tags, _ = read_tags(path)
+    assert tags == {b"TIT2": "新歌名", b"TPE1": "原歌手"}
+
+
+def test_fallback_keeps_other_frames(tmp_path):
+    cover = b"APIC" + (6).to_bytes(4, "big") + b"\x00\x00" + b"\x00cover"
+    old = _id3_text_frame(b"TALB", "专辑", 3) + cover + b"\x00" * 32  # 末尾带填充
+    path = write(tmp_path, id3(old) + FRAMES)
+    postprocess._write_id3_fallback(path, "歌", "人")
+    tags, audio = read_tags(path)
+    assert tags == {b"TIT2": "歌", b"TPE1": "人", b"TALB": "专辑", b"APIC": b"\x00cover"}
+    assert audio == FRAMES
+
+
+def test_fallback_adds_tag_to_bare_mp3(tmp_path):
+    path = write(tmp_path, FRAMES)
+    postprocess._write_id3_fallback(path, "歌", "人")
+    tags, audio = read_tags(path)
+    assert tags == {b"TIT2": "歌", b"TPE1": "人"}
+    assert audio == FRAMES
+
+
+def test_fallback_skips_unusual_tags(tmp_path):
+    # 不同步编码标志 (0x80)
+    path = write(tmp_path, b"ID3\x03\x00\x80" + _to_syncsafe(0) + FRAMES)
+    with pytest.raises(StepSkipped):
+        postprocess._write_id3_fallback(path, "歌", "人")
+
+
+def test_write_tags_skips_non_mp3_without_mutagen(tmp_path):
+    path = write(tmp_path, b"fLaC" + b"\x00" * 64, "歌 - 人.flac")
+    with pytest.raises(StepSkipped):
+        write_tags({"path": path, "title": "歌", "author": "人", "format": "flac"})
+
+
+# ---------------- 完整性校验 ----------------
+@pytest.mark.parametrize("data, fmt", [
+    (FRAMES, "mp3"),
+    (id3(_id3_text_frame(b"TIT2", "歌", 3)) + FRAMES, "mp3"),
+    (b"fLaC" + b"\x00" * 64, "flac"),
+    (b"OggS" + b"\x00" * 64, "ogg"),
+])
+def test_verify_accepts_audio(tmp_path, data, fmt):
+    path = write(tmp_path, data)
+    assert verify_audio({"path": path}) == {"format": fmt, "size": len(data)}
+
+
+@pytest.mark.parametrize("data, reason", [
+    (b"\xff\xfb", "too_small"),
+    (b"<!DOCTYPE html><html><body>404</body></html>", "html"),
+    (b"PK\x03\x04" + b"\x00" * 64, "not_audio"),
+    (id3(_id3_text_frame(b"TIT2", "歌", 3)) + b"\x00" * 64, "no_frames"),
+])
+def test_verify_rejects_broken_files(tmp_path, data, reason):
+    path = write(tmp_path, data)
+    with pytest.raises(PostProcessError) as info:
+        verify_audio({"path": path})
+    assert info.value.reason == reason
+
+
+# ---------------- 流水线 ----------------
+def fail_step(job):
+    raise RuntimeError("转码出错")
+
+
+def skip_step(job):
+    raise StepSkipped("不需要")
+
+
+def test_pipeline_records_step_statuses(tmp_path):
+    path = write(tmp_path, FRAMES)
+    steps = [("verify", verify_audio), ("skip", skip_step), ("fail", fail_step),
+             ("tags", write_tags), ("hash", postprocess.compute_hash)]
+    result = run_pipeline({"path": path, "title": "歌", "author": "人", "options": {}}, steps)
+    assert result["ok"]
+    assert result["steps"] == {"verify": "ok", "skip": "skipped: 不需要", "fail": "error: 转码出错",
+                               "tags": "ok", "hash": "ok"}
+    assert set(result["timings"]) == set(result["steps"])
+    assert result["format"] == "mp3" and result["tagged"] and len(result["sha256"]) == 64
+
+
+def test_pipeline_stops_when_file_is_unusable(tmp_path):
+    path = write(tmp_path, b"<html><body>oops</body></html>")
+    steps = [("verify", verify_audio), ("tags", write_tags)]
+    result = run_pipeline({"path": path, "title": "歌", "author": "人", "options": {}}, steps)
+    assert not result["ok"]
+    assert result["reason"] == "html"
+    assert result["error"] == "内容是网页"
+    assert result["steps"] == {"verify": "failed: 内容是网页"}
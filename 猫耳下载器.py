@@ -1,22 +1,36 @@
+import time
+
+# 启动计时从这里开始，导入 Qt 和网络核心的耗时也算在内
+_IMPORT_STARTED = time.perf_counter()
+
 import sys
 import os
 import asyncio
-import aiohttp
-import aiofiles
-import json
-from functools import partial
+import bisect
+import concurrent.futures
+import functools
+import multiprocessing
+import threading
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QLineEdit, QPushButton, QLabel,
-                             QListWidget, QListWidgetItem, QSlider, QCheckBox,
-                             QDialog, QMenu, QFileDialog, QProgressBar, QMessageBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QUrl, QSize, QSettings
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-from PyQt6.QtGui import QIcon, QPixmap, QAction, QCursor
+                             QListView, QSlider, QStyledItemDelegate, QStyle,
+                             QDialog, QMenu, QFileDialog, QProgressBar, QMessageBox, QPlainTextEdit,
+                             QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView, QTreeWidget,
+                             QTreeWidgetItem, QSpinBox)
+from PyQt6.QtCore import (Qt, QObject, QThread, pyqtSignal, QUrl, QSize, QSettings, QAbstractListModel,
+                          QModelIndex, QRect, QEvent, QTimer)
+# QtMultimedia 启动时要探测音频后端，比较慢；第一次试听时才导入 (见 MusicApp.ensure_player)
+from PyQt6.QtGui import (QIcon, QPixmap, QAction, QCursor, QKeySequence, QShortcut, QColor, QFont, QPen, QPainter,
+                         QFontMetrics)
+
+from maoer import (METRICS, make_session, SearchCache, SearchPager, BatchSearch, LibraryIndex, DownloadQueue,
+                   DownloadScheduler, AudioCache, StreamProxy, SEARCH_PROVIDERS, PROVIDER_STATS, PostProcessor,
+                   ProgressTracker, BANDWIDTH)
 
 
 # ==========================================
-# 核心逻辑
+# 资源路径
 # ==========================================
 def resource_path(relative_path):
     try:
@@ -30,124 +44,381 @@ BG_PATH = resource_path("音乐下载器/img/壁纸.png")
 ICON_PATH = resource_path("音乐下载器/ico/miao_64x64.ico")
 # 预留空状态插画路径 (你需要自己放一张图在这里，或者用代码里的默认文字)
 EMPTY_STATE_IMG = resource_path("音乐下载器/img/empty_state.png")
+# 边打字边搜索：停止输入这么多毫秒后才发起搜索
+LIVE_SEARCH_DELAY_MS = 400
 
 
-async def page_parm(kw):
-    headers = {
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/143.0.0.0 Safari/537.36",
-        "referer": "https://musicjx.com/",
-        "x-requested-with": "XMLHttpRequest"
-    }
-    datas = {"input": kw, "filter": "name", "type": "netease", "page": "1"}
-    return headers, datas
+@functools.lru_cache(maxsize=None)
+def load_pixmap(path, width=0, height=0):
+    # 图片只从磁盘读一次；给了宽高时按比例缩放后缓存。文件不存在返回 None
+    if not os.path.exists(path): return None
+    pix = QPixmap(path)
+    if pix.isNull(): return None
+    if width and height:
+        pix = pix.scaled(width, height, Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation)
+    return pix
 
 
-async def is_valid_audio(session, item, headers):
-    url = item.get("url", "")
-    if not url: return None
-    try:
-        async with session.head(url, headers=headers, timeout=2, allow_redirects=True) as res:
-            content_type = res.headers.get('Content-Type', '').lower()
-            if 'text/html' in content_type: return None
-            if res.status != 200: return None
-            return item
-    except:
-        return None
+@functools.lru_cache(maxsize=None)
+def app_icon():
+    return QIcon(ICON_PATH)
+
+
+# ==========================================
+# 启动计时
+# ==========================================
+class StartupTimer:
+    """记录启动各阶段耗时，第一帧画完后打印一次，并计入网络统计 (startup 类型)"""
+    PHASE_NAMES = {"imports": "导入", "qapp": "应用", "settings": "设置", "services": "服务", "ui": "界面",
+                   "styles": "样式", "show": "显示", "first_frame": "首帧"}
+
+    def __init__(self, started):
+        self.started = self.last = started
+        self.phases = []
+        self.done = False
+        self._scheduled = False
+
+    def mark(self, phase):
+        # 记下从上一个标记到现在的耗时
+        if self.done: return
+        now = time.perf_counter()
+        self.phases.append((phase, (now - self.last) * 1000))
+        self.last = now
+
+    def frame_painted(self):
+        # 第一次绘制时调用；等这一轮绘制 (包括子控件) 结束再收尾
+        if not self.done and not self._scheduled:
+            self._scheduled = True
+            QTimer.singleShot(0, self.finish)
+
+    def finish(self):
+        if self.done: return
+        self.mark("first_frame")
+        self.done = True
+        for phase, ms in self.phases:
+            METRICS.observe("startup", phase, ms)
+        total = (self.last - self.started) * 1000
+        print(f"启动耗时 {total:.0f} ms：" +
+              "  ".join(f"{self.PHASE_NAMES.get(phase, phase)} {ms:.0f}" for phase, ms in self.phases))
+
+
+STARTUP = StartupTimer(_IMPORT_STARTED)
+STARTUP.mark("imports")
+
+
+# ==========================================
+# 网络服务与后台任务
+# ==========================================
+
+class NetworkService(QThread):
+    """常驻的网络线程：一个事件循环 + 一个共享连接池，所有网络协程都提交到这里执行"""
 
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+        self.session = None
+        self._ready = threading.Event()
 
-async def fetch_music_data(kw):
-    main_url = 'https://musicjx.com/'
-    headers, datas = await page_parm(kw)
-    async with aiohttp.ClientSession() as session:
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.session = self.loop.run_until_complete(self._open_session())
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # 退出前取消还没完成的任务，再关闭连接池
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self.loop.run_until_complete(self.session.close())
+            self.loop.close()
+
+    async def _open_session(self):
+        # ClientSession 必须在它所属的事件循环里创建
+        return make_session()
+
+    def start_service(self):
+        self.start()
+        self._ready.wait()
+
+    def submit(self, coro):
+        # 线程安全地提交协程，返回 concurrent.futures.Future
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(_report_job_error)
+        return future
+
+    def stop(self):
+        if self.loop is not None and self.isRunning():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.wait()
+
+
+def _report_job_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"后台任务出错: {future.exception()!r}")
+
+
+# 后台任务的信号在网络线程里发出，Qt 会自动排队转交给界面线程的槽函数
+class SearchJob(QObject):
+    item_found = pyqtSignal(int, int, dict)  # 每条结果校验通过就发出 (页码, 原始序号, 结果)
+    finished_signal = pyqtSignal(list)
+    failed_signal = pyqtSignal(str)
+
+    def __init__(self, service, pager, refresh=False):
+        super().__init__()
+        self.service = service
+        self.pager = pager
+        self.refresh = refresh
+
+    def start(self):
+        self.future = self.service.submit(self._run())
+
+    def stop(self):
+        # 取消网络线程里的协程，正在进行的搜索请求和链接校验随之中断
+        self.future.cancel()
+
+    async def _run(self):
+        page = self.pager.next_page
+        found = []
         try:
-            async with session.post(main_url, headers=headers, data=datas) as res:
-                if res.status != 200: return None
-                response_text = await res.text()
-                url_lists = json.loads(response_text)
-                raw_data_list = []
-                if "data" in url_lists:
-                    for item in url_lists["data"][1:]:
-                        raw_data_list.append({
-                            "title": item.get("title", "未知歌曲"),
-                            "author": item.get("author", "未知歌手"),
-                            "url": item.get("url", "")
-                        })
-                tasks = [is_valid_audio(session, item, headers) for item in raw_data_list]
-                results = await asyncio.gather(*tasks)
-                valid_data_list = [item for item in results if item is not None]
-                return valid_data_list
+            async for index, item in self.pager.iter_next_page(self.refresh):
+                found.append((index, item))
+                self.item_found.emit(page, index, item)
         except Exception as e:
             print(f"搜索出错: {e}")
-            return None
+            self.failed_signal.emit(str(e))
+            return
+        self.finished_signal.emit([item for _, item in sorted(found, key=lambda pair: pair[0])])
+        # 用户浏览当前页时，后台先把下一页取好
+        self.pager.prefetch()
 
 
-# 修改：增加 save_dir 参数
-async def download_single_music(url, filename, headers, save_dir):
-    if not os.path.exists(save_dir): os.makedirs(save_dir)
-    file_path = os.path.join(save_dir, filename)
-    headers["upgrade-insecure-requests"] = "1"
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers, allow_redirects=True) as res:
-                content_type = res.headers.get('Content-Type', '').lower()
-                if 'text/html' in content_type: return False
-                if res.status == 200:
-                    async with aiofiles.open(file_path, mode='wb') as fp:
-                        await fp.write(await res.read())
-                    return True
-        except:
-            pass
-    return False
+class BatchSearchJob(QObject):
+    """多关键词批量搜索，每个关键词搜完发出一组去重后的结果"""
+    group_found = pyqtSignal(dict)  # {"index", "keyword", "items", "duplicates", "error"}
+    finished_signal = pyqtSignal(int)  # 实际发出的校验请求数
 
+    def __init__(self, service, keywords, cache=None, per_keyword=None):
+        super().__init__()
+        self.service = service
+        self.keywords = keywords
+        self.cache = cache
+        self.per_keyword = per_keyword
 
-# ==========================================
-# 线程类
-# ==========================================
+    def start(self):
+        self.future = self.service.submit(self._run())
 
-class SearchThread(QThread):
-    finished_signal = pyqtSignal(list)
+    def stop(self):
+        self.future.cancel()
 
-    def __init__(self, keyword):
+    async def _run(self):
+        searcher = BatchSearch(self.service.session, self.cache, per_keyword=self.per_keyword,
+                               music_type=SEARCH_PROVIDERS)
+        async for group in searcher.run(self.keywords):
+            self.group_found.emit(group)
+        self.finished_signal.emit(searcher.probe_count)
+
+
+class DownloadQueueJob(QObject):
+    """常驻的下载队列：调度器跑在网络线程里，界面随时加入、暂停、继续、取消任务"""
+    item_changed = pyqtSignal(dict)  # 任务状态变化 (队列里的一行)
+    idle = pyqtSignal(int, int)  # 队列清空 (本轮成功数, 失败数)
+    progress = pyqtSignal(dict)  # 字节进度快照 (ProgressTracker.snapshot)，每秒最多 10 次
+
+    def __init__(self, service, queue, library=None, audio_cache=None, postprocessor=None):
         super().__init__()
-        self.keyword = keyword
+        self.service = service
+        self.queue = queue
+        self.tracker = ProgressTracker(on_update=self.progress.emit)
+        self.scheduler = DownloadScheduler(queue, service.session, library=library,
+                                           on_change=self.item_changed.emit, on_idle=self.idle.emit,
+                                           audio_cache=audio_cache, postprocessor=postprocessor,
+                                           progress=self.tracker)
 
-    def run(self):
-        result = asyncio.run(fetch_music_data(self.keyword))
-        if result is not None: self.finished_signal.emit(result)
+    def start(self):
+        self.future = self.service.submit(self.scheduler.run())
 
 
-class BatchDownloadThread(QThread):
-    all_finished = pyqtSignal(int, int)
-    progress_signal = pyqtSignal(int)  # 新增进度信号 (百分比)
+# ==========================================
+# 结果列表：模型 + 委托 (只绘制可见行)
+# ==========================================
 
-    def __init__(self, tasks, save_path):
-        super().__init__()
-        self.tasks = tasks
-        self.save_path = save_path  # 接收动态路径
+URL_ROLE = Qt.ItemDataRole.UserRole
+NAME_ROLE = Qt.ItemDataRole.UserRole + 1
+OWNED_ROLE = Qt.ItemDataRole.UserRole + 2
 
-    def run(self):
-        success_count = 0
-        fail_count = 0
-        total = len(self.tasks)
 
-        async def _batch_do():
-            nonlocal success_count, fail_count
-            headers, _ = await page_parm("")
-            for i, (idx, url, fname) in enumerate(self.tasks):
-                # 传入 save_path
-                res = await download_single_music(url, fname, headers, self.save_path)
-                if res:
-                    success_count += 1
-                else:
-                    fail_count += 1
+class TrackRecord:
+    __slots__ = ("title", "author", "url", "name", "owned")
 
-                # 计算并发送进度 (i+1) / total * 100
-                progress = int(((i + 1) / total) * 100)
-                self.progress_signal.emit(progress)
+    def __init__(self, title, author, url, owned=False):
+        self.title = title
+        self.author = author
+        self.url = url
+        self.name = f"{title} - {author}"
+        self.owned = owned
 
-            self.all_finished.emit(success_count, fail_count)
 
-        asyncio.run(_batch_do())
+class TrackListModel(QAbstractListModel):
+    """搜索结果模型。勾选状态 = 全局默认值 XOR 单独切换过的 URL，全选/取消只需 O(1)"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._records = []
+        self._all_checked = False
+        self._toggled = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._records)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        record = self._records[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole or role == NAME_ROLE:
+            return record.name
+        if role == URL_ROLE:
+            return record.url
+        if role == OWNED_ROLE:
+            return record.owned
+        if role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if self.is_checked(record) else Qt.CheckState.Unchecked
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if not index.isValid() or role != Qt.ItemDataRole.CheckStateRole: return False
+        record = self._records[index.row()]
+        if (Qt.CheckState(value) == Qt.CheckState.Checked) != self.is_checked(record):
+            self._toggled.symmetric_difference_update((record.url,))
+            self.dataChanged.emit(index, index, [role])
+        return True
+
+    def flags(self, index):
+        if not index.isValid(): return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsUserCheckable
+
+    def is_checked(self, record):
+        return self._all_checked != (record.url in self._toggled)
+
+    def insert_track(self, row, data, owned=False):
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._records.insert(row, TrackRecord(data['title'], data['author'], data['url'], owned))
+        self.endInsertRows()
+
+    def mark_owned(self, url):
+        for row, record in enumerate(self._records):
+            if record.url == url and not record.owned:
+                record.owned = True
+                self.dataChanged.emit(self.index(row), self.index(row), [OWNED_ROLE])
+
+    def clear(self):
+        self.beginResetModel()
+        self._records = []
+        self._toggled.clear()
+        self._all_checked = False
+        self.endResetModel()
+
+    def set_all_checked(self, checked):
+        self._all_checked = checked
+        self._toggled.clear()
+        if self._records:
+            self.dataChanged.emit(self.index(0), self.index(len(self._records) - 1),
+                                  [Qt.ItemDataRole.CheckStateRole])
+
+    def checked_tasks(self):
+        # 下载任务列表 [(行号, url, 文件名)]
+        return [(row, r.url, r.name + ".mp3") for row, r in enumerate(self._records) if self.is_checked(r)]
+
+
+class TrackItemDelegate(QStyledItemDelegate):
+    """自绘结果行：复选框 + 标题 + 播放按钮"""
+    play_requested = pyqtSignal(str, str)  # (url, 文件名)
+
+    ROW_HEIGHT = 48
+    PADDING = 15
+    BOX_SIZE = 18
+    PLAY_WIDTH = 36
+    TAG_WIDTH = 56
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.title_font = QFont()
+        self.title_font.setPixelSize(15)
+        self.title_font.setBold(True)
+        self.play_font = QFont()
+        self.play_font.setPixelSize(22)
+        self.tag_font = QFont()
+        self.tag_font.setPixelSize(11)
+        self.tag_font.setBold(True)
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.ROW_HEIGHT)
+
+    def _checkbox_rect(self, rect):
+        return QRect(rect.left() + self.PADDING, rect.center().y() - self.BOX_SIZE // 2,
+                     self.BOX_SIZE, self.BOX_SIZE)
+
+    def _play_rect(self, rect):
+        return QRect(rect.right() - self.PADDING - self.PLAY_WIDTH, rect.top(), self.PLAY_WIDTH, rect.height())
+
+    def paint(self, painter, option, index):
+        painter.save()
+        rect = option.rect
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        # 行分隔线
+        painter.setPen(QPen(QColor(255, 255, 255, 25), 1))
+        painter.drawLine(rect.bottomLeft(), rect.bottomRight())
+
+        # 复选框
+        box = self._checkbox_rect(rect)
+        checked = index.data(Qt.ItemDataRole.CheckStateRole) == Qt.CheckState.Checked
+        painter.setPen(QPen(QColor("white"), 2))
+        painter.setBrush(QColor("#ff7f7f") if checked else QColor(255, 255, 255, 25))
+        painter.drawRoundedRect(box, 3, 3)
+
+        # 已收录标记
+        play = self._play_rect(rect)
+        text_right = play.left()
+        if index.data(OWNED_ROLE):
+            tag = QRect(play.left() - self.TAG_WIDTH - 6, rect.center().y() - 10, self.TAG_WIDTH, 20)
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.setBrush(QColor(136, 204, 255, 200))
+            painter.drawRoundedRect(tag, 10, 10)
+            painter.setFont(self.tag_font)
+            painter.setPen(QColor("white"))
+            painter.drawText(tag, Qt.AlignmentFlag.AlignCenter, "已收录")
+            text_right = tag.left()
+
+        # 标题 (过长时省略)
+        text_rect = QRect(box.right() + 12, rect.top(), text_right - box.right() - 20, rect.height())
+        painter.setFont(self.title_font)
+        painter.setPen(QColor("white"))
+        title = QFontMetrics(self.title_font).elidedText(index.data(NAME_ROLE), Qt.TextElideMode.ElideRight,
+                                                         text_rect.width())
+        painter.drawText(text_rect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, title)
+
+        # 播放按钮
+        hovered = bool(option.state & QStyle.StateFlag.State_MouseOver)
+        painter.setFont(self.play_font)
+        painter.setPen(QColor("#ff7f7f") if hovered else QColor(255, 255, 255, 230))
+        painter.drawText(play, Qt.AlignmentFlag.AlignCenter, "▶")
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            pos = event.position().toPoint()
+            if self._play_rect(option.rect).contains(pos):
+                self.play_requested.emit(index.data(URL_ROLE), index.data(NAME_ROLE) + ".mp3")
+                return True
+            # 点击行的其余位置切换勾选
+            checked = index.data(Qt.ItemDataRole.CheckStateRole) == Qt.CheckState.Checked
+            model.setData(index, Qt.CheckState.Unchecked if checked else Qt.CheckState.Checked,
+                          Qt.ItemDataRole.CheckStateRole)
+            return True
+        return super().editorEvent(event, model, option, index)
 
 
 # ==========================================
@@ -167,7 +438,7 @@ class CuteMessageBox(QDialog):
         container_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
         self.icon_lbl = QLabel()
-        pixmap = QIcon(ICON_PATH).pixmap(QSize(60, 60))
+        pixmap = app_icon().pixmap(QSize(60, 60))
         self.icon_lbl.setPixmap(pixmap)
         container_layout.addWidget(self.icon_lbl, alignment=Qt.AlignmentFlag.AlignCenter)
 
@@ -201,37 +472,441 @@ class CuteMessageBox(QDialog):
             """QWidget#MsgBoxContainer { background-color: white; border: 3px solid #ffb3b3; border-radius: 20px; }""")
 
 
+# ==========================================
+# 自定义组件：网络统计面板
+# ==========================================
+def _format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def _format_duration(seconds):
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def _format_file_progress(p):
+    # 队列里单个文件的进度：百分比 (大小未知时显示已下载字节) + 速度 + 剩余时间
+    text = f"{p['done'] / p['total']:.0%}" if p["total"] else _format_bytes(p["done"])
+    if p["rate"] >= 1:
+        text += f"  {_format_bytes(p['rate'])}/s"
+    if p["eta"] is not None:
+        text += f"  剩 {_format_duration(p['eta'])}"
+    return text
+
+
+class NetworkStatsDialog(QDialog):
+    """实时显示各类请求 (搜索/探测/下载) 的计数、各阶段耗时和失败原因，每秒刷新"""
+    KIND_NAMES = {"search": "搜索", "probe": "校验", "download": "下载", "postprocess": "后处理", "startup": "启动"}
+    PHASE_NAMES = {"dns": "DNS", "queue": "排队", "connect": "连接", "ttfb": "首字节", "transfer": "传输",
+                   "verify": "完整性", "tags": "标签", "loudnorm": "响度", "transcode": "转码", "hash": "哈希",
+                   **StartupTimer.PHASE_NAMES, "multimedia": "多媒体"}
+
+    def __init__(self, parent, metrics=METRICS):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.setWindowTitle("📊 网络统计")
+        self.resize(560, 420)
+
+        layout = QVBoxLayout(self)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setStyleSheet("font-family: Consolas, monospace; font-size: 12px;")
+        layout.addWidget(self.text)
+
+        btn_layout = QHBoxLayout()
+        for label, suffix in (("导出 JSON", "json"), ("导出 Prometheus", "prom")):
+            btn = QPushButton(label)
+            btn.clicked.connect(lambda _=False, suffix=suffix: self.export(suffix))
+            btn_layout.addWidget(btn)
+        btn_reset = QPushButton("清零")
+        btn_reset.clicked.connect(self.reset)
+        btn_layout.addStretch()
+        btn_layout.addWidget(btn_reset)
+        layout.addLayout(btn_layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self.refresh()
+
+    def refresh(self):
+        snap = self.metrics.snapshot()
+        lines = [f"统计时长 {snap['uptime_s']:.0f} 秒", ""]
+        for kind, data in sorted(snap["kinds"].items()):
+            requests = sum(data["requests"].values())
+            statuses = ", ".join(f"{k}×{v}" for k, v in sorted(data["requests"].items()))
+            failures = sum(data["failures"].values())
+            lines.append(f"【{self.KIND_NAMES.get(kind, kind)}】请求 {requests} ({statuses or '-'})  "
+                         f"成功 {data['success']}  失败 {failures}")
+            lines.append(f"  接收 {_format_bytes(data['bytes'])}  新建连接 {data['connections_created']}  "
+                         f"复用连接 {data['connections_reused']}  DNS 缓存命中 {data['dns_cache_hits']}")
+            lines.append(f"  重试 {data['retries']}  并发收缩 {data['concurrency_decreases']}  对冲 {data['hedges']}  "
+                         f"限速等待 {data['bandwidth_waits']}")
+            if data["providers"]:
+                lines.append("  来源: " + ", ".join(
+                    f"{provider}(" + " ".join(f"{result}×{n}" for result, n in sorted(counts.items())) + ")"
+                    for provider, counts in sorted(data["providers"].items())))
+            for phase, name in self.PHASE_NAMES.items():
+                p = data["phases_ms"].get(phase)
+                if p:
+                    lines.append(f"  {name:<4} 平均 {p['mean']:>8.1f} ms   p50≤{p['p50']}  p90≤{p['p90']}  "
+                                 f"p99≤{p['p99']}  (n={p['count']})")
+            if data["failures"]:
+                top = sorted(data["failures"].items(), key=lambda kv: -kv[1])
+                lines.append("  失败原因: " + ", ".join(f"{reason}×{n}" for reason, n in top))
+            lines.append("")
+        if not snap["kinds"]:
+            lines.append("还没有网络请求~")
+        lines += ["", "【带宽】限速 " + (f"{_format_bytes(BANDWIDTH.limit)}/s" if BANDWIDTH.limit else "不限") +
+                  (f"  链路估计 {_format_bytes(BANDWIDTH.link_rate)}/s" if BANDWIDTH.link_rate else "") +
+                  ("  交互优先中" if BANDWIDTH.interactive_active() else "")]
+        providers = PROVIDER_STATS.snapshot()
+        if providers:
+            # 按下次搜索时的优先顺序列出
+            lines += ["", "【搜索来源】(按优先顺序)"]
+            for provider in PROVIDER_STATS.ranked(providers):
+                s = providers[provider]
+                lines.append(f"  {provider:<8} 平均 {s['latency'] * 1000:>7.0f} ms  有结果 {s['success']:>4.0%}  "
+                             f"(n={s['count']})")
+        # 保持滚动位置，避免每秒刷新时跳回顶部
+        bar = self.text.verticalScrollBar()
+        pos = bar.value()
+        self.text.setPlainText("\n".join(lines))
+        bar.setValue(pos)
+
+    def export(self, suffix):
+        path, _ = QFileDialog.getSaveFileName(self, "导出网络统计", f"maoer_metrics.{suffix}")
+        if not path: return
+        try:
+            self.metrics.export(path)
+        except OSError as e:
+            QMessageBox.warning(self, "导出失败", str(e))
+
+    def reset(self):
+        self.metrics.reset()
+        self.refresh()
+
+
+# ==========================================
+# 自定义组件：下载队列
+# ==========================================
+class DownloadQueueDialog(QDialog):
+    """下载队列：查看每个任务的状态，暂停/继续/取消/置顶，可多选"""
+    STATE_NAMES = {"queued": "⏳ 排队中", "running": "📶 下载中", "paused": "⏸ 已暂停", "done": "✅ 已完成",
+                   "failed": "⚠ 失败", "cancelled": "✖ 已取消"}
+
+    def __init__(self, parent, job):
+        super().__init__(parent)
+        self.job = job
+        self.setWindowTitle("📥 下载队列")
+        self.resize(620, 420)
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["曲目", "状态", "进度", "优先级"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        btn_layout = QHBoxLayout()
+        scheduler = job.scheduler
+        for label, action in (("⏸ 暂停", scheduler.pause), ("▶ 继续", scheduler.resume),
+                              ("✖ 取消", scheduler.cancel), ("⬆ 置顶", scheduler.move_to_top)):
+            btn = QPushButton(label)
+            btn.clicked.connect(lambda _=False, action=action: self.apply_to_selected(action))
+            btn_layout.addWidget(btn)
+        btn_layout.addStretch()
+        btn_clear = QPushButton("清除已结束")
+        btn_clear.clicked.connect(self.clear_finished)
+        btn_layout.addWidget(btn_clear)
+        layout.addLayout(btn_layout)
+
+        self.rows = {}  # 文件完整路径 -> 行号，进度更新时只改那一格
+        self.last_progress = {}
+        job.item_changed.connect(self.refresh)
+        job.progress.connect(self.update_progress)
+        self.refresh()
+
+    def selected_ids(self):
+        rows = {index.row() for index in self.table.selectionModel().selectedRows()}
+        return [self.table.item(row, 0).data(Qt.ItemDataRole.UserRole) for row in sorted(rows)]
+
+    def apply_to_selected(self, action):
+        for item_id in self.selected_ids():
+            action(item_id)
+
+    def clear_finished(self):
+        self.job.queue.clear_finished()
+        self.refresh()
+
+    def refresh(self, *_):
+        if not self.isVisible(): return
+        selected = set(self.selected_ids())
+        items = self.job.queue.items()
+        self.table.setRowCount(len(items))
+        self.rows = {}
+        for row, item in enumerate(items):
+            path = os.path.join(item["save_dir"], item["filename"])
+            name_item = QTableWidgetItem(os.path.splitext(item["filename"])[0])
+            name_item.setData(Qt.ItemDataRole.UserRole, item["id"])
+            name_item.setToolTip(path)
+            self.table.setItem(row, 0, name_item)
+            self.table.setItem(row, 1, QTableWidgetItem(self.STATE_NAMES.get(item["state"], item["state"])))
+            progress = self.last_progress.get(path) if item["state"] == "running" else None
+            self.table.setItem(row, 2, QTableWidgetItem(_format_file_progress(progress) if progress else ""))
+            self.table.setItem(row, 3, QTableWidgetItem(str(item["priority"])))
+            self.rows[path] = row
+            if item["id"] in selected:
+                self.table.selectRow(row)
+
+    def update_progress(self, snapshot):
+        self.last_progress = snapshot["files"]
+        if not self.isVisible(): return
+        for path, progress in self.last_progress.items():
+            row = self.rows.get(path)
+            if row is not None:
+                self.table.item(row, 2).setText(_format_file_progress(progress))
+
+    def showEvent(self, event):
+        self.refresh()
+        super().showEvent(event)
+
+
+# ==========================================
+# 自定义组件：批量搜索
+# ==========================================
+class BatchSearchDialog(QDialog):
+    """批量搜索：每行一个关键词，并发搜索，结果按关键词分组、跨关键词去重，勾选后一键加入下载队列"""
+    URL_ROLE = Qt.ItemDataRole.UserRole
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.app = parent
+        self.job = None
+        self.groups = {}  # 关键词序号 -> 分组节点
+        self.setWindowTitle("📋 批量搜索")
+        self.resize(640, 560)
+
+        layout = QVBoxLayout(self)
+        self.input_keywords = QPlainTextEdit()
+        self.input_keywords.setPlaceholderText("每行一个歌名，可以直接粘贴整张歌单~")
+        self.input_keywords.setFixedHeight(130)
+        layout.addWidget(self.input_keywords)
+
+        option_layout = QHBoxLayout()
+        option_layout.addWidget(QLabel("每个关键词取前"))
+        self.spin_per_keyword = QSpinBox()
+        self.spin_per_keyword.setRange(1, 20)
+        self.spin_per_keyword.setValue(3)
+        option_layout.addWidget(self.spin_per_keyword)
+        option_layout.addWidget(QLabel("条（默认只勾选第一条）"))
+        option_layout.addStretch()
+        self.btn_start = QPushButton("🔍 开始搜索")
+        self.btn_start.clicked.connect(self.start_or_stop)
+        option_layout.addWidget(self.btn_start)
+        layout.addLayout(option_layout)
+
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.itemDoubleClicked.connect(self.preview_item)
+        layout.addWidget(self.tree)
+
+        bottom_layout = QHBoxLayout()
+        self.status_lbl = QLabel("双击结果可以试听")
+        bottom_layout.addWidget(self.status_lbl)
+        bottom_layout.addStretch()
+        self.btn_download = QPushButton("⬇ 下载勾选")
+        self.btn_download.clicked.connect(self.download_checked)
+        bottom_layout.addWidget(self.btn_download)
+        layout.addLayout(bottom_layout)
+
+    def keywords(self):
+        # 去掉空行和重复的关键词，保持原顺序
+        seen = set()
+        result = []
+        for line in self.input_keywords.toPlainText().splitlines():
+            kw = line.strip()
+            if kw and kw.casefold() not in seen:
+                seen.add(kw.casefold())
+                result.append(kw)
+        return result
+
+    def start_or_stop(self):
+        if self.job is not None:
+            self.job.stop()
+            self.on_finished(None)
+            return
+        keywords = self.keywords()
+        if not keywords: return
+        self.tree.clear()
+        self.groups = {}
+        for index, kw in enumerate(keywords):
+            group = QTreeWidgetItem(self.tree, [f"⏳ {kw}"])
+            group.setFlags(group.flags() | Qt.ItemFlag.ItemIsUserCheckable | Qt.ItemFlag.ItemIsAutoTristate)
+            group.setCheckState(0, Qt.CheckState.Unchecked)
+            self.groups[index] = group
+        self.found_count = 0
+        self.done_count = 0
+        self.btn_start.setText("⏹ 停止")
+        self.status_lbl.setText(f"📡 正在搜索 {len(keywords)} 个关键词...")
+        self.job = BatchSearchJob(self.app.network, keywords, self.app.search_cache, self.spin_per_keyword.value())
+        self.job.group_found.connect(self.on_group_found)
+        self.job.finished_signal.connect(self.on_finished)
+        self.job.start()
+
+    def on_group_found(self, group):
+        if self.sender() is not self.job: return
+        node = self.groups[group["index"]]
+        kw = group["keyword"]
+        items = group["items"]
+        if group["error"]:
+            node.setText(0, f"⚠ {kw} — 搜索失败")
+            node.setToolTip(0, group["error"])
+        elif not items:
+            node.setText(0, f"🐾 {kw} — 没有找到" + (f"（{group['duplicates']} 条与其它关键词重复）"
+                                                  if group["duplicates"] else ""))
+        else:
+            node.setText(0, f"🎵 {kw}（{len(items)} 条）")
+        for i, data in enumerate(items):
+            name = f"{data['title']} - {data['author']}"
+            owned = self.app.library.find(data['url'], name, self.app.download_path) is not None
+            child = QTreeWidgetItem(node, [name + ("  [已收录]" if owned else "")])
+            child.setData(0, self.URL_ROLE, (data['url'], name))
+            child.setFlags(child.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            child.setCheckState(0, Qt.CheckState.Checked if i == 0 and not owned else Qt.CheckState.Unchecked)
+        node.setExpanded(bool(items))
+        self.found_count += len(items)
+        self.done_count += 1
+        self.status_lbl.setText(f"📡 已完成 {self.done_count}/{len(self.groups)} 个关键词，共 {self.found_count} 条")
+
+    def on_finished(self, probe_count):
+        if probe_count is not None and self.sender() is not self.job: return
+        self.job = None
+        self.btn_start.setText("🔍 开始搜索")
+        text = f"✨ 完成 {self.done_count}/{len(self.groups)} 个关键词，共 {self.found_count} 条"
+        self.status_lbl.setText(text + (f"，校验 {probe_count} 个链接" if probe_count is not None else "（已停止）"))
+
+    def checked_items(self):
+        result = []
+        for index in sorted(self.groups):
+            node = self.groups[index]
+            for i in range(node.childCount()):
+                child = node.child(i)
+                if child.checkState(0) == Qt.CheckState.Checked:
+                    result.append(child.data(0, self.URL_ROLE))
+        return result
+
+    def download_checked(self):
+        added = skipped = 0
+        for url, name in self.checked_items():
+            fname = name + ".mp3"
+            if self.app.library.find(url, fname, self.app.download_path) is not None:
+                skipped += 1
+            elif self.app.queue_job.scheduler.add(url, fname, self.app.download_path) is not None:
+                added += 1
+        self.status_lbl.setText(f"📥 已加入下载队列 {added} 首" + (f"，跳过 {skipped} 首已收录" if skipped else ""))
+        if added:
+            self.app.update_queue_progress()
+
+    def preview_item(self, item, column):
+        data = item.data(0, self.URL_ROLE)
+        if data:
+            self.app.play_specific_music(data[0], data[1] + ".mp3")
+
+    def closeEvent(self, event):
+        if self.job is not None:
+            self.job.stop()
+            self.job = None
+        super().closeEvent(event)
+
+
 # ==========================================
 # UI 界面
 # ==========================================
 
+class WallpaperWidget(QWidget):
+    """铺满窗口的壁纸：按当前尺寸缩放一次后缓存，重绘时直接贴图，只有尺寸变了才重新缩放"""
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self._scaled = None
+
+    def paintEvent(self, event):
+        source = load_pixmap(self.path)
+        if source is not None:
+            # 按物理像素缩放，高分屏上也清晰
+            ratio = self.devicePixelRatioF()
+            size = self.size() * ratio
+            if self._scaled is None or self._scaled.size() != size or self._scaled.devicePixelRatio() != ratio:
+                self._scaled = source.scaled(size, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                             Qt.TransformationMode.SmoothTransformation)
+                self._scaled.setDevicePixelRatio(ratio)
+            painter = QPainter(self)
+            painter.drawPixmap(0, 0, self._scaled)
+            painter.end()
+        STARTUP.frame_painted()
+
+
 class MusicApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("猫耳下载器")  # 更新版本号
         self.resize(1050, 680)
-        self.setWindowIcon(QIcon(ICON_PATH))
+        self.setWindowIcon(app_icon())
 
         # --- 1. 初始化设置 (保存路径) ---
         self.settings = QSettings("MyTeam", "CatMusicApp")
         # 默认路径
         default_path = os.path.join(os.getcwd(), "music_downloaded")
         self.download_path = self.settings.value("download_path", default_path)
-
-        self.media_player = QMediaPlayer()
-        self.audio_output = QAudioOutput()
-        self.media_player.setAudioOutput(self.audio_output)
-        self.audio_output.setVolume(0.5)
+        # 全局限速 (KB/s，0 为不限速)；试听、搜索始终优先于批量下载
+        BANDWIDTH.set_limit(self.settings.value("bandwidth_limit_kb", 0, type=int) * 1024)
+        STARTUP.mark("settings")
+
+        # --- 2. 启动常驻网络线程 (共享连接池) ---
+        self.network = NetworkService()
+        self.network.start_service()
+        self.search_cache = SearchCache()
+        self.library = LibraryIndex()
+        self.rescan_library()
+        # 试听经本地回环代理播放，数据同时写进音频缓存；之后下载同一首直接从缓存复制
+        self.audio_cache = AudioCache()
+        self.stream_proxy = StreamProxy(self.audio_cache, self.network.session)
+        self.network.submit(self.stream_proxy.start())
+        # 下载队列持久化在磁盘上，上次没下完的任务启动后自动继续
+        self.download_queue = DownloadQueue()
+        # 下载完成后的校验、写标签、算哈希在进程池里做
+        self.postprocessor = PostProcessor()
+        self.queue_job = DownloadQueueJob(self.network, self.download_queue, self.library, self.audio_cache,
+                                          self.postprocessor)
+        self.queue_job.item_changed.connect(self.on_queue_item_changed)
+        self.queue_job.idle.connect(self.on_queue_idle)
+        self.queue_job.progress.connect(self.on_queue_progress)
+        self.queue_finished = 0  # 本轮已结束的任务数，用来算总进度
+        self.queue_progress = None  # 最近一次的字节进度快照
+        STARTUP.mark("services")
+
+        # 播放器第一次试听时才创建 (ensure_player)
+        self.media_player = None
+        self.audio_output = None
 
         self.init_ui()
-        self.apply_styles()
         self.update_empty_state()  # 初始化空状态
-
-        self.media_player.positionChanged.connect(self.update_position)
-        self.media_player.durationChanged.connect(self.update_duration)
+        STARTUP.mark("ui")
+        self.apply_styles()
+        STARTUP.mark("styles")
+        self.resume_download_queue()
 
     def init_ui(self):
-        self.central_widget = QWidget()
+        self.central_widget = WallpaperWidget(BG_PATH)
         self.central_widget.setObjectName("CentralWidget")
         self.setCentralWidget(self.central_widget)
 
@@ -247,6 +922,13 @@ class MusicApp(QMainWindow):
         self.input_search = QLineEdit()
         self.input_search.setPlaceholderText("输入歌名搜索...")
         self.input_search.returnPressed.connect(self.start_search)
+        self.input_search.textEdited.connect(self.schedule_live_search)
+        # 边打字边搜索的防抖定时器：每次输入重新计时
+        self.live_search_timer = QTimer(self)
+        self.live_search_timer.setSingleShot(True)
+        self.live_search_timer.setInterval(LIVE_SEARCH_DELAY_MS)
+        self.live_search_timer.timeout.connect(self.start_live_search)
+        QShortcut(QKeySequence("F5"), self, activated=self.refresh_search)
 
         self.btn_search = QPushButton("搜索")
         self.btn_search.clicked.connect(self.start_search)
@@ -254,6 +936,10 @@ class MusicApp(QMainWindow):
         self.btn_clear = QPushButton("清空")
         self.btn_clear.clicked.connect(self.clear_results)
 
+        # 新增：批量搜索按钮
+        self.btn_batch_search = QPushButton("📋 批量")
+        self.btn_batch_search.clicked.connect(self.show_batch_search)
+
         # 新增：设置按钮
         self.btn_settings = QPushButton("⚙️ 设置路径")
         self.btn_settings.setStyleSheet("background-color: #88ccff;")
@@ -268,7 +954,20 @@ class MusicApp(QMainWindow):
         top_layout.addWidget(self.input_search)
         top_layout.addWidget(self.btn_search)
         top_layout.addWidget(self.btn_clear)
+        top_layout.addWidget(self.btn_batch_search)
+        # 新增：网络统计按钮
+        self.btn_stats = QPushButton("📊 统计")
+        self.btn_stats.setStyleSheet("background-color: #99cc99;")
+        self.btn_stats.clicked.connect(self.show_network_stats)
+
+        # 新增：下载队列按钮
+        self.btn_queue = QPushButton("📥 队列")
+        self.btn_queue.setStyleSheet("background-color: #cc99ff;")
+        self.btn_queue.clicked.connect(self.show_download_queue)
+
         top_layout.addWidget(self.btn_settings)  # 添加到布局
+        top_layout.addWidget(self.btn_queue)
+        top_layout.addWidget(self.btn_stats)
         top_layout.addWidget(self.btn_about)  # 添加到布局
 
         layout.addWidget(top_container)
@@ -281,7 +980,12 @@ class MusicApp(QMainWindow):
         self.btn_download_selected = QPushButton("下载选中内容")
         self.btn_download_selected.setObjectName("BatchBtn")
         self.btn_download_selected.clicked.connect(self.start_batch_download)
+        self.btn_load_more = QPushButton("加载更多")
+        self.btn_load_more.setObjectName("BatchBtn")
+        self.btn_load_more.clicked.connect(self.load_more_results)
+        self.btn_load_more.setEnabled(False)
         batch_layout.addWidget(self.btn_select_all)
+        batch_layout.addWidget(self.btn_load_more)
         batch_layout.addStretch()
         batch_layout.addWidget(self.btn_download_selected)
         layout.addLayout(batch_layout)
@@ -293,10 +997,20 @@ class MusicApp(QMainWindow):
         list_area_layout.setContentsMargins(0, 0, 0, 0)
 
         # 1. 正常列表
-        self.list_widget = QListWidget()
-        self.list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)  # 开启右键菜单
-        self.list_widget.customContextMenuRequested.connect(self.show_context_menu)
-        list_area_layout.addWidget(self.list_widget)
+        self.result_model = TrackListModel(self)
+        self.result_delegate = TrackItemDelegate(self)
+        self.result_delegate.play_requested.connect(self.play_specific_music)
+        self.result_view = QListView()
+        self.result_view.setModel(self.result_model)
+        self.result_view.setItemDelegate(self.result_delegate)
+        self.result_view.setUniformItemSizes(True)
+        self.result_view.setMouseTracking(True)
+        self.result_view.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.result_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)  # 开启右键菜单
+        self.result_view.customContextMenuRequested.connect(self.show_context_menu)
+        # 滚动到底部自动加载下一页
+        self.result_view.verticalScrollBar().valueChanged.connect(self.on_list_scrolled)
+        list_area_layout.addWidget(self.result_view)
 
         # 2. 空状态提示 (默认隐藏)
         self.empty_state_lbl = QLabel()
@@ -353,10 +1067,10 @@ class MusicApp(QMainWindow):
 
         # 新增：下载进度条
         self.download_progress = QProgressBar()
-        self.download_progress.setRange(0, 100)
+        self.download_progress.setRange(0, 1000)  # 千分比，大文件下载时进度条也能连续前进
         self.download_progress.setValue(0)
         self.download_progress.setTextVisible(True)
-        self.download_progress.setFixedWidth(200)
+        self.download_progress.setFixedWidth(260)
         self.download_progress.setVisible(False)  # 默认隐藏，下载时显示
         # 进度条样式
         self.download_progress.setStyleSheet("""
@@ -368,34 +1082,42 @@ class MusicApp(QMainWindow):
         self.status_label.setObjectName("StatusLabel")
         self.status_label.setAlignment(Qt.AlignmentFlag.AlignRight)
 
+        # 下载限速，随时可改，立即生效
+        self.spin_bandwidth = QSpinBox()
+        self.spin_bandwidth.setRange(0, 1024 * 1024)
+        self.spin_bandwidth.setSingleStep(256)
+        self.spin_bandwidth.setPrefix("限速 ")
+        self.spin_bandwidth.setSuffix(" KB/s")
+        self.spin_bandwidth.setSpecialValueText("不限速")
+        self.spin_bandwidth.setToolTip("所有传输共用的带宽上限；试听和搜索优先，批量下载让路")
+        self.spin_bandwidth.setValue(BANDWIDTH.limit // 1024)
+        self.spin_bandwidth.valueChanged.connect(self.set_bandwidth_limit)
+
         status_layout.addWidget(self.download_progress)
+        status_layout.addWidget(self.spin_bandwidth)
         status_layout.addStretch()
         status_layout.addWidget(self.status_label)
         layout.addLayout(status_layout)
 
         self.all_selected = False
+        self.search_job = None
+        self.search_pager = None
+        self.search_busy = False
+        self.result_order = []  # 已显示结果的 (页码, 原始序号)，用来保持列表顺序稳定
 
     def apply_styles(self):
-        bg_path_css = BG_PATH.replace('\\', '/')
+        # 壁纸由 WallpaperWidget 自己画 (缩放结果缓存)，不用 border-image：它每次重绘都要重新缩放整张图
         style = f"""
-        QWidget#CentralWidget {{ border-image: url("{bg_path_css}") 0 0 0 0 stretch stretch; }}
         QWidget#TopContainer, QWidget#PlayerContainer {{ 
             background-color: rgba(255, 255, 255, 0.85); 
             border-radius: 12px; padding: 10px; 
         }}
-        QCheckBox {{ spacing: 8px; color: white; }}
-        QCheckBox::indicator {{ width: 18px; height: 18px; border: 2px solid white; border-radius: 3px; background: rgba(255, 255, 255, 0.1); }}
-        QCheckBox::indicator:checked {{ background-color: #ff7f7f; }}
         QLabel {{ font-size: 14px; color: #333; font-weight: bold; }}
         QLineEdit {{ padding: 8px; border-radius: 5px; background: white; border: 1px solid #ff7f7f; }}
         QPushButton {{ padding: 8px 15px; border-radius: 6px; color: white; background-color: #ff7f7f; font-weight: bold; }}
         QPushButton#ClosePlayerBtn {{ background: transparent; color: #ff7f7f; font-size: 20px; padding: 0; }}
         QPushButton#ClosePlayerBtn:hover {{ color: #ff3333; }}
-        QListWidget {{ background-color: rgba(30, 30, 30, 0.6); border-radius: 10px; outline: none; border: 1px solid rgba(255,255,255,0.2); }}
-        QListWidget::item {{ border-bottom: 1px solid rgba(255, 255, 255, 0.1); }}
-        QLabel#ItemTitle {{ font-size: 15px; color: #ffffff; padding: 2px; }}
-        QPushButton#ItemPlayBtn {{ background: transparent; color: rgba(255,255,255,0.9); font-size: 22px; padding: 0 5px; }}
-        QPushButton#ItemPlayBtn:hover {{ color: #ff7f7f; }}
+        QListView {{ background-color: rgba(30, 30, 30, 0.6); border-radius: 10px; outline: none; border: 1px solid rgba(255,255,255,0.2); }}
         """
         self.setStyleSheet(style)
 
@@ -409,27 +1131,51 @@ class MusicApp(QMainWindow):
             # 保存到配置
             self.settings.setValue("download_path", self.download_path)
             self.status_label.setText(f"📁 窝搬家啦: {self.download_path}")
+            self.rescan_library()
+
+    def rescan_library(self):
+        # 后台增量扫描下载目录，更新曲库索引
+        self.network.submit(asyncio.to_thread(self.library.scan, self.download_path))
 
     # 2. 空状态管理
     def update_empty_state(self):
-        has_items = self.list_widget.count() > 0
-        self.list_widget.setVisible(has_items)
+        has_items = self.result_model.rowCount() > 0
+        self.result_view.setVisible(has_items)
         self.empty_state_lbl.setVisible(not has_items)
 
         if not has_items:
-            # 这里加载图片，如果图片不存在则显示文字
-            if os.path.exists(EMPTY_STATE_IMG):
-                pix = QPixmap(EMPTY_STATE_IMG).scaled(200, 200, Qt.AspectRatioMode.KeepAspectRatio)
+            # 这里加载图片 (只读盘、缩放一次)，如果图片不存在则显示文字
+            pix = load_pixmap(EMPTY_STATE_IMG, 200, 200)
+            if pix is not None:
                 self.empty_state_lbl.setPixmap(pix)
             else:
                 # 默认萌系文字
                 self.empty_state_lbl.setText("🐾 猫耳空空...附近没有可捕捉的信号。\n\n换个频率（关键词）试试？\n或者只是想发呆喵？")
 
+    def show_network_stats(self):
+        # 非模态窗口，边下载边看
+        if getattr(self, "stats_dialog", None) is None:
+            self.stats_dialog = NetworkStatsDialog(self)
+        self.stats_dialog.show()
+        self.stats_dialog.raise_()
+
+    def show_batch_search(self):
+        if getattr(self, "batch_search_dialog", None) is None:
+            self.batch_search_dialog = BatchSearchDialog(self)
+        self.batch_search_dialog.show()
+        self.batch_search_dialog.raise_()
+
+    def show_download_queue(self):
+        if getattr(self, "queue_dialog", None) is None:
+            self.queue_dialog = DownloadQueueDialog(self, self.queue_job)
+        self.queue_dialog.show()
+        self.queue_dialog.raise_()
+
     # 3. 法律与合规性弹窗
     def show_disclaimer(self):
         msg = QMessageBox(self)
         msg.setWindowTitle("关于猫耳下载器")
-        msg.setIconPixmap(QIcon(ICON_PATH).pixmap(64, 64))
+        msg.setIconPixmap(app_icon().pixmap(64, 64))
         text = (
             "<h3>🎧 猫耳下载器 (CatEar Downloader) v1.1</h3>"
             "<p>猫耳是一款专注于高灵敏音频信号嗅探与收录的轻量化工具。</p>"
@@ -447,13 +1193,13 @@ class MusicApp(QMainWindow):
 
     # 4. 右键菜单
     def show_context_menu(self, pos):
-        item = self.list_widget.itemAt(pos)
-        if not item: return
+        index = self.result_view.indexAt(pos)
+        if not index.isValid(): return
 
         menu = QMenu(self)
         # 获取真实数据
-        url = item.data(Qt.ItemDataRole.UserRole)
-        name = item.data(Qt.ItemDataRole.UserRole + 1)
+        url = index.data(URL_ROLE)
+        name = index.data(NAME_ROLE)
 
         # 动作1: 复制歌名
         action_copy_name = QAction("📄 复制歌名", self)
@@ -469,73 +1215,178 @@ class MusicApp(QMainWindow):
 
     # ================= 原有逻辑修改 =================
 
-    def start_search(self):
+    def refresh_search(self):
+        # F5：跳过缓存，重新搜索当前关键词
+        self.start_search(refresh=True)
+
+    def schedule_live_search(self, text):
+        if self.settings.value("live_search", True, type=bool):
+            self.live_search_timer.start()
+
+    def start_live_search(self):
+        # 关键词没变 (比如只多打了个空格) 就不重新搜索
+        kw = self.input_search.text().strip()
+        if self.search_pager is not None and self.search_pager.kw == kw: return
+        self.start_search()
+
+    def start_search(self, refresh=False):
+        self.live_search_timer.stop()
         kw = self.input_search.text().strip()
-        if not kw: return
+        if not kw:
+            # 搜索框清空了：还在进行的搜索不要再往列表里填结果，已显示的结果保留
+            if self.search_busy:
+                self.close_search_pager()
+                self.btn_load_more.setEnabled(False)
+                self.status_label.setText("🔇 搜索已取消")
+            return
         self.status_label.setText("📡 猫耳正在全力捕捉音频频率... ( •̀ ω •́ )y")
-        self.list_widget.clear()
+        self.result_model.clear()
         self.update_empty_state()  # 刷新状态
 
-        self.search_thread = SearchThread(kw)
-        self.search_thread.finished_signal.connect(self.on_search_finished)
-        self.search_thread.start()
+        self.close_search_pager()
+        self.result_order = []
+        self.search_pager = SearchPager(kw, self.network.session, self.search_cache, music_type=SEARCH_PROVIDERS)
+        self.run_search_job(refresh)
+
+    def load_more_results(self):
+        if self.search_busy or self.search_pager is None or self.search_pager.exhausted: return
+        self.status_label.setText(f"📡 正在加载第 {self.search_pager.next_page} 页...")
+        self.run_search_job()
+
+    def run_search_job(self, refresh=False):
+        self.search_busy = True
+        self.btn_load_more.setEnabled(False)
+        self.search_job = SearchJob(self.network, self.search_pager, refresh)
+        self.search_job.item_found.connect(self.on_search_item)
+        self.search_job.finished_signal.connect(self.on_search_finished)
+        self.search_job.failed_signal.connect(self.on_search_failed)
+        self.search_job.start()
+
+    def close_search_pager(self):
+        # 旧搜索还在进行就直接取消，不再占用连接；迟到的信号由 sender 检查丢弃
+        if self.search_job is not None:
+            self.search_job.stop()
+        # 预取任务属于网络线程的事件循环，要在那边取消
+        if self.search_pager is not None:
+            self.network.loop.call_soon_threadsafe(self.search_pager.close)
+            self.search_pager = None
+        self.search_job = None
+        self.search_busy = False
+
+    def on_list_scrolled(self, value):
+        bar = self.result_view.verticalScrollBar()
+        if bar.maximum() > 0 and value >= bar.maximum():
+            self.load_more_results()
+
+    def on_search_item(self, page, index, data):
+        # 旧搜索迟到的结果直接丢弃
+        if self.sender() is not self.search_job: return
+        # 按 (页码, 原始序号) 插入，先到的结果不会因为后到的而乱序
+        key = (page, index)
+        row = bisect.bisect(self.result_order, key)
+        self.result_order.insert(row, key)
+        self.add_result_row(data, row)
+        self.status_label.setText(f"📡 已捕捉到 {len(self.result_order)} 束音频信号，继续监听中...")
+        if len(self.result_order) == 1:
+            self.update_empty_state()
 
     def on_search_finished(self, data_list):
-        self.status_label.setText(f"✨ 成功解调出 {len(data_list)} 束音频信号！快来挑选吧~")
-        for data in data_list:
-            name = f"{data['title']} - {data['author']}"
-            item = QListWidgetItem()
-            item.setData(Qt.ItemDataRole.UserRole, data['url'])
-            item.setData(Qt.ItemDataRole.UserRole + 1, name)
-
-            container = QWidget()
-            layout = QHBoxLayout(container)
-            layout.setContentsMargins(15, 12, 15, 12)
-            cb = QCheckBox()
-            layout.addWidget(cb)
-            lbl = QLabel(name)
-            lbl.setObjectName("ItemTitle")
-            lbl.setWordWrap(True)
-            layout.addWidget(lbl, 1)
-            play_btn = QPushButton("▶")
-            play_btn.setObjectName("ItemPlayBtn")
-            play_btn.setCursor(Qt.CursorShape.PointingHandCursor)
-            play_btn.clicked.connect(partial(self.play_specific_music, data['url'], name + ".mp3"))
-            layout.addWidget(play_btn)
-
-            self.list_widget.addItem(item)
-            item.setSizeHint(container.sizeHint())
-            self.list_widget.setItemWidget(item, container)
-
+        if self.sender() is not self.search_job: return
+        self.search_busy = False
+        self.btn_load_more.setEnabled(not self.search_pager.exhausted)
+        if self.search_pager.exhausted and self.result_order:
+            self.status_label.setText(f"🐾 已经到底啦，共 {len(self.result_order)} 束音频信号~")
+        else:
+            self.status_label.setText(f"✨ 成功解调出 {len(self.result_order)} 束音频信号！快来挑选吧~")
+        stats = self.search_cache.stats()
+        self.status_label.setToolTip(f"搜索缓存：命中 {stats['hits']} 次 / 未命中 {stats['misses']} 次（F5 强制刷新）")
         self.update_empty_state()  # 搜索完检查是否为空
 
+    def on_search_failed(self, reason):
+        if self.sender() is not self.search_job: return
+        self.search_busy = False
+        # 失败的页码可以重试
+        self.search_pager.next_page -= 1
+        self.btn_load_more.setEnabled(True)
+        self.status_label.setText("⚠ 信号受到干扰，搜索失败，稍后再试试？")
+        self.update_empty_state()
+
+    def add_result_row(self, data, row):
+        owned = self.library.find(data['url'], f"{data['title']} - {data['author']}", self.download_path)
+        self.result_model.insert_track(row, data, owned is not None)
+
     def start_batch_download(self):
-        tasks = []
-        for i in range(self.list_widget.count()):
-            item = self.list_widget.item(i)
-            w = self.list_widget.itemWidget(item)
-            cb = w.findChild(QCheckBox)
-            if cb and cb.isChecked():
-                tasks.append((i, item.data(Qt.ItemDataRole.UserRole), item.data(Qt.ItemDataRole.UserRole + 1) + ".mp3"))
+        tasks = self.result_model.checked_tasks()
         if not tasks:
             self.status_label.setText("⚠ 尚未锁定信号源，请勾选音轨！")
             return
+        # 曲库里已经有的直接跳过，不发任何网络请求；已经在队列里的不会重复加入
+        added = skipped = 0
+        for _, url, fname in tasks:
+            if self.library.find(url, fname, self.download_path) is not None:
+                skipped += 1
+            elif self.queue_job.scheduler.add(url, fname, self.download_path) is not None:
+                added += 1
+        if not added:
+            self.status_label.setText(f"📦 选中的 {len(tasks)} 首都已收录或已在队列中，无需重复下载~")
+            return
 
-        self.status_label.setText("🚀 正在高速传输音频数据流... 📶")
-        self.btn_download_selected.setEnabled(False)
-
-        # 显示并重置进度条
-        self.download_progress.setVisible(True)
-        self.download_progress.setValue(0)
-
-        # 传递 self.download_path (用户设置的路径)
-        self.batch_thread = BatchDownloadThread(tasks, self.download_path)
-        self.batch_thread.all_finished.connect(self.on_batch_finished)
-        self.batch_thread.progress_signal.connect(self.download_progress.setValue)  # 连接进度信号
-        self.batch_thread.start()
-
-    def on_batch_finished(self, s, f):
-        self.btn_download_selected.setEnabled(True)
+        self.status_label.setText(f"🚀 已加入下载队列 {added} 首，正在高速传输音频数据流... 📶" +
+                                  (f"（已跳过 {skipped} 首已收录）" if skipped else ""))
+        self.update_queue_progress()
+
+    def resume_download_queue(self):
+        # 启动调度器；上次退出时没下完的任务自动继续
+        pending = self.download_queue.counts().get("queued", 0)
+        if pending:
+            self.status_label.setText(f"📥 继续上次未完成的 {pending} 个下载任务")
+        self.update_queue_progress()
+        self.queue_job.start()
+
+    def update_queue_progress(self):
+        # 总进度按文件计：每个已结束的算 1，下载中的按已下载字节算零头；暂停的不计入
+        counts = self.download_queue.counts()
+        pending = counts.get("queued", 0) + counts.get("running", 0)
+        if not pending:
+            self.queue_finished = 0
+        self.download_progress.setVisible(pending > 0)
+        if not pending: return
+        snap = self.queue_progress
+        files = snap["files"].values() if snap else ()
+        partial = sum(p["done"] / p["total"] for p in files if p["total"])
+        fraction = min(1.0, (self.queue_finished + partial) / (self.queue_finished + pending))
+        self.download_progress.setValue(int(fraction * 1000))
+        text = f"{fraction:.0%}"
+        if snap and snap["rate"] >= 1:
+            text += f"  {_format_bytes(snap['rate'])}/s"
+            # 剩余 = 下载中文件的剩余字节 + 还没开始的文件按平均大小估计
+            known = [p["total"] for p in files if p["total"]]
+            sizes = snap["completed_bytes"] + sum(known)
+            count = snap["completed_files"] + len(known)
+            if count and not snap["unknown_sizes"]:
+                not_started = max(0, pending - snap["active"])
+                remaining = snap["total_bytes"] - snap["done_bytes"] + not_started * sizes / count
+                text += f"  约 {_format_duration(remaining / snap['rate'])}"
+            self.download_progress.setToolTip(
+                f"下载中 {snap['active']} 个：{_format_bytes(snap['done_bytes'])} / "
+                f"{_format_bytes(snap['total_bytes'])}" + (f"（{snap['unknown_sizes']} 个大小未知）"
+                                                            if snap["unknown_sizes"] else ""))
+        self.download_progress.setFormat(text)
+
+    def on_queue_progress(self, snapshot):
+        self.queue_progress = snapshot
+        self.update_queue_progress()
+
+    def on_queue_item_changed(self, item):
+        if item["state"] in ("done", "failed", "cancelled"):
+            self.queue_finished += 1
+        if item["state"] == "done":
+            self.result_model.mark_owned(item["url"])
+        self.update_queue_progress()
+
+    def on_queue_idle(self, s, f):
+        self.queue_finished = 0
+        self.queue_progress = None
         self.download_progress.setVisible(False)  # 隐藏进度条
         self.status_label.setText("✅ 信号收录完毕，数据同步成功！")
 
@@ -544,28 +1395,71 @@ class MusicApp(QMainWindow):
         msg_box.exec()
 
     def clear_results(self):
-        self.list_widget.clear()
+        self.close_search_pager()
+        self.result_order = []
+        self.btn_load_more.setEnabled(False)
+        self.result_model.clear()
         self.input_search.clear()
         self.hide_player()
         self.update_empty_state()
         self.status_label.setText("🧹 信号已清除，回归寂静。")
 
+    def closeEvent(self, event):
+        # 关闭窗口时停掉网络线程，释放连接池
+        self.close_search_pager()
+        if self.media_player is not None:
+            self.media_player.stop()
+        try:
+            self.network.submit(self.stream_proxy.close()).result(timeout=2)
+        except concurrent.futures.TimeoutError:
+            pass
+        self.network.stop()
+        self.postprocessor.close()
+        self.search_cache.close()
+        PROVIDER_STATS.save()
+        self.library.close()
+        self.download_queue.close()
+        super().closeEvent(event)
+
     # ... (保持原有的播放器控制函数不变: hide_player, play_specific_music, toggle_playback, set_volume 等) ...
+    def ensure_player(self):
+        # 第一次试听时才导入 QtMultimedia、创建播放器；导入失败 (缺少音频后端) 时返回 False
+        if self.media_player is not None: return True
+        started = time.perf_counter()
+        try:
+            from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+        except ImportError as e:
+            print(f"无法加载多媒体模块: {e}")
+            self.status_label.setText("😿 试听功能不可用：缺少多媒体组件")
+            return False
+        self.media_player = QMediaPlayer()
+        self.audio_output = QAudioOutput()
+        self.media_player.setAudioOutput(self.audio_output)
+        self.audio_output.setVolume(self.volume_slider.value() / 100)
+        self.media_player.positionChanged.connect(self.update_position)
+        self.media_player.durationChanged.connect(self.update_duration)
+        METRICS.observe("startup", "multimedia", (time.perf_counter() - started) * 1000)
+        return True
+
     def hide_player(self):
-        self.media_player.stop()
+        if self.media_player is not None:
+            self.media_player.stop()
         self.player_container.setVisible(False)
 
     def play_specific_music(self, url, filename):
-        if not url: return
+        if not url or not self.ensure_player(): return
         self.player_container.setVisible(True)
         self.lbl_now_playing.setText(f"🎶 正在解析音频流: {filename}")
         self.media_player.stop()
-        self.media_player.setSource(QUrl(url))
+        # 代理就绪时经代理播放 (边播边缓存，重播和拖动不再走网络)，否则直接播放远端地址
+        source = self.stream_proxy.register(url) if self.stream_proxy.port else url
+        self.media_player.setSource(QUrl(source))
         self.media_player.play()
         self.btn_play_pause.setText("暂停")
 
     def toggle_playback(self):
-        if self.media_player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+        if self.media_player is None: return
+        if self.media_player.playbackState() == self.media_player.PlaybackState.PlayingState:
             self.media_player.pause()
             self.btn_play_pause.setText("播放")
         else:
@@ -573,11 +1467,17 @@ class MusicApp(QMainWindow):
             self.btn_play_pause.setText("暂停")
 
     def stop_playback(self):
-        self.media_player.stop()
+        if self.media_player is not None:
+            self.media_player.stop()
         self.btn_play_pause.setText("播放")
 
+    def set_bandwidth_limit(self, kb):
+        self.settings.setValue("bandwidth_limit_kb", kb)
+        BANDWIDTH.set_limit(kb * 1024)
+
     def set_volume(self, value):
-        self.audio_output.setVolume(value / 100)
+        if self.audio_output is not None:
+            self.audio_output.setVolume(value / 100)
 
     def update_position(self, pos):
         if not self.progress_slider.isSliderDown():
@@ -588,7 +1488,8 @@ class MusicApp(QMainWindow):
         self.progress_slider.setRange(0, dur)
 
     def set_position(self):
-        self.media_player.setPosition(self.progress_slider.value())
+        if self.media_player is not None:
+            self.media_player.setPosition(self.progress_slider.value())
 
     def update_time_label(self, curr, total):
         cm, cs = divmod(curr // 1000, 60)
@@ -597,19 +1498,22 @@ class MusicApp(QMainWindow):
 
     def toggle_select_all(self):
         self.all_selected = not self.all_selected
-        for i in range(self.list_widget.count()):
-            w = self.list_widget.itemWidget(self.list_widget.item(i))
-            cb = w.findChild(QCheckBox)
-            if cb: cb.setChecked(self.all_selected)
+        self.result_model.set_all_checked(self.all_selected)
 
 
 if __name__ == '__main__':
-    import ctypes
-
-    myappid = 'myteam.musicdownloader.catversion.1.1'  # 更新版本号
-    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+    # 打包成 exe 后，后处理进程池的子进程需要它才能正常启动
+    multiprocessing.freeze_support()
+    if sys.platform == "win32":
+        # 让任务栏使用程序自己的图标 (仅 Windows)
+        import ctypes
+
+        myappid = 'myteam.musicdownloader.catversion.1.1'  # 更新版本号
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
     app = QApplication(sys.argv)
     QApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
+    STARTUP.mark("qapp")
     window = MusicApp()
     window.show()
+    STARTUP.mark("show")
     sys.exit(app.exec())
\ No newline at end of file